@@ -0,0 +1,240 @@
+import contextlib
+import copy
+import importlib.util
+import os
+import random
+
+ELEMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "elements")
+
+# Number of set-index bits of the pl-cache-table cases, 1 through 256 sets
+TABLE_SET_BITS = (0, 2, 4, 6, 8)
+TABLE_SET_BITS_QUICK = (0, 4)
+TABLE_WAYS = 4
+TABLE_BLOCK_BITS = 3
+
+# Extra attributes of the pl-cache-table variants
+TABLE_VARIANTS = {
+    "default": "",
+    "compact": ' compact-partial-scores="true"',
+    "diff": ' submission-view="diff"',
+}
+
+# Number of accesses of the pl-cache-access-table cases
+ACCESS_COUNTS = (16, 256, 4096)
+ACCESS_COUNTS_QUICK = (16, 256)
+
+
+def load_element(name: str):
+    # Imports an element's python file as a module
+    path = os.path.join(ELEMENTS_DIR, name, f"{name}.py")
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def element_dir(name: str):
+    # The elements open their mustache template by a path relative to their own folder
+    cwd = os.getcwd()
+    os.chdir(os.path.join(ELEMENTS_DIR, name))
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def new_data(params: dict, correct_answers: dict) -> dict:
+    return {
+        "params": params,
+        "correct_answers": correct_answers,
+        "submitted_answers": {},
+        "raw_submitted_answers": {},
+        "format_errors": {},
+        "partial_scores": {},
+        "feedback": {},
+        "panel": "question",
+    }
+
+
+def synthetic_cache(num_sets: int, ways: int, block_bits: int, rng) -> list:
+    cache = []
+    for _ in range(num_sets):
+        lru = list(range(ways))
+        rng.shuffle(lru)
+        cache.append(
+            {
+                "tags": [hex(rng.randrange(256)) for _ in range(ways)],
+                "valid": ["1"] * ways,
+                "dirty": [str(rng.randrange(2)) for _ in range(ways)],
+                "lru": [str(way) for way in lru],
+                "blocks": [
+                    [str(rng.randrange(256)) for _ in range(2**block_bits)]
+                    for _ in range(ways)
+                ],
+            }
+        )
+    return cache
+
+
+def synthetic_table_data(num_sets: int, ways: int, block_bits: int, rng) -> tuple:
+    # An initial cache, a final cache where a quarter of the blocks were replaced,
+    # and a submission with a tenth of the cells left at their initial value
+    initial = synthetic_cache(num_sets, ways, block_bits, rng)
+    final = copy.deepcopy(initial)
+    replaced = synthetic_cache(num_sets, ways, block_bits, rng)
+    for i in range(num_sets):
+        for j in range(ways):
+            if rng.random() < 0.25:
+                for field in ("tags", "dirty", "blocks"):
+                    final[i][field][j] = replaced[i][field][j]
+        final[i]["lru"] = replaced[i]["lru"]
+
+    raw = {}
+    for i in range(num_sets):
+        for j in range(ways):
+            source = initial if rng.random() < 0.1 else final
+            raw[f"cache_tag{i}_{j}"] = source[i]["tags"][j]
+            raw[f"cache_valid{i}_{j}"] = source[i]["valid"][j]
+            raw[f"cache_dirty{i}_{j}"] = source[i]["dirty"][j]
+            raw[f"cache_lru{i}_{j}"] = source[i]["lru"][j]
+            for k in range(2**block_bits):
+                raw[f"cache_data{i}_{j}_{k}"] = hex(int(source[i]["blocks"][j][k]))
+    return initial, final, raw
+
+
+def clear_render_cache(element):
+    # Empties the element's cache of rendered panels, if it has one, so that a
+    # render is timed without cache hits
+    render_cache = getattr(element, "RENDER_CACHE", None)
+    if render_cache is not None:
+        render_cache.clear()
+
+
+def bench_render_cached(
+    results, element, group: str, name: str, params: dict, html, data
+):
+    # Times a render whose output the element may cache: once as repeated opens of
+    # the same panel (cache hits after the warmup call), and once from an empty cache
+    render = lambda: element.render(html, data)
+    results.time(group, name, params, render)
+    results.time(
+        group,
+        f"{name}_uncached",
+        params,
+        render,
+        setup=lambda: clear_render_cache(element),
+    )
+
+
+def bench_element_phases(results, element, group: str, params: dict, html, data):
+    # Runs the phases of one question submission in order, timing each of them on
+    # the data left by the phases before it
+    phases = [
+        ("prepare", lambda: element.prepare(html, data)),
+        ("render_question", lambda: element.render(html, data)),
+        ("parse", lambda: element.parse(html, data)),
+        ("grade", lambda: element.grade(html, data)),
+        ("render_submission", lambda: element.render(html, data)),
+    ]
+    for name, func in phases:
+        data["panel"] = name.removeprefix("render_")
+        results.time(group, name, params, func)
+    data["panel"] = "answer"
+    bench_render_cached(results, element, group, "render_answer", params, html, data)
+
+
+def bench_cache_table(results, quick: bool) -> None:
+    element = load_element("pl-cache-table")
+    for set_bits in TABLE_SET_BITS_QUICK if quick else TABLE_SET_BITS:
+        num_sets = 2**set_bits
+        initial, final, raw = synthetic_table_data(
+            num_sets, TABLE_WAYS, TABLE_BLOCK_BITS, random.Random(set_bits)
+        )
+        for variant, attribs in TABLE_VARIANTS.items():
+            params = {
+                "sets": num_sets,
+                "ways": TABLE_WAYS,
+                "block_bits": TABLE_BLOCK_BITS,
+                "variant": variant,
+            }
+            html = (
+                f'<pl-cache-table answers-name="cache" set-bits="{set_bits}"'
+                f' num-ways="{TABLE_WAYS}" block-bits="{TABLE_BLOCK_BITS}"'
+                f' show-valid="true" show-dirty="true" grade-mode="cells"{attribs}>'
+                "</pl-cache-table>"
+            )
+            data = new_data(
+                {"cache": copy.deepcopy(initial)}, {"cache": copy.deepcopy(final)}
+            )
+            data["raw_submitted_answers"] = dict(raw)
+            with element_dir("pl-cache-table"):
+                bench_element_phases(
+                    results, element, "pl-cache-table", params, html, data
+                )
+
+        # read-only tables are rendered from the initial cache on every panel
+        params = {
+            "sets": num_sets,
+            "ways": TABLE_WAYS,
+            "block_bits": TABLE_BLOCK_BITS,
+            "variant": "read_only",
+        }
+        html = (
+            f'<pl-cache-table answers-name="cache" set-bits="{set_bits}"'
+            f' num-ways="{TABLE_WAYS}" block-bits="{TABLE_BLOCK_BITS}"'
+            ' show-valid="true" show-dirty="true" read-only="true">'
+            "</pl-cache-table>"
+        )
+        data = new_data(
+            {"cache": copy.deepcopy(initial)}, {"cache": copy.deepcopy(final)}
+        )
+        with element_dir("pl-cache-table"):
+            bench_render_cached(
+                results,
+                element,
+                "pl-cache-table",
+                "render_read_only",
+                params,
+                html,
+                data,
+            )
+
+
+def bench_cache_access_table(results, quick: bool) -> None:
+    element = load_element("pl-cache-access-table")
+    for count in ACCESS_COUNTS_QUICK if quick else ACCESS_COUNTS:
+        rng = random.Random(count)
+        accesses = [
+            {
+                "address": f"{rng.randrange(2**16):#06x}",
+                "hit": rng.random() < 0.5,
+                "store": rng.random() < 0.25,
+                "fill_bytes": 8,
+                "writeback_bytes": 0,
+                "write_through_bytes": 0,
+            }
+            for _ in range(count)
+        ]
+        html = (
+            '<pl-cache-access-table answers-name="cache_access" grade-mode="all">'
+            "</pl-cache-access-table>"
+        )
+        data = new_data({}, {"cache_access": accesses})
+        data["raw_submitted_answers"] = {
+            f"cache_access{i}_hit": rng.choice(["Hit", "Miss"]) for i in range(count)
+        }
+        with element_dir("pl-cache-access-table"):
+            bench_element_phases(
+                results,
+                element,
+                "pl-cache-access-table",
+                {"accesses": count},
+                html,
+                data,
+            )
+
+
+def run(results, quick: bool) -> None:
+    bench_cache_table(results, quick)
+    bench_cache_access_table(results, quick)
@@ -0,0 +1,83 @@
+import itertools
+import random
+
+import cache_tables
+
+# (addr_bits, set_bits, ways, block_bits, num_addr) grid of generate_cache cases
+GENERATE_GRID = {
+    "addr_bits": (8, 12, 16),
+    "set_bits": (0, 2, 4),
+    "ways": (1, 2, 4),
+    "block_bits": (1, 2, 3),
+    "num_addr": (4, 16),
+}
+GENERATE_GRID_QUICK = {
+    "addr_bits": (8, 16),
+    "set_bits": (0, 2),
+    "ways": (1, 4),
+    "block_bits": (1, 3),
+    "num_addr": (4, 16),
+}
+
+# Trace lengths simulated by access_cache
+TRACE_LENGTHS = (1000, 10000)
+TRACE_LENGTHS_QUICK = (1000,)
+
+
+def bench_generate_cache(results, quick: bool) -> None:
+    grid = GENERATE_GRID_QUICK if quick else GENERATE_GRID
+    for values in itertools.product(*grid.values()):
+        params = dict(zip(grid, values))
+        addr_bits = params["addr_bits"]
+        cache_size = params["ways"] * 2 ** (params["set_bits"] + params["block_bits"])
+        if addr_bits <= params["set_bits"] + params["block_bits"]:
+            continue
+        if cache_size > 2**addr_bits:
+            continue
+        # the full memory table of a large memory dwarfs the simulation itself
+        params["mem_table"] = "full" if addr_bits <= 12 else "touched"
+
+        def generate(params=params):
+            data = {"params": {}, "correct_answers": {}}
+            cache_tables.generate_cache(data, "cache", seed=0, **params)
+
+        results.time("generator", "generate_cache", params, generate)
+
+
+def bench_access_cache(results, quick: bool) -> None:
+    for length in TRACE_LENGTHS_QUICK if quick else TRACE_LENGTHS:
+        params = {
+            "addr_bits": 16,
+            "set_bits": 4,
+            "ways": 4,
+            "block_bits": 3,
+            "length": length,
+        }
+        rng = random.Random(0)
+        sim = cache_tables.CacheSimulator(
+            cache_tables.LazyMemory(params["addr_bits"], seed=0),
+            ways=params["ways"],
+            set_bits=params["set_bits"],
+            block_bits=params["block_bits"],
+            addr_bits=params["addr_bits"],
+            rng=rng,
+        )
+        sim.fill()
+        state = sim.snapshot()
+        # a working set a few times the size of the cache, so both hits and misses occur
+        working_set = 4 * params["ways"] * 2 ** (params["set_bits"] + params["block_bits"])
+        address_list = [rng.randrange(working_set) for _ in range(length)]
+        ops = ["W" if rng.random() < 0.25 else "R" for _ in range(length)]
+
+        def access(address_list=address_list, ops=ops):
+            data = {"params": {}, "correct_answers": {}}
+            cache_tables.access_cache(data, "cache", sim, address_list, "hex", ops)
+
+        results.time(
+            "generator", "access_cache", params, access, setup=lambda: sim.restore(state)
+        )
+
+
+def run(results, quick: bool) -> None:
+    bench_generate_cache(results, quick)
+    bench_access_cache(results, quick)
@@ -0,0 +1,73 @@
+import math
+import statistics
+import time
+
+
+class Results:
+    # Timings of all benchmark cases, in the order they ran
+    def __init__(self, repeat: int, min_time: float) -> None:
+        self.repeat = repeat
+        self.min_time = min_time
+        self.cases: list[dict] = []
+
+    def time(self, group: str, name: str, params: dict, func, setup=None) -> dict:
+        # Times func() (after setup(), if given, outside of the timing) and records
+        # the per-call time. A case that raises is recorded with its error.
+        case = {"group": group, "name": name, "params": params}
+        try:
+            case.update(measure(func, setup, self.repeat, self.min_time))
+        except Exception as error:
+            case["error"] = f"{type(error).__name__}: {error}"
+        self.cases.append(case)
+        return case
+
+
+def measure(func, setup=None, repeat: int = 3, min_time: float = 0.02) -> dict:
+    # Calls func enough times per round for a round to take about min_time, and
+    # returns the per-call times over repeat rounds
+    def run(number: int) -> float:
+        total = 0.0
+        for _ in range(number):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            total += time.perf_counter() - start
+        return total
+
+    first = run(1)  # also warms up caches that persist between calls
+    number = max(1, min(10000, math.ceil(min_time / max(first, 1e-9))))
+    times = [run(number) / number for _ in range(repeat)]
+    return {
+        "number": number,
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+    }
+
+
+def case_key(case: dict) -> tuple:
+    return (case["group"], case["name"], tuple(sorted(case["params"].items())))
+
+
+def compare(baseline: list[dict], current: list[dict], threshold: float) -> list[dict]:
+    # Cases of current that are more than threshold times slower than in baseline
+    baseline_min = {case_key(case): case["min"] for case in baseline if "min" in case}
+    regressions = []
+    for case in current:
+        before = baseline_min.get(case_key(case))
+        if before is None or "min" not in case:
+            continue
+        ratio = case["min"] / before
+        if ratio > threshold:
+            regressions.append(dict(case, baseline=before, ratio=ratio))
+    return regressions
+
+
+def format_case(case: dict) -> str:
+    params = ", ".join(f"{key}={value}" for key, value in case["params"].items())
+    label = f"{case['group']}/{case['name']}({params})"
+    if "error" in case:
+        return f"{label:<90} {case['error']}"
+    return f"{label:<90} {case['min'] * 1e3:10.3f} ms"
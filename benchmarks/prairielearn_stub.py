@@ -0,0 +1,45 @@
+# Minimal stand-in for the prairielearn module, with just the functions the cache
+# elements call, so the element benchmarks run without a PrairieLearn install.
+# run.py only installs it when the real module cannot be imported.
+import uuid
+
+QuestionData = dict
+ElementTestData = dict
+
+
+def check_attribs(element, required_attribs, optional_attribs):
+    for name in required_attribs:
+        if name not in element.attrib:
+            raise ValueError(f'Required attribute "{name}" missing')
+    extra_attribs = set(element.attrib) - set(required_attribs) - set(optional_attribs)
+    if extra_attribs:
+        raise ValueError(f"Unknown attributes: {', '.join(sorted(extra_attribs))}")
+
+
+def check_answers_names(data, name):
+    return
+
+
+def get_string_attrib(element, name, *args):
+    if name in element.attrib:
+        return element.attrib[name]
+    if args:
+        return args[0]
+    raise ValueError(f'Attribute "{name}" missing and no default is available')
+
+
+def get_boolean_attrib(element, name, *args):
+    if name not in element.attrib:
+        if args:
+            return args[0]
+        raise ValueError(f'Attribute "{name}" missing and no default is available')
+    value = element.attrib[name].lower()
+    if value in ("true", "t", "1", "yes", "y"):
+        return True
+    if value in ("false", "f", "0", "no", "n"):
+        return False
+    raise ValueError(f'Attribute "{name}" must be a boolean value: {value}')
+
+
+def get_uuid():
+    return str(uuid.uuid4())
@@ -0,0 +1,119 @@
+"""Times the cache generator and the two elements, and writes the results as JSON.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --quick --compare results.json
+
+With --compare, the cases that got slower than the baseline by more than
+--threshold are listed and the exit status is 1.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+sys.path.insert(0, os.path.join(REPO_DIR, "serverFilesCourse"))
+
+try:
+    import prairielearn  # noqa: F401
+
+    PRAIRIELEARN = "installed"
+except ImportError:
+    import prairielearn_stub
+
+    sys.modules["prairielearn"] = prairielearn_stub
+    PRAIRIELEARN = "stub"
+
+import numpy as np
+
+import bench_elements
+import bench_generator
+from harness import Results, compare, format_case
+
+GROUPS = {
+    "generator": bench_generator.run,
+    "elements": bench_elements.run,
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="run a smaller grid")
+    parser.add_argument(
+        "--group",
+        action="append",
+        choices=sorted(GROUPS),
+        help="only run this group (can be repeated)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timing rounds per case")
+    parser.add_argument(
+        "--min-time", type=float, default=0.02, help="seconds per timing round"
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown ratio reported as a regression by --compare",
+    )
+    args = parser.parse_args()
+
+    results = Results(args.repeat, args.min_time)
+    for group in args.group or GROUPS:
+        GROUPS[group](results, args.quick)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "prairielearn": PRAIRIELEARN,
+            "quick": args.quick,
+            "repeat": args.repeat,
+            "min_time": args.min_time,
+        },
+        "results": results.cases,
+    }
+    for case in results.cases:
+        print(format_case(case), file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results.cases, args.threshold)
+        for case in regressions:
+            print(f"REGRESSION {case['ratio']:.2f}x {format_case(case)}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
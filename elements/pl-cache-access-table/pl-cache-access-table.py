@@ -1,3 +1,6 @@
+import dataclasses
+import functools
+
 import chevron
 import lxml.html
 import prairielearn as pl
@@ -11,8 +14,48 @@ WEIGHT_DEFAULT = "1"
 
 CACHE_ACCESS_TABLE_MUSTACHE_TEMPLATE_NAME = "pl-cache-access-table.mustache"
 
+# Number of distinct element tags whose parsed configuration is kept per process
+ELEMENT_CONFIG_CACHE_SIZE = 256
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
+TRAFFIC_LABELS = [
+    ("fill_bytes", "Fill"),
+    ("writeback_bytes", "Writeback"),
+    ("write_through_bytes", "Write-through"),
+]
+
+
+@functools.cache
+def load_template() -> list:
+    # Read and tokenize the template once per process. chevron.render accepts the
+    # token list in place of the template text, so every render and panel reuses it.
+    with open(CACHE_ACCESS_TABLE_MUSTACHE_TEMPLATE_NAME, "r", encoding="utf-8") as f:
+        return list(chevron.tokenizer.tokenize(f.read()))
+
+
+@functools.cache
+def render_info() -> str:
+    # The info block does not depend on the element or the question data
+    info_params = {
+        "format": True,
+        "grading_text": "PLACEHOLDER",
+    }
+    return chevron.render(load_template(), info_params)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class AccessTableConfig:
+    # Attributes of one pl-cache-access-table element, shared by every phase of
+    # every request for the same element
+    name: str
+    show_partial_score: bool
+    show_percentage_score: bool
+    empty_cache: bool
+    grade_mode: str
+    weight: int
+
+
+@functools.lru_cache(maxsize=ELEMENT_CONFIG_CACHE_SIZE)
+def _element_config(element_html: str) -> AccessTableConfig:
     element = lxml.html.fragment_fromstring(element_html)
     required_attribs = ["answers-name"]
     optional_attribs = [
@@ -24,7 +67,24 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
     ]
     pl.check_attribs(element, required_attribs, optional_attribs)
 
-    name = pl.get_string_attrib(element, "answers-name")
+    return AccessTableConfig(
+        name=pl.get_string_attrib(element, "answers-name"),
+        show_partial_score=pl.get_boolean_attrib(
+            element, "show-partial-score", SHOW_PARTIAL_SCORE_DEFAULT
+        ),
+        show_percentage_score=pl.get_boolean_attrib(
+            element, "show-percentage-score", SHOW_PERCENTAGE_SCORE_DEFAULT
+        ),
+        empty_cache=pl.get_boolean_attrib(element, "empty-cache", EMPTY_CACHE_DEFAULT),
+        grade_mode=pl.get_string_attrib(element, "grade-mode", GRADE_MODE_DEFAULT),
+        weight=int(pl.get_string_attrib(element, "weight", WEIGHT_DEFAULT)),
+    )
+
+
+def prepare(element_html: str, data: pl.QuestionData) -> None:
+    config = _element_config(element_html)
+
+    name = config.name
     pl.check_answers_names(data, name)
 
     if name not in data.get("correct_answers", {}):
@@ -46,23 +106,13 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
 
 def render(element_html: str, data: pl.QuestionData) -> str:
 
-    element = lxml.html.fragment_fromstring(element_html)
-    name = pl.get_string_attrib(element, "answers-name")
-    # Get the output name
-
-    show_partial_score = pl.get_boolean_attrib(
-        element, "show-partial-score", SHOW_PARTIAL_SCORE_DEFAULT
-    )  # Default to False if not specified
+    config = _element_config(element_html)
+    name = config.name
 
-    show_percentage_score = pl.get_boolean_attrib(
-        element, "show-percentage-score", SHOW_PERCENTAGE_SCORE_DEFAULT
-    )  # Default to False if not specified
-
-    empty_cache = pl.get_boolean_attrib(
-        element, "empty-cache", EMPTY_CACHE_DEFAULT
-    )  # Default to False if not specified
-
-    grade_mode = pl.get_string_attrib(element, "grade-mode", GRADE_MODE_DEFAULT)
+    show_partial_score = config.show_partial_score
+    show_percentage_score = config.show_percentage_score
+    empty_cache = config.empty_cache
+    grade_mode = config.grade_mode
 
     if (
         grade_mode != "through-first"
@@ -98,9 +148,17 @@ def render(element_html: str, data: pl.QuestionData) -> str:
         if i == 0 and empty_cache:
             first_miss = True
 
+        traffic = []
+        for key, label in TRAFFIC_LABELS:
+            if accesses[i].get(key):
+                traffic.append(f"{label} {accesses[i][key]} B")
+
         access = {
             "address": accesses[i]["address"],
             "hit": accesses[i]["hit"],
+            "store": accesses[i].get("store", False),
+            "value": accesses[i].get("value"),
+            "traffic": ", ".join(traffic) or "None",
             "index": i,
             "sub_hit": sub_hit,
             "sub_miss": sub_miss,
@@ -150,16 +208,9 @@ def render(element_html: str, data: pl.QuestionData) -> str:
     if not show_percentage_score:
         grade_info += "<br>Total percentage score for this table will not be shown"
 
-    # Get template
-    with open(CACHE_ACCESS_TABLE_MUSTACHE_TEMPLATE_NAME, "r", encoding="utf-8") as f:
-        template = f.read()
+    template = load_template()
     if data["panel"] == "question":
-        grading_text = "PLACEHOLDER"
-        info_params = {
-            "format": True,
-            "grading_text": grading_text,
-        }
-        info = chevron.render(template, info_params)
+        info = render_info()
         html_params = {
             "question": True,
             "name": name,
@@ -200,18 +251,16 @@ def render(element_html: str, data: pl.QuestionData) -> str:
             "uuid": pl.get_uuid(),
             "accesses": access_data,
             "score": score,
+            "show_traffic": any("fill_bytes" in access for access in accesses),
         }
         return chevron.render(template, html_params)
 
 
 def parse(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
-
-    name = pl.get_string_attrib(element, "answers-name")
+    config = _element_config(element_html)
 
-    empty_cache = pl.get_boolean_attrib(
-        element, "empty-cache", EMPTY_CACHE_DEFAULT
-    )  # Default to False if not specified
+    name = config.name
+    empty_cache = config.empty_cache
 
     accesses = data["correct_answers"][name]
 
@@ -227,16 +276,12 @@ def parse(element_html: str, data: pl.QuestionData) -> None:
 
 
 def grade(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
-
-    name = pl.get_string_attrib(element, "answers-name")
-
-    grade_mode = pl.get_string_attrib(element, "grade-mode", GRADE_MODE_DEFAULT)
-    weight = int(pl.get_string_attrib(element, "weight", WEIGHT_DEFAULT))
+    config = _element_config(element_html)
 
-    empty_cache = pl.get_boolean_attrib(
-        element, "empty-cache", EMPTY_CACHE_DEFAULT
-    )  # Default to False if not specified
+    name = config.name
+    grade_mode = config.grade_mode
+    weight = config.weight
+    empty_cache = config.empty_cache
 
     accesses = data["correct_answers"][name]
 
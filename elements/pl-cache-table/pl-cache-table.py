@@ -1,5 +1,15 @@
+import base64
+import collections
+import dataclasses
+import functools
+import hashlib
+import json
+import re
+from typing import NamedTuple
+
 import chevron
 import lxml.html
+import numpy as np
 import prairielearn as pl
 
 CORRECT_ANSWER_DEFAULT = None
@@ -14,50 +24,145 @@ SHOW_VALID_DEFAULT = False
 SHOW_DIRTY_DEFAULT = False
 TAG_WIDTH_DEFAULT = 40
 WEIGHT_DEFAULT = "1"
+REPLACEMENT_POLICY_DEFAULT = "lru"
+COMPACT_PARTIAL_SCORES_DEFAULT = False
+SUBMISSION_VIEW_DEFAULT = "full"
+
+# Header of the replacement-state column for each replacement policy.
+# The random policy has no state, so no column is shown.
+REPLACEMENT_POLICY_LABELS = {
+    "lru": "LRU FSM",
+    "fifo": "FIFO Order",
+    "plru": "PLRU Bits",
+    "lfu": "LFU Counts",
+    "random": None,
+}
+
+# Submitted-answer name of each per-way field of a cache configuration
+CELL_FIELD_NAMES = {"tags": "tag", "valid": "valid", "dirty": "dirty"}
+
+
+class ParseRule(NamedTuple):
+    # How parse() cleans and validates the submitted value of one kind of cell
+    strip_prefix: bool  # remove "0x" from the value
+    pattern: re.Pattern
+    empty_error: str
+    invalid_error: str
+
+
+HEX_PATTERN = re.compile("[0-9a-f]*")
+BIT_PATTERN = re.compile("[01]*")
+
+# Parse rule for each field of a cache configuration
+PARSE_RULES = {
+    "tags": ParseRule(
+        True,
+        HEX_PATTERN,
+        "Tag cannot be empty if it starts with a value. Initial value has been re-entered",
+        'Tag must not have characters besides 0-9, a-f, and "0x".',
+    ),
+    "valid": ParseRule(
+        False,
+        BIT_PATTERN,
+        "Valid bit cannot be empty if it starts with a value. Initial value has been re-entered",
+        "Valid must be 0 or 1.",
+    ),
+    "dirty": ParseRule(
+        False,
+        BIT_PATTERN,
+        "Valid bit cannot be empty if it starts with a value. Initial value has been re-entered",
+        "Valid must be 0 or 1.",
+    ),
+    "blocks": ParseRule(
+        True,
+        HEX_PATTERN,
+        "Data cannot be empty if it starts with a value. Initial value has been re-entered",
+        'Data must not have characters besides 0-9, a-f, and "0x".',
+    ),
+    "lru": ParseRule(
+        False,
+        HEX_PATTERN,
+        "Valid bit cannot be empty if it starts with a value. Initial value has been re-entered",
+        "LRU must not have characters besides 0-9.",
+    ),
+}
 
 CACHE_TABLE_MUSTACHE_TEMPLATE_NAME = "pl-cache-table.mustache"
 
+# Limits of the per-process cache of rendered read-only tables and answer panels
+RENDER_CACHE_MAX_ENTRIES = 512
+RENDER_CACHE_MAX_BYTES = 32 * 2**20
 
-def prepare(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
-    required_attribs = ["answers-name", "set-bits", "num-ways"]
-    optional_attribs = [
-        "block-bits",
-        "show-valid",
-        "show-data",
-        "show-dirty",
-        "grade-mode",
-        "display-base",
-        "tag-width",
-        "show-partial-score",
-        "show-percentage-score",
-        "read-only",
-        "is-material",
-        "weight",
-    ]
-    pl.check_attribs(element, required_attribs, optional_attribs)
+# Number of variants whose canonical cells are kept per process
+CANONICAL_CACHE_MAX_ENTRIES = 1024
 
-    name = pl.get_string_attrib(element, "answers-name")
-    pl.check_answers_names(data, name)
+# Number of distinct element tags whose parsed configuration is kept per process
+ELEMENT_CONFIG_CACHE_SIZE = 256
 
-    # Determine number of sets in cache
-    set_bits = int(pl.get_string_attrib(element, "set-bits"))
-    if set_bits < 0:
-        raise ValueError("The number of bits for the set index must be 0 or greater.")
 
-    num_sets = 2**set_bits
+@functools.cache
+def load_template() -> list:
+    # Read and tokenize the template once per process. chevron.render accepts the
+    # token list in place of the template text, so every render and panel reuses it.
+    with open(CACHE_TABLE_MUSTACHE_TEMPLATE_NAME, "r", encoding="utf-8") as f:
+        return list(chevron.tokenizer.tokenize(f.read()))
 
-    num_ways = int(pl.get_string_attrib(element, "num-ways"))
-    if num_ways <= 0:
-        raise ValueError("The number of ways for the cache must be 1 or greater.")
 
-    block_bits = int(pl.get_string_attrib(element, "block-bits", BLOCK_BITS_DEFAULT))
-    show_valid = pl.get_boolean_attrib(element, "show-valid", SHOW_VALID_DEFAULT)
-    show_data = pl.get_boolean_attrib(element, "show-data", SHOW_DATA_DEFAULT)
-    display_base = pl.get_string_attrib(element, "display-base", DISPLAY_BASE_DEFAULT)
+@functools.cache
+def render_info() -> str:
+    # The info block does not depend on the element or the question data
+    info_params = {
+        "format": True,
+        "grading_text": "PLACEHOLDER",
+    }
+    return chevron.render(load_template(), info_params)
 
-    if display_base != "hex" and display_base != "bin":
-        raise ValueError('base must be "hex" or "bin"')
+
+class RenderCache:
+    # LRU cache of rendered HTML, bounded by number of entries and total size
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: collections.OrderedDict[str, str] = collections.OrderedDict()
+        self.size = 0
+
+    def get(self, key: str) -> str | None:
+        html = self.entries.get(key)
+        if html is not None:
+            self.entries.move_to_end(key)
+        return html
+
+    def put(self, key: str, html: str) -> None:
+        if len(html) > self.max_bytes:
+            return
+        old_html = self.entries.pop(key, None)
+        if old_html is not None:
+            self.size -= len(old_html)
+        self.entries[key] = html
+        self.size += len(html)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self.size -= len(self.entries.popitem(last=False)[1])
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+
+RENDER_CACHE = RenderCache(RENDER_CACHE_MAX_ENTRIES, RENDER_CACHE_MAX_BYTES)
+
+
+def prepare(element_html: str, data: pl.QuestionData) -> None:
+    config = _element_config(element_html)
+
+    name = config.name
+    pl.check_answers_names(data, name)
+
+    num_sets = config.num_sets
+    num_ways = config.num_ways
+    block_bits = config.block_bits
+    show_valid = config.show_valid
+    show_data = config.show_data
+    state_width = config.state_width
 
     if name not in data.get("params", {}):
         raise ValueError(
@@ -112,72 +217,190 @@ def prepare(element_html: str, data: pl.QuestionData) -> None:
                             'Data for index {i} and way {j} and offset {k} must not have characters besides 0-9, a-f, and "0x".'
                         )
 
-            if num_ways > 1:
-                try:
-                    lru = final_cache[i]["lru"][j]
-                except (KeyError, IndexError):
-                    raise AttributeError(f"LRU value missing for index {i}.")
+        for j in range(state_width):
+            try:
+                lru = final_cache[i]["lru"][j]
+            except (KeyError, IndexError):
+                raise AttributeError(f"LRU value missing for index {i}.")
 
-                clean_lru = lru.replace(" ", "").lower()
-                if not all(char in allowed_characters for char in clean_lru):
-                    raise ValueError(
-                        "LRU for index {i} must not have characters besides 0-9."
-                    )
+            clean_lru = lru.replace(" ", "").lower()
+            if not all(char in allowed_characters for char in clean_lru):
+                raise ValueError(
+                    "LRU for index {i} must not have characters besides 0-9."
+                )
 
 
-def _is_read_only(element) -> bool:
-    return pl.get_boolean_attrib(
-        element,
-        "read-only",
-        pl.get_boolean_attrib(element, "is-material", IS_MATERIAL_DEFAULT),
+def _replacement_state_width(replacement_policy: str, num_ways: int) -> int:
+    # number of entries shown in the replacement-state column of each set
+    if num_ways <= 1 or REPLACEMENT_POLICY_LABELS[replacement_policy] is None:
+        return 0
+    if replacement_policy == "plru":
+        return num_ways - 1
+    return num_ways
+
+
+class CellLayout(NamedTuple):
+    # Flat order of the gradable cells of a cache table: set by set and way by
+    # way, the tag, valid, dirty and data cells of the way, then the set's
+    # replacement-state cell of the same number. parse() fills format_errors and
+    # submitted_answers in this order
+    keys: list[str]  # submitted-answer name of every cell
+    paths: list[tuple]  # (field, set, way, offset) of every cell in a configuration
+    cell_blocks: np.ndarray  # block id of every cell, see block_keys
+    block_keys: list[str]  # partial-score name of every block, all ways then all LRUs
+    rules: list[ParseRule]  # parse rule of every cell
+    key_blocks: dict[str, int]  # block id of every cell, by submitted-answer name
+
+
+@functools.cache
+def _cell_layout(
+    name: str,
+    num_sets: int,
+    num_ways: int,
+    block_bits: int,
+    show_valid: bool,
+    show_dirty: bool,
+    show_data: bool,
+    state_width: int,
+) -> CellLayout:
+    keys = []
+    paths = []
+    cell_blocks = []
+    for i in range(num_sets):
+        for j in range(num_ways):
+            block = i * num_ways + j
+            fields = ["tags"]
+            if show_valid:
+                fields.append("valid")
+            if show_dirty:
+                fields.append("dirty")
+            for field in fields:
+                keys.append(f"{name}_{CELL_FIELD_NAMES[field]}{i}_{j}")
+                paths.append((field, i, j, None))
+                cell_blocks.append(block)
+            if show_data:
+                for k in range(2**block_bits):
+                    keys.append(f"{name}_data{i}_{j}_{k}")
+                    paths.append(("blocks", i, j, k))
+                    cell_blocks.append(block)
+            # the replacement-state cells belong to the set, but are listed
+            # with the way of the same number
+            if j < state_width:
+                keys.append(f"{name}_lru{i}_{j}")
+                paths.append(("lru", i, j, None))
+                cell_blocks.append(num_sets * num_ways + i)
+
+    block_keys = [
+        f"{name}_block{i}_{j}" for i in range(num_sets) for j in range(num_ways)
+    ]
+    block_keys += [f"{name}_lru_block{i}" for i in range(num_sets)]
+    rules = [PARSE_RULES[field] for field, *_ in paths]
+    key_blocks = dict(zip(keys, cell_blocks))
+    return CellLayout(
+        keys, paths, np.array(cell_blocks, dtype=int), block_keys, rules, key_blocks
     )
 
 
-def render(element_html: str, data: pl.QuestionData) -> str:
-
+@dataclasses.dataclass(frozen=True, slots=True)
+class CacheTableConfig:
+    # Attributes of one pl-cache-table element, and the table structure derived
+    # from them, shared by every phase of every request for the same element
+    name: str
+    set_bits: int
+    num_sets: int
+    num_ways: int
+    block_bits: int
+    show_valid: bool
+    show_dirty: bool
+    show_data: bool
+    grade_mode: str
+    display_base: str
+    tag_width: int
+    show_partial_score: bool
+    show_percentage_score: bool
+    read_only: bool
+    weight: int
+    replacement_policy: str
+    state_width: int
+    compact_partial_scores: bool
+    submission_view: str
+    way_list: list  # table header of the ways
+    block_list: list | None  # table header of the offsets in a block
+    way_display_width: int  # number of columns spanned by each way
+    num_columns: int  # number of columns of the whole table
+    layout: CellLayout
+
+
+@functools.lru_cache(maxsize=ELEMENT_CONFIG_CACHE_SIZE)
+def _element_config(element_html: str) -> CacheTableConfig:
     element = lxml.html.fragment_fromstring(element_html)
-    name = pl.get_string_attrib(element, "answers-name")
-    # Get the output name
-
-    show_partial_score = pl.get_boolean_attrib(
-        element, "show-partial-score", SHOW_PARTIAL_SCORE_DEFAULT
-    )  # Default to False if not specified
+    required_attribs = ["answers-name", "set-bits", "num-ways"]
+    optional_attribs = [
+        "block-bits",
+        "show-valid",
+        "show-data",
+        "show-dirty",
+        "grade-mode",
+        "display-base",
+        "tag-width",
+        "show-partial-score",
+        "show-percentage-score",
+        "read-only",
+        "is-material",
+        "weight",
+        "replacement-policy",
+        "compact-partial-scores",
+        "submission-view",
+    ]
+    pl.check_attribs(element, required_attribs, optional_attribs)
 
-    show_percentage_score = pl.get_boolean_attrib(
-        element, "show-percentage-score", SHOW_PERCENTAGE_SCORE_DEFAULT
-    )  # Default to False if not specified
+    name = pl.get_string_attrib(element, "answers-name")
 
-    # get number of sets
+    # Determine number of sets in cache
     set_bits = int(pl.get_string_attrib(element, "set-bits"))
-    num_sets = 2**set_bits
+    if set_bits < 0:
+        raise ValueError("The number of bits for the set index must be 0 or greater.")
 
-    block_bits = int(pl.get_string_attrib(element, "block-bits"))
+    num_sets = 2**set_bits
 
     num_ways = int(pl.get_string_attrib(element, "num-ways"))
+    if num_ways <= 0:
+        raise ValueError("The number of ways for the cache must be 1 or greater.")
 
-    fully_assoc = False
-    if set_bits == 0:
-        fully_assoc = True
+    block_bits = int(pl.get_string_attrib(element, "block-bits", BLOCK_BITS_DEFAULT))
+    show_valid = pl.get_boolean_attrib(element, "show-valid", SHOW_VALID_DEFAULT)
+    show_dirty = pl.get_boolean_attrib(element, "show-dirty", SHOW_DIRTY_DEFAULT)
+    show_data = pl.get_boolean_attrib(element, "show-data", SHOW_DATA_DEFAULT)
+    display_base = pl.get_string_attrib(element, "display-base", DISPLAY_BASE_DEFAULT)
 
-    grade_mode = pl.get_string_attrib(element, "grade-mode", GRADE_MODE_DEFAULT)
+    if display_base != "hex" and display_base != "bin":
+        raise ValueError('base must be "hex" or "bin"')
 
-    # create a list of ways to render table header. A bit hacky
-    way_list = []
-    for i in range(num_ways):
-        way_list.append({"number": i})
+    replacement_policy = pl.get_string_attrib(
+        element, "replacement-policy", REPLACEMENT_POLICY_DEFAULT
+    )
+    if replacement_policy not in REPLACEMENT_POLICY_LABELS:
+        raise ValueError(
+            'replacement-policy must be "lru", "fifo", "plru", "lfu", or "random"'
+        )
+    if replacement_policy == "plru" and num_ways & (num_ways - 1) != 0:
+        raise ValueError("replacement-policy plru needs a power of 2 number of ways.")
+    state_width = _replacement_state_width(replacement_policy, num_ways)
+
+    submission_view = pl.get_string_attrib(
+        element, "submission-view", SUBMISSION_VIEW_DEFAULT
+    )
+    if submission_view != "full" and submission_view != "diff":
+        raise ValueError('submission-view must be "full" or "diff"')
 
-    is_material = _is_read_only(element)
-    show_data = pl.get_boolean_attrib(element, "show-data", SHOW_DATA_DEFAULT)
-    show_dirty = pl.get_boolean_attrib(element, "show-dirty", SHOW_DIRTY_DEFAULT)
-    show_valid = pl.get_boolean_attrib(element, "show-valid", SHOW_VALID_DEFAULT)
-    display_base = pl.get_string_attrib(element, "display-base", DISPLAY_BASE_DEFAULT)
-    display_base = display_base.lower()
     tag_width = int(pl.get_string_attrib(element, "tag-width", TAG_WIDTH_DEFAULT))
     if tag_width == TAG_WIDTH_DEFAULT and display_base == "hex":
         tag_width = 60
 
-    initial_cache = data["params"][name]
-    final_cache = data["correct_answers"][name]
+    # create a list of ways to render table header. A bit hacky
+    way_list = []
+    for i in range(num_ways):
+        way_list.append({"number": i})
 
     # create a list of offsets to render table header
     if show_data:
@@ -202,10 +425,290 @@ def render(element_html: str, data: pl.QuestionData) -> str:
     if show_dirty:
         way_display_width += 1  # increase column by 1 to include dirty
 
+    num_columns = num_ways * way_display_width
+    if set_bits > 0:
+        num_columns += 1  # set index
+    if state_width > 0:
+        num_columns += 1  # replacement state
+
+    return CacheTableConfig(
+        name=name,
+        set_bits=set_bits,
+        num_sets=num_sets,
+        num_ways=num_ways,
+        block_bits=block_bits,
+        show_valid=show_valid,
+        show_dirty=show_dirty,
+        show_data=show_data,
+        grade_mode=pl.get_string_attrib(element, "grade-mode", GRADE_MODE_DEFAULT),
+        display_base=display_base,
+        tag_width=tag_width,
+        show_partial_score=pl.get_boolean_attrib(
+            element, "show-partial-score", SHOW_PARTIAL_SCORE_DEFAULT
+        ),
+        show_percentage_score=pl.get_boolean_attrib(
+            element, "show-percentage-score", SHOW_PERCENTAGE_SCORE_DEFAULT
+        ),
+        read_only=pl.get_boolean_attrib(
+            element,
+            "read-only",
+            pl.get_boolean_attrib(element, "is-material", IS_MATERIAL_DEFAULT),
+        ),
+        weight=int(pl.get_string_attrib(element, "weight", WEIGHT_DEFAULT)),
+        replacement_policy=replacement_policy,
+        state_width=state_width,
+        compact_partial_scores=pl.get_boolean_attrib(
+            element, "compact-partial-scores", COMPACT_PARTIAL_SCORES_DEFAULT
+        ),
+        submission_view=submission_view,
+        way_list=way_list,
+        block_list=block_list,
+        way_display_width=way_display_width,
+        num_columns=num_columns,
+        layout=_cell_layout(
+            name,
+            num_sets,
+            num_ways,
+            block_bits,
+            show_valid,
+            show_dirty,
+            show_data,
+            state_width,
+        ),
+    )
+
+
+def _cache_cells(cache: list, layout: CellLayout) -> list[str]:
+    # values of a cache configuration in layout order
+    return [
+        cache[i]["blocks"][j][k] if field == "blocks" else cache[i][field][j]
+        for field, i, j, k in layout.paths
+    ]
+
+
+def _canonical_cells(cache: list, layout: CellLayout) -> list[str]:
+    # values of a cache configuration in layout order, normalized like parsed answers
+    cells = []
+    for (field, *_), value in zip(layout.paths, _cache_cells(cache, layout)):
+        if PARSE_RULES[field].strip_prefix:
+            value = value.replace("0x", "")
+        cells.append(value.replace(" ", "").lower())
+    return cells
+
+
+class CanonicalCells(NamedTuple):
+    # Canonical cells of the initial and final caches of a variant, in layout order
+    initial: np.ndarray
+    final: np.ndarray
+    filled: list[bool]  # cells whose initial value must not be erased
+    changed_blocks: list[bool]  # blocks that change from the initial to the final cache
+
+
+CANONICAL_CACHE: collections.OrderedDict[str, CanonicalCells] = (
+    collections.OrderedDict()
+)
+
+
+def _canonical(config: CacheTableConfig, data: pl.QuestionData) -> CanonicalCells:
+    # The initial and final caches never change for a variant, so they are
+    # normalized once per process and table shape instead of on every parse,
+    # grading and render. The shape is part of the key, so a table edited after
+    # its variants were generated never reuses cells of the old layout.
+    name = config.name
+    layout = config.layout
+    shape = [
+        name,
+        config.num_sets,
+        config.num_ways,
+        config.block_bits,
+        config.show_valid,
+        config.show_dirty,
+        config.show_data,
+        config.state_width,
+    ]
+    key_data = [shape, data["params"][name], data["correct_answers"][name]]
+    key = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+    canonical = CANONICAL_CACHE.get(key)
+    if canonical is not None:
+        CANONICAL_CACHE.move_to_end(key)
+        return canonical
+
+    initial = _canonical_cells(data["params"][name], layout)
+    final = _canonical_cells(data["correct_answers"][name], layout)
+    canonical = CanonicalCells(
+        initial=np.array(initial, dtype=str),
+        final=np.array(final, dtype=str),
+        filled=[value != "" for value in _cache_cells(data["params"][name], layout)],
+        changed_blocks=_changed_blocks(initial, final, layout),
+    )
+    CANONICAL_CACHE[key] = canonical
+    if len(CANONICAL_CACHE) > CANONICAL_CACHE_MAX_ENTRIES:
+        CANONICAL_CACHE.popitem(last=False)
+    return canonical
+
+
+def _pack_bits(mask: np.ndarray) -> str:
+    return base64.b64encode(np.packbits(mask).tobytes()).decode("ascii")
+
+
+def _unpack_bits(bitmap: str, count: int) -> list[int]:
+    bits = np.frombuffer(base64.b64decode(bitmap), dtype=np.uint8)
+    return np.unpackbits(bits, count=count).tolist()
+
+
+def _cell_scores(partial_scores: dict, name: str, layout: CellLayout) -> dict:
+    # Per-cell and per-block partial scores, decoded from the bitmaps of the
+    # element's own entry when grading used compact-partial-scores
+    element_score = partial_scores.get(name)
+    if element_score is None or "cell_bitmap" not in element_score:
+        return partial_scores
+
+    scores = {}
+    for keys, bitmap in (
+        (layout.keys, element_score["cell_bitmap"]),
+        (layout.block_keys, element_score["block_bitmap"]),
+    ):
+        bits = _unpack_bits(bitmap, len(keys))
+        scores.update((key, {"score": bit}) for key, bit in zip(keys, bits))
+    return scores
+
+
+def _changed_blocks(
+    initial: list[str], final: list[str], layout: CellLayout
+) -> list[bool]:
+    # whether each block, in block_keys order, differs between two canonical caches
+    cell_changed = np.array(initial, dtype=str) != np.array(final, dtype=str)
+    changes = np.bincount(
+        layout.cell_blocks, weights=cell_changed, minlength=len(layout.block_keys)
+    )
+    return (changes > 0).tolist()
+
+
+def _diff_view(
+    config: CacheTableConfig, data: pl.QuestionData, cell_scores: dict
+) -> tuple[list[bool], list[bool]]:
+    # Blocks and sets shown by the diff view of the submission panel: blocks that
+    # should change, were graded incorrect, or have a format error
+    layout = config.layout
+    shown_blocks = list(_canonical(config, data).changed_blocks)
+    for block, key in enumerate(layout.block_keys):
+        block_score = cell_scores.get(key)
+        if block_score is not None and block_score["score"] != 1:
+            shown_blocks[block] = True
+    for key in data["format_errors"]:
+        block = layout.key_blocks.get(key)
+        if block is not None:
+            shown_blocks[block] = True
+
+    num_ways = config.num_ways
+    lru_blocks = shown_blocks[config.num_sets * num_ways :]
+    shown_sets = [
+        lru_block or any(shown_blocks[i * num_ways : (i + 1) * num_ways])
+        for i, lru_block in enumerate(lru_blocks)
+    ]
+    return shown_blocks, shown_sets
+
+
+def _collapsed_sets_summary(sets: list[int], config: CacheTableConfig) -> dict:
+    # one row of the diff view standing for a run of sets that are hidden
+    indexes = [
+        f"{i:0x}" if config.display_base == "hex" else f"{i:0{config.set_bits}b}"
+        for i in (sets[0], sets[-1])
+    ]
+    if len(sets) == 1:
+        return {"summary": f"Set {indexes[0]} unchanged"}
+    return {"summary": f"Sets {indexes[0]} to {indexes[1]} unchanged"}
+
+
+def render(element_html: str, data: pl.QuestionData) -> str:
+    config = _element_config(element_html)
+    name = config.name
+
+    # Read-only tables and answer panels do not depend on the submission, so every
+    # student viewing the same variant gets the same HTML
+    if not (config.read_only or data["panel"] == "answer"):
+        return _render_panel(config, data)
+
+    key_data = [
+        element_html,
+        data["params"][name],
+        data["correct_answers"][name],
+        data["panel"],
+    ]
+    key = hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+    html = RENDER_CACHE.get(key)
+    if html is None:
+        html = _render_panel(config, data)
+        if html is not None:
+            RENDER_CACHE.put(key, html)
+    return html
+
+
+def _render_panel(config: CacheTableConfig, data: pl.QuestionData) -> str:
+    name = config.name
+
+    show_partial_score = config.show_partial_score
+    show_percentage_score = config.show_percentage_score
+
+    # get number of sets
+    set_bits = config.set_bits
+    num_sets = config.num_sets
+
+    block_bits = config.block_bits
+
+    num_ways = config.num_ways
+
+    fully_assoc = False
+    if set_bits == 0:
+        fully_assoc = True
+
+    grade_mode = config.grade_mode
+
+    replacement_policy = config.replacement_policy
+    state_width = config.state_width
+
+    way_list = config.way_list
+
+    is_material = config.read_only
+    show_data = config.show_data
+    show_dirty = config.show_dirty
+    show_valid = config.show_valid
+    display_base = config.display_base
+    tag_width = config.tag_width
+
+    initial_cache = data["params"][name]
+    final_cache = data["correct_answers"][name]
+
+    cell_scores = _cell_scores(data["partial_scores"], name, config.layout)
+
+    block_list = config.block_list
+    way_display_width = config.way_display_width
+
+    # the diff view of the submission panel hides blocks and runs of sets that
+    # need no attention. Read-only tables are rendered as plain material, which
+    # has no diff view
+    shown_blocks = None
+    if (
+        config.submission_view == "diff"
+        and not config.read_only
+        and data["panel"] == "submission"
+    ):
+        shown_blocks, shown_sets = _diff_view(config, data, cell_scores)
+    collapsed_sets = []
+
     # construct a cache_sets array to store all cache information
     prefill = {}
     cache_sets = []
+    has_lru = state_width > 0
     for i in range(num_sets):
+        if shown_blocks is not None:
+            if not shown_sets[i]:
+                collapsed_sets.append(i)
+                continue
+            if collapsed_sets:
+                cache_sets.append(_collapsed_sets_summary(collapsed_sets, config))
+                collapsed_sets = []
+
         # initialize set
         cache_set = {
             "index": f"{i:0x}" if display_base == "hex" else f"{i:0{set_bits}b}",
@@ -215,6 +718,10 @@ def render(element_html: str, data: pl.QuestionData) -> str:
         }
 
         for j in range(num_ways):
+            if shown_blocks is not None and not shown_blocks[i * num_ways + j]:
+                cache_set["ways"].append({"collapsed": True})
+                continue
+
             tag_name = f"{name}_tag{i}_{j}"
             valid_name = f"{name}_valid{i}_{j}"
             dirty_name = f"{name}_dirty{i}_{j}"
@@ -239,14 +746,14 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                 "dirty_correct": False,
                 "dirty_incorrect": False,
             }
-            tag_score = data["partial_scores"].get(f"{name}_tag{i}_{j}")
+            tag_score = cell_scores.get(f"{name}_tag{i}_{j}")
             if tag_score is not None and grade_mode != "blocks" and show_partial_score:
                 if tag_score["score"] == 1:
                     way["tag_correct"] = True
                 else:
                     way["tag_incorrect"] = True
 
-            block_score = data["partial_scores"].get(f"{name}_block{i}_{j}")
+            block_score = cell_scores.get(f"{name}_block{i}_{j}")
             if (
                 block_score is not None
                 and grade_mode == "blocks"
@@ -264,7 +771,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                 way.update(
                     {"raw_sub_valid": data["raw_submitted_answers"].get(valid_name)}
                 )
-                valid_score = data["partial_scores"].get(f"{name}_valid{i}_{j}")
+                valid_score = cell_scores.get(f"{name}_valid{i}_{j}")
                 if (
                     valid_score is not None
                     and grade_mode != "blocks"
@@ -282,7 +789,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                 way.update(
                     {"raw_sub_dirty": data["raw_submitted_answers"].get(dirty_name)}
                 )
-                dirty_score = data["partial_scores"].get(f"{name}_dirty{i}_{j}")
+                dirty_score = cell_scores.get(f"{name}_dirty{i}_{j}")
                 if (
                     dirty_score is not None
                     and grade_mode != "blocks"
@@ -307,7 +814,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                         "data_incorrect": False,
                         "last_data": False,
                     }
-                    data_score = data["partial_scores"].get(
+                    data_score = cell_scores.get(
                         f"{name}_data{i}_{j}_{k}", None
                     )
                     if (
@@ -328,10 +835,11 @@ def render(element_html: str, data: pl.QuestionData) -> str:
 
             cache_set["ways"].append(way)
 
-        has_lru = True
-        if num_ways > 1:
+        if shown_blocks is not None and not shown_blocks[num_sets * num_ways + i]:
+            cache_set["lru_collapsed"] = True
+        elif state_width > 0:
             lru = []
-            for j in range(num_ways):
+            for j in range(state_width):
                 lru_name = f"{name}_lru{i}_{j}"
                 lru_state = {
                     "lru_name": lru_name,
@@ -342,7 +850,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                     "lru_correct": False,
                     "lru_incorrect": False,
                 }
-                lru_score = data["partial_scores"].get(f"{name}_lru{i}_{j}")
+                lru_score = cell_scores.get(f"{name}_lru{i}_{j}")
                 if (
                     lru_score is not None
                     and grade_mode != "blocks"
@@ -352,12 +860,12 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                         lru_state["lru_correct"] = True
                     else:
                         lru_state["lru_incorrect"] = True
-                if j < (num_ways - 1):
+                if j < (state_width - 1):
                     lru_state.update({"comma": True})
 
                 lru.append(lru_state)
 
-            block_score = data["partial_scores"].get(f"{name}_lru_block{i}")
+            block_score = cell_scores.get(f"{name}_lru_block{i}")
             if (
                 block_score is not None
                 and grade_mode == "blocks"
@@ -369,11 +877,12 @@ def render(element_html: str, data: pl.QuestionData) -> str:
                     cache_set["all_lru_incorrect"] = True
 
             cache_set.update({"lru": lru})
-        else:
-            has_lru = False
 
         cache_sets.append(cache_set)
 
+    if collapsed_sets:
+        cache_sets.append(_collapsed_sets_summary(collapsed_sets, config))
+
     correct = False
     partial = False
     incorrect = False
@@ -404,16 +913,9 @@ def render(element_html: str, data: pl.QuestionData) -> str:
     if not show_percentage_score:
         grade_info += "<br>Total percentage score for this table will not be shown"
 
-    # Get template
-    with open(CACHE_TABLE_MUSTACHE_TEMPLATE_NAME, "r", encoding="utf-8") as f:
-        template = f.read()
+    template = load_template()
     if data["panel"] == "question":
-        grading_text = "PLACEHOLDER"
-        info_params = {
-            "format": True,
-            "grading_text": grading_text,
-        }
-        info = chevron.render(template, info_params)
+        info = render_info()
         html_params = {
             "question": True,
             "name": name,
@@ -430,6 +932,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
             "way_display_width": way_display_width,
             "blocks": True if grade_mode == "blocks" and score is not None else False,
             "has_lru": has_lru,
+            "state_label": REPLACEMENT_POLICY_LABELS[replacement_policy],
             "fully_assoc": fully_assoc,
             "all_correct": correct,
             "all_incorrect": incorrect,
@@ -448,6 +951,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
             "uuid": pl.get_uuid(),
             "cache_sets": cache_sets,
             "num_sets": num_sets,
+            "num_columns": config.num_columns,
             "way_list": way_list,
             "block_list": block_list,
             "show_valid": show_valid,
@@ -456,6 +960,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
             "way_display_width": way_display_width,
             "blocks": True if grade_mode == "blocks" and score is not None else False,
             "has_lru": has_lru,
+            "state_label": REPLACEMENT_POLICY_LABELS[replacement_policy],
             "fully_assoc": fully_assoc,
             "all_correct": correct,
             "all_incorrect": incorrect,
@@ -479,6 +984,7 @@ def render(element_html: str, data: pl.QuestionData) -> str:
             "show_dirty": show_dirty,
             "way_display_width": way_display_width,
             "has_lru": has_lru,
+            "state_label": REPLACEMENT_POLICY_LABELS[replacement_policy],
             "fully_assoc": fully_assoc,
             "is_material": is_material,
         }
@@ -486,336 +992,110 @@ def render(element_html: str, data: pl.QuestionData) -> str:
 
 
 def parse(element_html: str, data: pl.QuestionData) -> None:
+    config = _element_config(element_html)
 
-    element = lxml.html.fragment_fromstring(element_html)
-
-    is_material = _is_read_only(element)
+    is_material = config.read_only
     if is_material:
         return
 
-    name = pl.get_string_attrib(element, "answers-name")
-
-    set_bits = int(pl.get_string_attrib(element, "set-bits"))
-    num_sets = 2**set_bits
-
-    block_bits = int(pl.get_string_attrib(element, "block-bits"))
-
-    num_ways = int(pl.get_string_attrib(element, "num-ways"))
-
-    show_valid = pl.get_boolean_attrib(element, "show-valid", SHOW_VALID_DEFAULT)
-    show_dirty = pl.get_boolean_attrib(element, "show-dirty", SHOW_DIRTY_DEFAULT)
-    show_data = pl.get_boolean_attrib(element, "show-data", SHOW_DATA_DEFAULT)
-
-    allowed_characters = "0123456789abcdef"
+    name = config.name
+    layout = config.layout
 
-    for i in range(num_sets):
-        for j in range(num_ways):
-            # remove white space from students' answers
-            tag = data["raw_submitted_answers"].get(f"{name}_tag{i}_{j}", "")
-            clean_tag = tag.lower().replace("0x", "").replace(" ", "")
-            if clean_tag == "" and data["params"][name][i]["tags"][j] != "":
-                data["format_errors"][f"{name}_tag{i}_{j}"] = (
-                    "Tag cannot be empty if it starts with a value. Initial value has been re-entered"
-                )
+    filled = _canonical(config, data).filled
 
-            if not all(char in allowed_characters for char in clean_tag):
-                data["format_errors"][f"{name}_tag{i}_{j}"] = (
-                    'Tag must not have characters besides 0-9, a-f, and "0x".'
-                )
-            else:
-                data["submitted_answers"][f"{name}_tag{i}_{j}"] = clean_tag
+    raw_submitted_answers = data["raw_submitted_answers"]
+    format_errors = data["format_errors"]
+    submitted_answers = data["submitted_answers"]
 
-            if show_valid:
-                valid = data["raw_submitted_answers"].get(f"{name}_valid{i}_{j}", "")
-                clean_valid = valid.lower().replace(" ", "")
-                if clean_valid == "" and data["params"][name][i]["valid"][j] != "":
-                    data["format_errors"][f"{name}_valid{i}_{j}"] = (
-                        "Valid bit cannot be empty if it starts with a value. Initial value has been re-entered"
-                    )
-                if not all(char in "01" for char in clean_valid):
-                    data["format_errors"][f"{name}_valid{i}_{j}"] = (
-                        "Valid must be 0 or 1."
-                    )
-                else:
-                    data["submitted_answers"][f"{name}_valid{i}_{j}"] = clean_valid
+    for key, rule, is_filled in zip(layout.keys, layout.rules, filled):
+        # remove white space from students' answers
+        clean_value = raw_submitted_answers.get(key, "").lower()
+        if rule.strip_prefix:
+            clean_value = clean_value.replace("0x", "")
+        clean_value = clean_value.replace(" ", "")
 
-            if show_dirty:
-                dirty = data["raw_submitted_answers"].get(f"{name}_dirty{i}_{j}", "")
-                clean_dirty = dirty.lower().replace(" ", "")
-                if clean_dirty == "" and data["params"][name][i]["dirty"][j] != "":
-                    data["format_errors"][f"{name}_dirty{i}_{j}"] = (
-                        "Valid bit cannot be empty if it starts with a value. Initial value has been re-entered"
-                    )
-                if not all(char in "01" for char in clean_dirty):
-                    data["format_errors"][f"{name}_dirty{i}_{j}"] = (
-                        "Valid must be 0 or 1."
-                    )
-                else:
-                    data["submitted_answers"][f"{name}_dirty{i}_{j}"] = clean_dirty
-
-            if show_data:
-                for k in range(2**block_bits):
-                    bdata = data["raw_submitted_answers"].get(
-                        f"{name}_data{i}_{j}_{k}", ""
-                    )
-                    clean_data = bdata.lower().replace("0x", "").replace(" ", "")
-                    if (
-                        clean_data == ""
-                        and data["params"][name][i]["blocks"][j][k] != ""
-                    ):
-                        data["format_errors"][f"{name}_data{i}_{j}_{k}"] = (
-                            "Data cannot be empty if it starts with a value. Initial value has been re-entered"
-                        )
-                    if not all(char in allowed_characters for char in clean_data):
-                        data["format_errors"][f"{name}_data{i}_{j}_{k}"] = (
-                            'Data must not have characters besides 0-9, a-f, and "0x".'
-                        )
-                    else:
-                        data["submitted_answers"][f"{name}_data{i}_{j}_{k}"] = (
-                            clean_data
-                        )
-
-            if num_ways > 1:
-                lru = data["raw_submitted_answers"].get(f"{name}_lru{i}_{j}", "")
-                clean_lru = lru.lower().replace(" ", "")
-                if clean_lru == "" and data["params"][name][i]["lru"][j] != "":
-                    data["format_errors"][f"{name}_lru{i}_{j}"] = (
-                        "Valid bit cannot be empty if it starts with a value. Initial value has been re-entered"
-                    )
-                if not all(char in allowed_characters for char in clean_lru):
-                    data["format_errors"][f"{name}_lru{i}_{j}"] = (
-                        "LRU must not have characters besides 0-9."
-                    )
-                else:
-                    data["submitted_answers"][f"{name}_lru{i}_{j}"] = clean_lru
+        if clean_value == "" and is_filled:
+            format_errors[key] = rule.empty_error
+        if rule.pattern.fullmatch(clean_value) is None:
+            format_errors[key] = rule.invalid_error
+        else:
+            submitted_answers[key] = clean_value
 
     return
 
 
 def grade(element_html: str, data: pl.QuestionData) -> None:
-    element = lxml.html.fragment_fromstring(element_html)
+    config = _element_config(element_html)
 
-    is_material = _is_read_only(element)
+    is_material = config.read_only
     if is_material:
         return
 
-    name = pl.get_string_attrib(element, "answers-name")
+    name = config.name
 
-    grade_mode = pl.get_string_attrib(element, "grade-mode", GRADE_MODE_DEFAULT)
+    grade_mode = config.grade_mode
 
     initial_cache = data["params"][name]
     final_cache = data["correct_answers"][name]
     sub_cache = data["submitted_answers"]
 
-    set_bits = int(pl.get_string_attrib(element, "set-bits"))
-    num_sets = 2**set_bits
+    num_sets = config.num_sets
+    num_ways = config.num_ways
 
-    block_bits = int(pl.get_string_attrib(element, "block-bits"))
+    weight = config.weight
 
-    num_ways = int(pl.get_string_attrib(element, "num-ways"))
-
-    show_valid = pl.get_boolean_attrib(element, "show-valid", SHOW_VALID_DEFAULT)
-    show_dirty = pl.get_boolean_attrib(element, "show-dirty", SHOW_DIRTY_DEFAULT)
-    show_data = pl.get_boolean_attrib(element, "show-data", SHOW_DATA_DEFAULT)
+    compact_partial_scores = config.compact_partial_scores
 
-    weight = int(pl.get_string_attrib(element, "weight", WEIGHT_DEFAULT))
+    state_width = config.state_width
 
     num_blocks = num_sets * (num_ways)
-    if num_ways > 1:
+    if state_width > 0:
         num_blocks += num_sets  # one more set of blocks for LRUs
 
-    num_cells_mult = 1  # at least 1 bit for tag
-    if show_data:
-        num_cells_mult += 2**block_bits
-    if show_valid:
-        num_cells_mult += 1
-    if show_dirty:
-        num_cells_mult += 1
-    if num_ways > 1:
-        num_cells_mult += 1
-    num_cells = num_sets * num_ways * num_cells_mult
-
-    num_blocks_changed = 0
-    num_cells_changed = 0
-
-    changed_blocks_correct = 0
-    same_blocks_correct = 0
-    changed_cells_correct = 0
-    same_cells_correct = 0
-
-    for i in range(num_sets):
-        lru_block_changed = False
-        lru_block_correct = True
-        for j in range(num_ways):
-            block_changed = False
-            block_correct = True
-            # remove white space from students' answers
-            initial_tag = (
-                initial_cache[i]["tags"][j].replace("0x", "").replace(" ", "").lower()
-            )
-            final_tag = (
-                final_cache[i]["tags"][j].replace("0x", "").replace(" ", "").lower()
-            )
-            sub_tag = sub_cache.get(f"{name}_tag{i}_{j}")
-            cell_changed = 0
-            if initial_tag != final_tag:
-                cell_changed = 1
-                block_changed = True
-            num_cells_changed += cell_changed
-            if sub_tag == final_tag:
-                data["partial_scores"][f"{name}_tag{i}_{j}"] = {
-                    "score": 1,
-                    "weight": 0,
-                }
-                changed_cells_correct += cell_changed
-                same_cells_correct += 1 - cell_changed
-            else:
-                block_correct = False
-                data["partial_scores"][f"{name}_tag{i}_{j}"] = {
-                    "score": 0,
-                    "weight": 0,
-                }
+    layout = config.layout
+    num_cells = len(layout.keys)
 
-            if show_valid:
-                initial_valid = initial_cache[i]["valid"][j].replace(" ", "").lower()
-                final_valid = final_cache[i]["valid"][j].replace(" ", "").lower()
-                sub_valid = sub_cache.get(f"{name}_valid{i}_{j}")
-                cell_changed = 0
-                if initial_valid != final_valid:
-                    cell_changed = 1
-                    block_changed = True
-                num_cells_changed += cell_changed
-                if sub_valid == final_valid:
-                    data["partial_scores"][f"{name}_valid{i}_{j}"] = {
-                        "score": 1,
-                        "weight": 0,
-                    }
-                    changed_cells_correct += cell_changed
-                    same_cells_correct += 1 - cell_changed
-                else:
-                    data["partial_scores"][f"{name}_valid{i}_{j}"] = {
-                        "score": 0,
-                        "weight": 0,
-                    }
-                    block_correct = False
+    canonical = _canonical(config, data)
 
-            if show_dirty:
-                initial_dirty = initial_cache[i]["dirty"][j].replace(" ", "").lower()
-                final_dirty = final_cache[i]["dirty"][j].replace(" ", "").lower()
-                sub_dirty = sub_cache.get(f"{name}_dirty{i}_{j}")
-                cell_changed = 0
-                if initial_dirty != final_dirty:
-                    cell_changed = 1
-                    block_changed = True
-                num_cells_changed += cell_changed
-                if sub_dirty == final_dirty:
-                    data["partial_scores"][f"{name}_dirty{i}_{j}"] = {
-                        "score": 1,
-                        "weight": 0,
-                    }
-                    changed_cells_correct += cell_changed
-                    same_cells_correct += 1 - cell_changed
-                else:
-                    data["partial_scores"][f"{name}_dirty{i}_{j}"] = {
-                        "score": 0,
-                        "weight": 0,
-                    }
-                    block_correct = False
+    # one pass over all cells: which cells changed, and which were answered correctly
+    submitted = [sub_cache.get(key) for key in layout.keys]
+    initial = canonical.initial
+    final = canonical.final
+    cell_changed = initial != final
+    cell_correct = np.array([value is not None for value in submitted], dtype=bool) & (
+        np.array([value or "" for value in submitted], dtype=str) == final
+    )
 
-            if show_data:
-                for k in range(2**block_bits):
-                    initial_data = (
-                        initial_cache[i]["blocks"][j][k]
-                        .replace("0x", "")
-                        .replace(" ", "")
-                        .lower()
-                    )
-                    final_data = (
-                        final_cache[i]["blocks"][j][k]
-                        .replace("0x", "")
-                        .replace(" ", "")
-                        .lower()
-                    )
-                    sub_data = sub_cache.get(f"{name}_data{i}_{j}_{k}")
-                    cell_changed = 0
-                    if initial_data != final_data:
-                        cell_changed = 1
-                        block_changed = True
-                    num_cells_changed += cell_changed
-                    if sub_data == final_data:
-                        data["partial_scores"][f"{name}_data{i}_{j}_{k}"] = {
-                            "score": 1,
-                            "weight": 0,
-                        }
-                        changed_cells_correct += cell_changed
-                        same_cells_correct += 1 - cell_changed
-                    else:
-                        data["partial_scores"][f"{name}_data{i}_{j}_{k}"] = {
-                            "score": 0,
-                            "weight": 0,
-                        }
-                        block_correct = False
-
-            if block_correct:
-                data["partial_scores"][f"{name}_block{i}_{j}"] = {
-                    "score": 1,
-                    "weight": 0,
-                }
-                if block_changed:
-                    num_blocks_changed += 1
-                    changed_blocks_correct += 1
-                else:
-                    same_blocks_correct += 1
-            else:
-                data["partial_scores"][f"{name}_block{i}_{j}"] = {
-                    "score": 0,
-                    "weight": 0,
-                }
-                if block_changed:
-                    num_blocks_changed += 1
-
-            if num_ways > 1:
-                initial_lru = initial_cache[i]["lru"][j]
-                initial_lru = initial_lru.replace(" ", "").lower()
-                final_lru = final_cache[i]["lru"][j]
-                final_lru = final_lru.replace(" ", "").lower()
-                sub_lru = sub_cache.get(f"{name}_lru{i}_{j}")
-                cell_changed = 0
-                if initial_lru != final_lru:
-                    cell_changed = 1
-                    lru_block_changed = True
-                num_cells_changed += cell_changed
-                if sub_lru == final_lru:
-                    data["partial_scores"][f"{name}_lru{i}_{j}"] = {
-                        "score": 1,
-                        "weight": 0,
-                    }
-                    changed_cells_correct += cell_changed
-                    same_cells_correct += 1 - cell_changed
-                else:
-                    data["partial_scores"][f"{name}_lru{i}_{j}"] = {
-                        "score": 0,
-                        "weight": 0,
-                    }
-                    lru_block_correct = False
+    # a block (or the LRU cells of a set) is correct if all of its cells are correct,
+    # and changed if any of its cells changed
+    num_block_ids = len(layout.block_keys)
+    cells_per_block = np.bincount(layout.cell_blocks, minlength=num_block_ids)
+    block_correct = (
+        np.bincount(layout.cell_blocks, weights=cell_correct, minlength=num_block_ids)
+        == cells_per_block
+    )
+    block_changed = (
+        np.bincount(layout.cell_blocks, weights=cell_changed, minlength=num_block_ids)
+        > 0
+    )
 
-        if lru_block_correct:
-            data["partial_scores"][f"{name}_lru_block{i}"] = {
-                "score": 1,
-                "weight": 0,
-            }
-            if lru_block_changed:
-                num_blocks_changed += 1
-                changed_blocks_correct += 1
-            else:
-                same_blocks_correct += 1
-        else:
-            data["partial_scores"][f"{name}_lru_block{i}"] = {
-                "score": 0,
-                "weight": 0,
-            }
-            if lru_block_changed:
-                num_blocks_changed += 1
+    num_cells_changed = int(cell_changed.sum())
+    changed_cells_correct = int((cell_changed & cell_correct).sum())
+    same_cells_correct = int((~cell_changed & cell_correct).sum())
+
+    num_blocks_changed = int(block_changed.sum())
+    changed_blocks_correct = int((block_changed & block_correct).sum())
+    same_blocks_correct = int((~block_changed & block_correct).sum())
+
+    if not compact_partial_scores:
+        for keys, correct in (
+            (layout.keys, cell_correct),
+            (layout.block_keys, block_correct),
+        ):
+            data["partial_scores"].update(
+                (key, {"score": score, "weight": 0})
+                for key, score in zip(keys, correct.astype(int).tolist())
+            )
 
     if initial_cache == final_cache:
         if same_cells_correct == num_cells:
@@ -857,6 +1137,11 @@ def grade(element_html: str, data: pl.QuestionData) -> None:
             "weight": weight,
         }
 
+    if compact_partial_scores:
+        # one bit per cell and per block, in layout order, instead of one entry each
+        data["partial_scores"][name]["cell_bitmap"] = _pack_bits(cell_correct)
+        data["partial_scores"][name]["block_bitmap"] = _pack_bits(block_correct)
+
     return
 
 
@@ -1,7 +1,8 @@
 import random
-from random import choice
 
-CACHE = []
+from cache_tables import CacheSimulator, LazyMemory, MissClassifier
+
+ADDR_BITS = 32
 
 
 ########
@@ -20,15 +21,11 @@ def generate(data):
     offset_size = random.randint(5, 7)
 
     if associativity == 0:
-        CACHE.append({"tags": []})
         index_size = 0
-    elif associativity == 1:
-        index_size = 10 + total_size_KB - offset_size
-    elif associativity == 2:
-        index_size = 10 + total_size_KB - offset_size - 1
-    elif associativity > 2:
-        index_size = 10 + total_size_KB - offset_size - 2
-    tag_size = 32 - offset_size - index_size
+        ways = 2 ** (10 + total_size_KB - offset_size)
+    else:
+        index_size = 10 + total_size_KB - offset_size - (associativity - 1)
+        ways = associativity
     num_sets = 2**index_size
     block_size = 2**offset_size
 
@@ -42,218 +39,52 @@ def generate(data):
     else:
         data["params"]["associativity"] = f"{associativity}-way set associative"
 
-    #####
-    ## Generate a set of unique addresses that can be re-used
-    #####
-    addresses = []
-    if associativity == 0:  # Create num_addr + 1 tags for fully asccoicative cache
-        tags = [0] * (num_addr + 1)
-        for x in range(num_addr + 1):
-            tags[x] = random.randint(0, (2**tag_size) - 1)
-        address_dict = {"idx": 0, "tags": tags}
-        addresses.append(address_dict)
-    else:
-        tags = [0] * (associativity + 1)  #             create num_addr indexes
-        for x in range(num_addr):
-            acc_idx = random.randint(0, num_sets - 1)
-            for y in range(
-                associativity + 1
-            ):  #      for each index create associativity + 1 tags
-                tags[y] = random.randint(0, (2**tag_size) - 1)
-
-            address_dict = {"idx": acc_idx, "tags": tags}
-            addresses.append(address_dict)
+    # The cache starts empty, and every access is simulated by the shared engine
+    sim = CacheSimulator(
+        LazyMemory(ADDR_BITS),
+        ways=ways,
+        set_bits=index_size,
+        block_bits=offset_size,
+        addr_bits=ADDR_BITS,
+    )
+    sim.fill(empty_cache=True)
+    classifier = MissClassifier(sim)
 
     # choose first address for access
-    addr_choice = choice(addresses)
-    acc_idx = addr_choice["idx"]
-    acc_tag = choice(addr_choice["tags"])
-    acc_off = random.randint(0, block_size - 1)
-
-    address = (acc_tag * num_sets + acc_idx) * 2**offset_size + acc_off
-    hex_address = "{0:#0{1}x}".format(address, 10)
-
-    access_table = []
-
-    access = {
-        "access": 0,
-        "address": hex_address,
-        "hit": False,
-        "tag": hex(acc_tag),
-        "index": hex(acc_idx),
-        "text": "Miss (Invalid)",
-    }
-
-    access_table.append(access)
-
-    if associativity == 0:
-        CACHE[0]["tags"].append(acc_tag)
-    else:
-        cache_entry = {"idx": acc_idx, "tags": [acc_tag]}
-        CACHE.append(cache_entry)
-
-    # handle different associativity separately
-    if associativity == 0:
-        for x in range(num_addr):
-            hit_choice = random.randint(0, 9)
-            if hit_choice <= 4:  # 50% chance of hit
-                acc_idx = 0
-                acc_tag = random.choice(CACHE[0]["tags"])
-                acc_off = random.randint(0, block_size - 1)
-
-                address = acc_tag * block_size + acc_off
-                hex_address = "{0:#0{1}x}".format(address, 10)
-
-                access = {
-                    "access": x + 1,
-                    "address": hex_address,
-                    "hit": True,
-                    "tag": hex(acc_tag),
-                    "index": hex(acc_idx),
-                    "text": "Hit",
-                }
+    acc_idx = random.randint(0, num_sets - 1)
+    acc_tag = random.randint(0, sim.max_tag)
+    access_table = [simulate_access(sim, classifier, 0, acc_tag, acc_idx)]
+    accessed = {acc_idx: [acc_tag]}  # tags accessed in every set
+
+    for x in range(num_addr):
+        hit_choice = random.randint(0, 9)
+        # hits are a bit more likely in a fully associative cache, where every access uses the same set
+        hit_threshold = 4 if associativity == 0 else 3
+
+        if hit_choice <= hit_threshold:  # hit on a block that is in the cache
+            acc_idx, way = divmod(random.choice(sim.valid_blocks), ways)
+            acc_tag = sim.tags[acc_idx * ways + way]
+
+        elif hit_choice <= 7 or associativity == 0:  # collision: same index, different tag
+            acc_idx = random.choice(sim.valid_blocks) // ways
+            # coming back to an evicted tag gives a conflict miss instead of a compulsory one
+            evicted = [
+                tag for tag in accessed.get(acc_idx, []) if tag not in sim.tag_ways[acc_idx]
+            ]
+            if evicted != [] and random.randint(0, 1) == 1:
+                acc_tag = random.choice(evicted)
             else:
-                acc_idx = 0
-
-                # Get a random tag that is not already in the cache
-                acc_tag = CACHE[acc_idx]["tags"][0]
-                while acc_tag in CACHE[acc_idx]["tags"]:
-                    acc_tag = choice(addresses[0]["tags"])
-                CACHE[0]["tags"].append(acc_tag)
-
-                acc_off = random.randint(0, (2**offset_size) - 1)
-
-                address = acc_tag * block_size + acc_off
-                hex_address = "{0:#0{1}x}".format(address, 10)
-
-                access = {
-                    "access": x + 1,
-                    "address": hex_address,
-                    "hit": False,
-                    "tag": hex(acc_tag),
-                    "index": hex(acc_idx),
-                    "text": "Miss (Invalid)",
-                }
-            access_table.append(access)
-    else:
-        for x in range(num_addr):  # add choice of same index different tag
-            hit_choice = random.randint(0, 9)  # random.randint(0,9)
-
-            if hit_choice <= 3:  # 40% chance of hit
-                if associativity == 1:
-                    cache_block = choice(CACHE)  # choose a random cache block
-                    acc_tag = cache_block["tags"][
-                        0
-                    ]  # choose a random tag in cache block
-                    acc_idx = cache_block["idx"]
-                else:
-                    cache_block = choice(CACHE)  # choose a random cache block
-                    acc_tag = choice(
-                        cache_block["tags"]
-                    )  # choose a random tag in cache block
-                    acc_idx = cache_block["idx"]
+                acc_tag = sim.sample_miss_tag(acc_idx)
 
-                    update_assoc(acc_idx, acc_tag, associativity)
+        else:  # same tag, different index
+            acc_tag = sim.tags[random.choice(sim.valid_blocks)]
+            unused_sets = [
+                index for index in range(num_sets) if len(sim.tag_ways[index]) == 0
+            ]
+            acc_idx = random.choice(unused_sets)
 
-                acc_off = random.randint(0, block_size - 1)
-
-                address = (acc_tag * num_sets + acc_idx) * block_size + acc_off
-                hex_address = "{0:#0{1}x}".format(address, 10)
-
-                access = {
-                    "access": x + 1,
-                    "address": hex_address,
-                    "hit": True,
-                    "tag": hex(acc_tag),
-                    "index": hex(acc_idx),
-                    "text": "Hit",
-                }
-
-            elif hit_choice > 3 and hit_choice <= 7:  # 30% chance of collision
-                c_idx = random.randint(0, len(CACHE) - 1)  # choose a random cache block
-                cache_block = CACHE[c_idx]
-                acc_idx = cache_block["idx"]
-
-                addr_idx = 0
-                for addr_idx in range(associativity + 1):
-                    if acc_idx == addresses[addr_idx]:
-                        break
-
-                acc_tag = CACHE[c_idx]["tags"][0]
-                while acc_tag in CACHE[c_idx]["tags"]:
-                    acc_tag = choice(addresses[addr_idx]["tags"])
-                if associativity == 1:
-                    CACHE[c_idx]["tags"][0] = acc_tag
-                else:
-                    update_assoc(acc_idx, acc_tag, associativity)
-
-                acc_off = random.randint(0, block_size - 1)
-
-                address = (acc_tag * num_sets + acc_idx) * block_size + acc_off
-                hex_address = "{0:#0{1}x}".format(address, 10)
-
-                access = {
-                    "access": x + 1,
-                    "address": hex_address,
-                    "hit": False,
-                    "tag": hex(acc_tag),
-                    "index": hex(acc_idx),
-                    "text": "Miss (Tag Mismatch)",
-                }
-
-            elif (
-                hit_choice > 7 and hit_choice <= 9
-            ):  # 30% chance of same tag, different index
-                cache_block = choice(CACHE)  # choose a random cache element
-                acc_tag = choice(cache_block["tags"])
-                acc_idx = CACHE[0]["idx"]
-                while idx_in_cache(acc_idx):
-                    acc_idx = random.randint(0, 2**index_size - 1)
-
-                if associativity == 1:
-                    update_direct(acc_idx, acc_tag)
-                else:
-                    update_assoc(acc_idx, acc_tag, associativity)
-
-                acc_off = random.randint(0, block_size - 1)
-
-                address = (acc_tag * num_sets + acc_idx) * block_size + acc_off
-                hex_address = "{0:#0{1}x}".format(address, 10)
-
-                access = {
-                    "access": x + 1,
-                    "address": hex_address,
-                    "hit": False,
-                    "tag": hex(acc_tag),
-                    "index": hex(acc_idx),
-                    "text": "Miss (Invalid)",
-                }
-
-            else:  # 0% chance of random new address that's a miss, but leaving here in case we want the option later
-                acc_tag = random.randint(0, (2**tag_size) - 1)
-                acc_idx = random.randint(0, num_sets - 1)
-                acc_off = random.randint(0, (2**offset_size) - 1)
-
-                address = (acc_tag * num_sets + acc_idx) * 2**offset_size + acc_off
-                hex_address = "{0:#0{1}x}".format(address, 10)
-
-                access = {
-                    "access": x + 1,
-                    "address": hex_address,
-                    "hit": False,
-                    "tag": hex(acc_tag),
-                    "index": hex(acc_idx),
-                    "text": "Miss (Invalid)",
-                }
-
-                if associativity == 0:
-                    CACHE[0]["tags"].append(acc_tag)
-                elif associativity == 1:
-                    update_direct(acc_idx, acc_tag)
-                else:
-                    update_assoc(acc_idx, acc_tag, associativity)
-
-            access_table.append(access)
+        accessed.setdefault(acc_idx, []).append(acc_tag)
+        access_table.append(simulate_access(sim, classifier, x + 1, acc_tag, acc_idx))
 
     data["params"]["access_table"] = access_table
 
@@ -261,63 +92,29 @@ def generate(data):
     data["correct_answers"]["cache_access2"] = access_table
 
 
-def update_direct(acc_idx, acc_tag):
-    cache_entry = {"idx": acc_idx, "tags": [acc_tag]}
-    CACHE.append(cache_entry)
+def simulate_access(sim, classifier, access_number, acc_tag, acc_idx):
+    # Simulates one access on sim and returns its row of the access table
+    acc_off = random.randint(0, sim.block_size - 1)
+    address = sim.layout.encode(acc_tag, acc_idx, acc_off)
 
+    # a miss fills an invalid way while the set is not full, and replaces a tag otherwise
+    set_full = len(sim.tag_ways[acc_idx]) == sim.ways
+    hit = sim.access(acc_tag, acc_idx, acc_off)[0]
+    miss_type = classifier.classify(sim.layout.block_address(acc_tag, acc_idx), hit)
 
-def update_assoc(acc_idx, acc_tag, associativity):
-    idx_exists = False  # determine if acc_idx has been accessed before
-
-    # Find index of current memory access in CACHE array
-    for x in range(len(CACHE)):
-        if CACHE[x]["idx"] == acc_idx:
-            temp_idx = x
-            idx_exists = True
-    if not idx_exists:  # if idx doesn't exist, create it
-        cache_entry = {"idx": acc_idx, "tags": [acc_tag]}
-        CACHE.append(cache_entry)
-    elif (
-        len(CACHE[temp_idx]["tags"]) < associativity
-    ):  # if idx exists but some ways are empty, fill next way
-        hit_way = False  # found hit in a way flag
-        for way in range(
-            len(CACHE[temp_idx]["tags"])
-        ):  # if idx exists, find hit_way or miss
-            if CACHE[temp_idx]["tags"][way] == acc_tag:
-                hit_way = True
-                break
-        if hit_way:
-            while way < len(CACHE[temp_idx]["tags"]) - 1:
-                CACHE[temp_idx]["tags"][way] = CACHE[temp_idx]["tags"][way + 1]
-                way += 1
-            CACHE[temp_idx]["tags"][way] = acc_tag
-        else:
-            CACHE[temp_idx]["tags"].append(acc_tag)
+    if hit:
+        text = "Hit"
+    elif set_full:
+        text = "Miss (Tag Mismatch)"
     else:
-        hit_way = False  # found hit in a way flag
-        for way in range(
-            associativity
-        ):  # if idx exists and ways are full, find hit_way
-            if CACHE[temp_idx]["tags"][way] == acc_tag:
-                hit_way = True
-                break
-
-        if hit_way:  # if hit found in a way, reorder tags, LRU tag is in CACHE[temp_idx]['tags'][0]
-            while way < associativity - 1:
-                CACHE[temp_idx]["tags"][way] = CACHE[temp_idx]["tags"][way + 1]
-                way += 1
-            CACHE[temp_idx]["tags"][way] = acc_tag
-        else:  # if miss, replace LRU (CACHE[temp_idx]['tags'][0])
-            way = 0
-            while way < associativity - 1:
-                CACHE[temp_idx]["tags"][way] = CACHE[temp_idx]["tags"][way + 1]
-                way += 1
-            CACHE[temp_idx]["tags"][way] = acc_tag
-
+        text = "Miss (Invalid)"
 
-def idx_in_cache(acc_idx):
-    for x in range(len(CACHE)):
-        if CACHE[x]["idx"] == acc_idx:
-            return True
-    return False
+    return {
+        "access": access_number,
+        "address": sim.layout.format_address(address, "hex"),
+        "hit": hit,
+        "tag": hex(acc_tag),
+        "index": hex(acc_idx),
+        "text": text,
+        "miss_type": miss_type.capitalize() if miss_type is not None else "",
+    }
@@ -1,8 +1,13 @@
 import random
-from cache_tables import generate_cache
+from cache_tables import generate_cache, render_tio_sequence
+from variant_pool import load_variant
 
 
 def generate(data):
+    # read the variant from the pre-generated pool when one was built (see variant_pool.py)
+    if load_variant(data, "direct_16", __file__):
+        return
+
     # number of addresses to generate
     NUM_ADDR = 16
     addr_bits = 8
@@ -33,3 +38,8 @@ def generate(data):
         min_hits=1,
         min_miss=1,
     )
+
+
+def render(data, html):
+    # the tag/index explanations of the answer panel are only formatted when it is shown
+    return render_tio_sequence(data, html)
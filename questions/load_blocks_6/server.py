@@ -1,7 +1,12 @@
-from cache_tables import generate_cache
+from cache_tables import generate_cache, render_tio_sequence
+from variant_pool import load_variant
 
 
 def generate(data):
+    # read the variant from the pre-generated pool when one was built (see variant_pool.py)
+    if load_variant(data, "load_blocks_6", __file__):
+        return
+
     # generate_cache(data, answers_name, num_ways,
     #                 index_bits,
     #                 num_addr,
@@ -22,3 +27,8 @@ def generate(data):
         show_valid=True,
         partial_empty=True,
     )
+
+
+def render(data, html):
+    # the tag/index explanations of the answer panel are only formatted when it is shown
+    return render_tio_sequence(data, html)
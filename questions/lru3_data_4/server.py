@@ -1,8 +1,13 @@
-from cache_tables import generate_cache
+from cache_tables import generate_cache, render_tio_sequence
+from variant_pool import load_variant
 import random
 
 
 def generate(data):
+    # read the variant from the pre-generated pool when one was built (see variant_pool.py)
+    if load_variant(data, "lru3_data_4", __file__):
+        return
+
     # generate_cache(data, answers_name, num_ways,
     #                 index_bits,
     #                 num_addr,
@@ -25,3 +30,8 @@ def generate(data):
         data["params"]["index_fixed_width"] = 5
     else:
         data["params"]["index_fixed_width"] = 2
+
+
+def render(data, html):
+    # the tag/index explanations of the answer panel are only formatted when it is shown
+    return render_tio_sequence(data, html)
@@ -1,8 +1,12 @@
-from cache_tables import generate_cache
+from cache_tables import generate_cache, render_tio_sequence
+from variant_pool import load_variant
 import random
 
 
 def generate(data):
+    # read the variant from the pre-generated pool when one was built (see variant_pool.py)
+    if load_variant(data, "writeback", __file__):
+        return data
 
     # generate_cache(data, num_ways, index_bits, num_addr)
     addr_hex_size = random.randint(2, 4)
@@ -24,6 +28,7 @@ def generate(data):
         show_valid=True,
         show_dirty=True,
         partial_empty=True,
+        mem_table="touched",
     )
 
     if data["correct_answers"]["cache_access"][0]["hit"]:
@@ -36,3 +41,8 @@ def generate(data):
         data["correct_answers"]["ans"] = "writeback"
 
     return data
+
+
+def render(data, html):
+    # the tag/index explanations of the answer panel are only formatted when it is shown
+    return render_tio_sequence(data, html)
@@ -1,20 +1,1728 @@
 import random
 import string
 import math
+import hashlib
+import copy
+import functools
+import json
+import os
+import re
+from array import array
+from collections import OrderedDict
 from random import choice
 
+import numpy as np
 
-DATA_MEM = []
-CACHE = []
-VALID = []
 
-def generate_cache(data, answers_name, ways=2, set_bits=1, num_addr=1, block_bits=1, 
-                  addr_bits=5, show_valid=False, empty_cache=False, partial_empty=False, 
-                  base='hex', min_hits=0, min_miss=0, address_list=[], show_dirty = False):
+class LazyMemory:
   '''
-  Utility for generating caches and sequences of access for the pl-cache-table and pl-cache-access-table elements. 
+  Data memory of 2**addr_bits bytes that is never allocated as a whole.
+
+  The value of every byte is derived deterministically from seed (drawn from rng
+  when not given, so it follows the variant seed) and is only computed
+  when the chunk holding it is first read. Blocks loaded into the cache through
+  load() are recorded so that touched_ranges() can export just the part of memory
+  a variant actually used.
+
+  While journal is a list, write() and load() append to it what undo() needs to revert
+  them, so a search can take back a single access without a snapshot of the memory.
+  '''
+
+  CHUNK_BITS = 6
+  CHUNK_SIZE = 2**CHUNK_BITS
+
+  def __init__(self, addr_bits, seed=None, rng=random):
+    if seed is None:
+      seed = rng.getrandbits(64)
+    self.size = 2**addr_bits
+    self.seed = seed
+    self._key = (seed % 2**128).to_bytes(16, 'little')
+    self._chunks = {}
+    self._touched = {}
+    self.journal = None
+
+  def __len__(self):
+    return self.size
+
+  def __getitem__(self, addr):
+    if isinstance(addr, slice):
+      start, stop, step = addr.indices(self.size)
+      return self.read(start, max(stop - start, 0))[::step]
+    if addr < 0 or addr >= self.size:
+      raise IndexError('memory address out of range')
+    return self._chunk(addr >> self.CHUNK_BITS)[addr & (self.CHUNK_SIZE - 1)]
+
+  def _chunk(self, number):
+    chunk = self._chunks.get(number)
+    if chunk is None:
+      chunk = hashlib.blake2b(number.to_bytes(8, 'little'), digest_size=self.CHUNK_SIZE, key=self._key).digest()
+      self._chunks[number] = chunk
+    return chunk
+
+  def read(self, addr, size):
+    ### Returns size bytes starting at addr without recording them as touched
+    out = bytearray()
+    end = addr + size
+    while addr < end:
+      chunk_offset = addr & (self.CHUNK_SIZE - 1)
+      count = min(self.CHUNK_SIZE - chunk_offset, end - addr)
+      out += self._chunk(addr >> self.CHUNK_BITS)[chunk_offset:chunk_offset + count]
+      addr += count
+    return bytes(out)
+
+  def write(self, addr, values):
+    ### Stores the bytes in values starting at addr
+    if self.journal is not None:
+      values = bytes(values)
+      numbers = range(addr >> self.CHUNK_BITS, ((addr + len(values) - 1) >> self.CHUNK_BITS) + 1)
+      unwritten = [number for number in numbers if not isinstance(self._chunks.get(number), bytearray)]
+      self.journal.append((addr, self.read(addr, len(values)), unwritten))
+    for value in values:
+      number = addr >> self.CHUNK_BITS
+      chunk = self._chunk(number)
+      if not isinstance(chunk, bytearray):
+        chunk = bytearray(chunk)
+        self._chunks[number] = chunk
+      chunk[addr & (self.CHUNK_SIZE - 1)] = value
+      addr += 1
+
+  def load(self, addr, size):
+    ### Returns size bytes starting at addr and records them as touched
+    if self.journal is not None:
+      self.journal.append((addr, None, self._touched.get(addr)))
+    self._touched[addr] = max(self._touched.get(addr, 0), size)
+    return self.read(addr, size)
+
+  def snapshot(self):
+    ### Returns the written chunks and the touched ranges (see restore)
+    written = {number: bytes(chunk) for number, chunk in self._chunks.items() if isinstance(chunk, bytearray)}
+    return written, dict(self._touched)
+
+  def restore(self, state):
+    ### Returns the memory to a state returned by snapshot
+    written, touched = state
+    for number, chunk in list(self._chunks.items()):
+      if isinstance(chunk, bytearray) and number not in written:
+        del self._chunks[number]
+    for number, chunk in written.items():
+      self._chunks[number] = bytearray(chunk)
+    self._touched = dict(touched)
+
+  def undo(self, mark):
+    ### Reverts the writes and loads recorded in journal after its first mark entries
+    journal = self.journal
+    self.journal = None
+    while len(journal) > mark:
+      addr, old_values, old_state = journal.pop()
+      if old_values is not None:
+        self.write(addr, old_values)
+        for number in old_state:
+          del self._chunks[number]
+      elif old_state is None:
+        del self._touched[addr]
+      else:
+        self._touched[addr] = old_state
+    self.journal = journal
+
+  def touched_ranges(self):
+    ### Returns the touched addresses as a sorted list of merged [start, end) ranges
+    ranges = []
+    for start in sorted(self._touched):
+      end = start + self._touched[start]
+      if ranges and start <= ranges[-1][1]:
+        ranges[-1][1] = max(ranges[-1][1], end)
+      else:
+        ranges.append([start, end])
+    return ranges
+
+
+class ReplacementPolicy:
+  '''
+  Base class of the replacement policies used by CacheSimulator.
+
+  A policy keeps its own state for every set of the cache. The simulator calls
+  touch() when a way hits, victim() to choose the way replaced on a miss and insert()
+  once the new block is in place. state() returns the state of one set as the list of
+  strings displayed in the replacement column of pl-cache-table, which has
+  state_width entries per set (0 when the policy has no state to display).
+  Random choices are drawn from rng.
+  '''
+
+  name = None
+  label = None
+
+  def __init__(self, cache_sets, ways, rng=random):
+    self.cache_sets = cache_sets
+    self.ways = ways
+    self.rng = rng
+    self.state_width = ways
+
+  def randomize(self, acc_idx):
+    ### Sets a random initial state for set acc_idx
+    pass
+
+  def touch(self, acc_idx, way):
+    ### Records a hit on way
+    pass
+
+  def insert(self, acc_idx, way):
+    ### Records that a new block was placed in way
+    self.touch(acc_idx, way)
+
+  def victim(self, acc_idx):
+    ### Returns the way replaced by the next miss in set acc_idx
+    raise NotImplementedError
+
+  def state(self, acc_idx):
+    return []
+
+  def predict_victim(self, acc_idx):
+    ### Returns the way the next miss in set acc_idx will replace, or None if it cannot be known
+    return self.victim(acc_idx)
+
+  def snapshot(self):
+    ### Returns a copy of the replacement state of every set (see restore)
+    return {key: copy.copy(value) for key, value in vars(self).items() if key != 'rng'}
+
+  def restore(self, state):
+    ### Returns the policy to a state returned by snapshot
+    self.__dict__.update({key: copy.copy(value) for key, value in state.items()})
+
+  def save_set(self, acc_idx):
+    ### Returns what restore_set needs to undo the next updates of set acc_idx. Policies
+    ### whose sets have separate state only copy that set
+    return self.snapshot()
+
+  def restore_set(self, acc_idx, state):
+    ### Returns set acc_idx to a state returned by save_set
+    self.restore(state)
+
+
+class LRUPolicy(ReplacementPolicy):
+  '''
+  True LRU with one age counter per way: a hit stamps the way with a global clock in
+  O(1), and the victim is the way with the oldest stamp.
+  state() lists the ways from least- to most-recently used.
+  '''
+
+  name = 'lru'
+  label = 'LRU FSM'
+
+  def __init__(self, cache_sets, ways, rng=random):
+    super().__init__(cache_sets, ways, rng)
+    self.clock = 0
+    self.stamps = array('Q', range(ways)) * cache_sets
+
+  def randomize(self, acc_idx):
+    lru_list = self.rng.sample(range(self.ways), self.ways)
+    for way in lru_list:
+      self.touch(acc_idx, way)
+
+  def touch(self, acc_idx, way):
+    self.clock += 1
+    self.stamps[acc_idx * self.ways + way] = self.clock
+
+  def victim(self, acc_idx):
+    base = acc_idx * self.ways
+    stamps = self.stamps[base:base + self.ways]
+    return stamps.index(min(stamps))
+
+  def state(self, acc_idx):
+    base = acc_idx * self.ways
+    return [str(way) for way in sorted(range(self.ways), key=lambda way: self.stamps[base + way])]
+
+  def save_set(self, acc_idx):
+    base = acc_idx * self.ways
+    return self.clock, self.stamps[base:base + self.ways]
+
+  def restore_set(self, acc_idx, state):
+    base = acc_idx * self.ways
+    self.clock, self.stamps[base:base + self.ways] = state
+
+
+class FIFOPolicy(ReplacementPolicy):
+  '''
+  FIFO with one ring pointer per set. The pointer names the oldest way, which is
+  replaced by the next miss, so every update is O(1).
+  state() lists the ways from oldest to newest.
+  '''
+
+  name = 'fifo'
+  label = 'FIFO Order'
+
+  def __init__(self, cache_sets, ways, rng=random):
+    super().__init__(cache_sets, ways, rng)
+    self.pointers = array('H', [0]) * cache_sets
+
+  def randomize(self, acc_idx):
+    self.pointers[acc_idx] = self.rng.randrange(self.ways)
+
+  def touch(self, acc_idx, way):
+    pass
+
+  def insert(self, acc_idx, way):
+    if way == self.pointers[acc_idx]:
+      self.pointers[acc_idx] = (way + 1) % self.ways
+
+  def victim(self, acc_idx):
+    return self.pointers[acc_idx]
+
+  def state(self, acc_idx):
+    pointer = self.pointers[acc_idx]
+    return [str((pointer + x) % self.ways) for x in range(self.ways)]
+
+  def save_set(self, acc_idx):
+    return self.pointers[acc_idx]
+
+  def restore_set(self, acc_idx, state):
+    self.pointers[acc_idx] = state
+
+
+class TreePLRUPolicy(ReplacementPolicy):
+  '''
+  Tree pseudo-LRU with ways - 1 bits per set stored as one integer. Node n has
+  children 2n + 1 and 2n + 2, and a bit of 0 (1) means the victim is in the left
+  (right) subtree. A hit flips the log2(ways) bits on its path to point away from it.
+  state() lists the bits in node order. ways must be a power of 2.
+  '''
+
+  name = 'plru'
+  label = 'PLRU Bits'
+
+  def __init__(self, cache_sets, ways, rng=random):
+    if ways & (ways - 1) != 0:
+      raise ValueError('Tree PLRU needs a power of 2 number of ways')
+    super().__init__(cache_sets, ways, rng)
+    self.state_width = ways - 1
+    self.levels = ways.bit_length() - 1
+    self.bits = [0] * cache_sets
+
+  def randomize(self, acc_idx):
+    self.bits[acc_idx] = self.rng.getrandbits(self.ways - 1) if self.ways > 1 else 0
+
+  def touch(self, acc_idx, way):
+    bits = self.bits[acc_idx]
+    node = 0
+    for level in range(self.levels - 1, -1, -1):
+      if (way >> level) & 1:
+        bits &= ~(1 << node)
+        node = 2 * node + 2
+      else:
+        bits |= 1 << node
+        node = 2 * node + 1
+    self.bits[acc_idx] = bits
+
+  def victim(self, acc_idx):
+    bits = self.bits[acc_idx]
+    node = 0
+    way = 0
+    for level in range(self.levels):
+      bit = (bits >> node) & 1
+      way = 2 * way + bit
+      node = 2 * node + 1 + bit
+    return way
+
+  def state(self, acc_idx):
+    bits = self.bits[acc_idx]
+    return [str((bits >> node) & 1) for node in range(self.ways - 1)]
+
+  def save_set(self, acc_idx):
+    return self.bits[acc_idx]
+
+  def restore_set(self, acc_idx, state):
+    self.bits[acc_idx] = state
+
+
+class RandomPolicy(ReplacementPolicy):
+  '''
+  Random replacement. It keeps no state, so pl-cache-table shows no replacement column.
+  '''
+
+  name = 'random'
+  label = None
+
+  def __init__(self, cache_sets, ways, rng=random):
+    super().__init__(cache_sets, ways, rng)
+    self.state_width = 0
+
+  def victim(self, acc_idx):
+    return self.rng.randrange(self.ways)
+
+  def predict_victim(self, acc_idx):
+    return None
+
+  def save_set(self, acc_idx):
+    return None
+
+  def restore_set(self, acc_idx, state):
+    pass
+
+
+class LFUPolicy(ReplacementPolicy):
+  '''
+  LFU with one access counter per way. A new block starts with a count of 1 and the
+  victim is the way with the lowest count (the lowest way number on ties).
+  state() lists the count of every way.
+  '''
+
+  name = 'lfu'
+  label = 'LFU Counts'
+
+  def __init__(self, cache_sets, ways, rng=random):
+    super().__init__(cache_sets, ways, rng)
+    self.counts = array('L', [1]) * (cache_sets * ways)
+
+  def randomize(self, acc_idx):
+    for way in range(self.ways):
+      self.counts[acc_idx * self.ways + way] = self.rng.randint(1, 3)
+
+  def touch(self, acc_idx, way):
+    self.counts[acc_idx * self.ways + way] += 1
+
+  def insert(self, acc_idx, way):
+    self.counts[acc_idx * self.ways + way] = 1
+
+  def victim(self, acc_idx):
+    base = acc_idx * self.ways
+    counts = self.counts[base:base + self.ways]
+    return counts.index(min(counts))
+
+  def state(self, acc_idx):
+    base = acc_idx * self.ways
+    return [str(count) for count in self.counts[base:base + self.ways]]
+
+  def save_set(self, acc_idx):
+    base = acc_idx * self.ways
+    return self.counts[base:base + self.ways]
+
+  def restore_set(self, acc_idx, state):
+    base = acc_idx * self.ways
+    self.counts[base:base + self.ways] = state
+
+
+REPLACEMENT_POLICIES = {
+  policy.name: policy
+  for policy in (LRUPolicy, FIFOPolicy, TreePLRUPolicy, RandomPolicy, LFUPolicy)
+}
+
+
+class AddressLayout:
+  '''
+  Splits the addresses of one cache configuration into tag, set index and block offset.
+
+  The shifts, masks and format specs are computed once, when the layout is created; use
+  address_layout() to share one layout between all the simulators and questions with the
+  same addr_bits, set_bits and block_bits. decode and encode convert one address,
+  decode_array and encode_array convert NumPy arrays of addresses. block_address and
+  split_block convert between (tag, index) and the block address (the address without
+  its offset).
+
+  format_address, format_tag and feedback build the strings shown to students, in base
+  'hex' or 'bin'. The feedback templates (the tag / index / offset explanation of every
+  access) are also built once, so formatting an access only fills in its numbers.
+  '''
+
+  def __init__(self, addr_bits, set_bits, block_bits):
+    self.addr_bits = addr_bits
+    self.set_bits = set_bits
+    self.block_bits = block_bits
+    self.tag_bits = addr_bits - set_bits - block_bits
+    self.cache_sets = 2**set_bits
+    self.block_size = 2**block_bits
+    self.tag_hex_size = math.ceil(self.tag_bits / 4)
+    self.max_tag = 2**self.tag_bits - 1
+
+    self.tag_shift = set_bits + block_bits
+    self.index_mask = self.cache_sets - 1
+    self.offset_mask = self.block_size - 1
+    self._np_block_bits = np.uint64(block_bits)
+    self._np_set_bits = np.uint64(set_bits)
+    self._np_tag_shift = np.uint64(self.tag_shift)
+    self._np_index_mask = np.uint64(self.index_mask)
+    self._np_offset_mask = np.uint64(self.offset_mask)
+
+    # the binary address is grouped by 4 bits, so its width counts the separators
+    self._address_formats = {
+      'hex': f'#0{math.ceil(addr_bits / 4) + 2}x',
+      'bin': f'0{addr_bits + (addr_bits - 1) // 4}_b',
+    }
+    self.tag_formats = {
+      'hex': f'#0{self.tag_hex_size + 2}x',
+      'bin': f'0{self.tag_bits}b',
+    }
+    block_size = self.block_size
+    cache_sets = self.cache_sets
+    if cache_sets > 1:
+      self._feedback_formats = {
+        'hex': {
+          'tag': f'<code>{{address}}</code> / {block_size} / {cache_sets} = {{tag:#x}}',
+          'index': f'<code>{{address}}</code> / {block_size} % {cache_sets} = {{index:#x}}',
+          'offset': f'<code>{{address}}</code> % {block_size} = {{offset:#x}}',
+        },
+        'bin': {
+          'tag': f'Tag = {{tag:0{self.tag_bits}b}}',
+          'index': f'Index = {{index:0{set_bits}b}}',
+          'offset': f'Offset = {{offset:0{block_bits}b}}',
+        },
+      }
+    else:
+      self._feedback_formats = {
+        'hex': {
+          'tag': f'<code>{{address}}</code> / {block_size} = {{tag:#x}}',
+          'offset': f'<code>{{address}}</code> % {block_size} = {{offset:#x}}',
+        },
+        'bin': {
+          'tag': f'Tag = {{tag:0{self.tag_bits}b}}',
+          'offset': f'Offset = {{offset:0{block_bits}b}}',
+        },
+      }
+
+  def decode(self, addr):
+    ### Splits addr into (tag, index, offset)
+    return addr >> self.tag_shift, (addr >> self.block_bits) & self.index_mask, addr & self.offset_mask
+
+  def encode(self, acc_tag, acc_idx, acc_off=0):
+    ### Builds the address of offset acc_off in the block with tag acc_tag in set acc_idx
+    return (((acc_tag << self.set_bits) | acc_idx) << self.block_bits) | acc_off
+
+  def block_address(self, acc_tag, acc_idx):
+    ### Block address (address >> block_bits) of the block with tag acc_tag in set acc_idx
+    return (acc_tag << self.set_bits) | acc_idx
+
+  def split_block(self, block_addr):
+    ### Splits a block address into (tag, index)
+    return block_addr >> self.set_bits, block_addr & self.index_mask
+
+  def decode_array(self, addresses):
+    ### Splits a NumPy array of addresses into uint64 arrays of tags, indexes and offsets
+    addresses = np.asarray(addresses, dtype=np.uint64)
+    return (
+      addresses >> self._np_tag_shift,
+      (addresses >> self._np_block_bits) & self._np_index_mask,
+      addresses & self._np_offset_mask,
+    )
+
+  def encode_array(self, tags, indexes, offsets=0):
+    ### Inverse of decode_array: builds a uint64 array of addresses
+    block_addrs = self.block_address_array(tags, indexes)
+    return (block_addrs << self._np_block_bits) | np.asarray(offsets, dtype=np.uint64)
+
+  def block_address_array(self, tags, indexes):
+    ### Array version of block_address
+    tags = np.asarray(tags, dtype=np.uint64)
+    return (tags << self._np_set_bits) | np.asarray(indexes, dtype=np.uint64)
+
+  def split_block_array(self, block_addrs):
+    ### Array version of split_block
+    block_addrs = np.asarray(block_addrs, dtype=np.uint64)
+    return block_addrs >> self._np_set_bits, block_addrs & self._np_index_mask
+
+  def format_address(self, addr, base):
+    ### Formats an address as it is shown in the access tables
+    str_address = format(addr, self._address_formats[base])
+    if base == 'hex':
+      return str_address
+    return '0b' + str_address.replace('_', ' ')
+
+  def format_tag(self, acc_tag, base):
+    ### Formats a tag as it is shown in pl-cache-table
+    return format(acc_tag, self.tag_formats[base])
+
+  def feedback(self, str_address, acc_tag, acc_idx, acc_off, base):
+    ### Explains how the address formatted as str_address splits into its tag, index and offset.
+    ### Returns a dictionary with the 'tag', 'index' (only with more than one set) and 'offset' texts
+    return {
+      key: text.format(address=str_address, tag=acc_tag, index=acc_idx, offset=acc_off)
+      for key, text in self._feedback_formats[base].items()
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def address_layout(addr_bits, set_bits, block_bits):
+  ### Shared AddressLayout of a configuration. The layouts are immutable, so one instance is reused
+  return AddressLayout(addr_bits, set_bits, block_bits)
+
+
+class CacheSimulator:
+  '''
+  Self-contained cache simulator used by generate_cache.
+
+  Every instance owns its data memory, its cache sets (tags, data blocks, valid and
+  dirty bits) and the LRU state of each set. A new simulator is created for every
+  call to generate_cache, so no state is shared between variants generated by the
+  same process.
+
+  The state of the cache is kept in flat arrays indexed by set * ways + way:
+  tags (-1 marks a blank tag), valid and dirty. data holds the bytes of every
+  block as one buffer indexed by (set * ways + way) * block_size + offset.
+  The arrays are only converted to strings by stringify_cache. The replacement
+  state is owned by policy, one of the REPLACEMENT_POLICIES.
+
+  To keep the cost of an access independent of the size of the cache, every set has a
+  tag -> way dictionary of its valid blocks (tag_ways), and the numbers of all valid and
+  invalid blocks are kept in two pools (valid_blocks, invalid_blocks). Both are updated
+  incrementally whenever a block is filled or invalidated.
+
+  Stores follow write_hit ('back' marks the block dirty, 'through' also writes the byte
+  to memory) and write_miss ('allocate' loads the block first, 'no-allocate' writes the
+  byte straight to memory). Memory traffic is counted in traffic: the number of fills and
+  writebacks, and the bytes moved by fills, writebacks and write-throughs.
+
+  All random choices (initial contents, replacement, generated accesses) are drawn from
+  rng, the random module by default or a random.Random to make a variant reproducible.
+  '''
+
+  def __init__(self, memory, ways=2, set_bits=1, block_bits=1, addr_bits=5, policy='lru',
+               write_hit='back', write_miss='allocate', rng=random):
+    self.memory = memory
+    self.rng = rng
+    self.ways = ways
+    self.set_bits = set_bits
+    self.block_bits = block_bits
+    self.addr_bits = addr_bits
+
+    self.layout = address_layout(addr_bits, set_bits, block_bits)
+    self.cache_sets = self.layout.cache_sets
+    self.block_size = self.layout.block_size
+    self.tag_bits = self.layout.tag_bits
+    self.tag_hex_size = self.layout.tag_hex_size
+    self.max_tag = self.layout.max_tag
+
+    num_blocks = self.cache_sets * ways
+    self.tags = array('q', [-1]) * num_blocks
+    self.valid = bytearray(num_blocks)
+    self.dirty = bytearray(num_blocks)
+    if policy not in REPLACEMENT_POLICIES:
+      raise ValueError(
+          f'policy must be one of {", ".join(REPLACEMENT_POLICIES)}'
+      )
+    self.policy = REPLACEMENT_POLICIES[policy](self.cache_sets, ways, rng)
+    self.data = bytearray(num_blocks * self.block_size)
+
+    if write_hit not in ('back', 'through'):
+      raise ValueError(
+          'write_hit must be "back" or "through"'
+      )
+    if write_miss not in ('allocate', 'no-allocate'):
+      raise ValueError(
+          'write_miss must be "allocate" or "no-allocate"'
+      )
+    self.write_hit = write_hit
+    self.write_miss = write_miss
+    self.traffic = {
+      'fills': 0,
+      'writebacks': 0,
+      'fill_bytes': 0,
+      'writeback_bytes': 0,
+      'write_through_bytes': 0,
+    }
+
+    self.tag_ways = [{} for x in range(self.cache_sets)]
+    self.valid_blocks = []
+    self.invalid_blocks = list(range(num_blocks))
+    self._pool_pos = array('q', range(num_blocks))
+
+  def fill(self, show_valid=False, empty_cache=False, partial_empty=False):
+    ### Generates the initial contents of every set in the cache
+    ways = self.ways
+    block_size = self.block_size
+    max_tag = self.max_tag
+    rng = self.rng
+
+    for x in range(self.cache_sets):
+      base = x * ways
+      for way in range(ways):
+        block = base + way
+        if empty_cache and show_valid:
+          self.valid[block] = 0
+          self.dirty[block] = 0
+          self.tags[block] = rng.randint(0, max_tag)
+          for offset in range(block_size):
+            self.data[block * block_size + offset] = rng.randint(0,255)
+        elif empty_cache:
+          self.valid[block] = 0
+          self.dirty[block] = 0
+          self.tags[block] = -1
+        elif partial_empty and show_valid:
+          temp = rng.randint(0,1)
+          self.valid[block] = temp
+          if temp == 0:
+            self.dirty[block] = 0
+          else:
+            tempd = rng.randint(0,3)
+            if tempd == 0:
+              self.dirty[block] = 0
+            else:
+              self.dirty[block] = 1
+          self.tags[block] = rng.randint(0, max_tag)
+          if temp == 0:
+            for offset in range(block_size):
+              self.data[block * block_size + offset] = rng.randint(0,255)
+          else:
+            if way > 0:
+              while self.tags[block] in self.tags[base:block]:
+                self.tags[block] = rng.randint(0, max_tag)
+            self.load_block(x, way)
+        else:
+          self.valid[block] = 1
+          self.dirty[block] = rng.randint(0,1)
+          self.tags[block] = rng.randint(0, max_tag)
+          if way > 0:
+            while self.tags[block] in self.tags[base:block]:
+              self.tags[block] = rng.randint(0, max_tag)
+          self.load_block(x, way)
+
+      # generate replacement state (LRU FSM)
+      self.policy.randomize(x)
+
+    self._build_index()
+
+  def _build_index(self):
+    ### Rebuilds the per-set tag dictionaries and the valid/invalid pools from the arrays
+    ways = self.ways
+    self.tag_ways = [{} for x in range(self.cache_sets)]
+    self.valid_blocks = []
+    self.invalid_blocks = []
+    for block in range(self.cache_sets * ways):
+      if self.valid[block] == 1:
+        self.tag_ways[block // ways][self.tags[block]] = block % ways
+        pool = self.valid_blocks
+      else:
+        pool = self.invalid_blocks
+      self._pool_pos[block] = len(pool)
+      pool.append(block)
+
+  def snapshot(self):
+    ### Returns a copy of the whole simulator state, including its memory (see restore)
+    return (array('q', self.tags), bytes(self.valid), bytes(self.dirty), bytes(self.data),
+            self.policy.snapshot(), dict(self.traffic), self.memory.snapshot())
+
+  def restore(self, state):
+    ### Returns the simulator to a state returned by snapshot. The arrays are updated in place
+    tags, valid, dirty, data, policy, traffic, memory = state
+    self.tags[:] = tags
+    self.valid[:] = valid
+    self.dirty[:] = dirty
+    self.data[:] = data
+    self.policy.restore(policy)
+    self.traffic.update(traffic)
+    self.memory.restore(memory)
+    self._build_index()
+
+  def save_set(self, acc_idx):
+    ### Returns what restore_set needs to undo the next access to set acc_idx: the blocks and
+    ### replacement state of the set, the traffic counters, and the length of the memory journal
+    ### (see LazyMemory.journal, which must be on for the memory written by the access to be restored)
+    start = acc_idx * self.ways
+    end = start + self.ways
+    block_size = self.block_size
+    journal = self.memory.journal
+    return (acc_idx, self.tags[start:end], bytes(self.valid[start:end]), bytes(self.dirty[start:end]),
+            bytes(self.data[start * block_size:end * block_size]), self.policy.save_set(acc_idx),
+            dict(self.traffic), None if journal is None else len(journal))
+
+  def restore_set(self, state):
+    ### Returns a set to a state returned by save_set in O(ways), keeping tag_ways and the pools up to date
+    acc_idx, tags, valid, dirty, data, policy, traffic, mark = state
+    ways = self.ways
+    start = acc_idx * ways
+    for way in range(ways):
+      block = start + way
+      if self.valid[block] != valid[way]:
+        if valid[way] == 1:
+          self._move_block(block, self.invalid_blocks, self.valid_blocks)
+        else:
+          self._move_block(block, self.valid_blocks, self.invalid_blocks)
+    self.tags[start:start + ways] = tags
+    self.valid[start:start + ways] = valid
+    self.dirty[start:start + ways] = dirty
+    self.data[start * self.block_size:(start + ways) * self.block_size] = data
+    self.tag_ways[acc_idx] = {tags[way]: way for way in range(ways) if valid[way] == 1}
+    self.policy.restore_set(acc_idx, policy)
+    self.traffic.update(traffic)
+    if mark is not None:
+      self.memory.undo(mark)
+
+  def _move_block(self, block, source, target):
+    ### Moves a block number between the valid and invalid pools in O(1)
+    pos = self._pool_pos[block]
+    last = source.pop()
+    if last != block:
+      source[pos] = last
+      self._pool_pos[last] = pos
+    self._pool_pos[block] = len(target)
+    target.append(block)
+
+  def set_block(self, acc_idx, way, acc_tag, valid=1):
+    ### Stores acc_tag in (acc_idx, way) and keeps tag_ways and the block pools up to date
+    block = acc_idx * self.ways + way
+    tag_ways = self.tag_ways[acc_idx]
+    if self.valid[block] == 1:
+      if tag_ways.get(self.tags[block]) == way:
+        del tag_ways[self.tags[block]]
+      if valid == 0:
+        self._move_block(block, self.valid_blocks, self.invalid_blocks)
+    elif valid == 1:
+      self._move_block(block, self.invalid_blocks, self.valid_blocks)
+    self.tags[block] = acc_tag
+    self.valid[block] = valid
+    if valid == 1:
+      tag_ways[acc_tag] = way
+
+  def load_block(self, acc_idx, way):
+    ### Copies the memory block addressed by the tag stored in (acc_idx, way) into the cache
+    block_size = self.block_size
+    addr = (self.tags[acc_idx * self.ways + way] * self.cache_sets + acc_idx) * block_size
+    start = (acc_idx * self.ways + way) * block_size
+    self.data[start:start + block_size] = self.memory.load(addr, block_size)
+
+  def read_byte(self, acc_idx, way, offset):
+    ### Returns the byte stored at offset of the block in (acc_idx, way) as a string
+    return str(self.data[(acc_idx * self.ways + way) * self.block_size + offset])
+
+  def lookup(self, acc_tag, acc_idx):
+    ### Returns the way holding acc_tag in set acc_idx, or None on a miss
+    return self.tag_ways[acc_idx].get(acc_tag)
+
+  def update_cache(self, acc_tag, acc_idx, addr):
+    ### Updates the contents of the cache given an address, tag, and index (as a load)
+    return self.access(acc_tag, acc_idx, addr % self.block_size)[2]
+
+  def access(self, acc_tag, acc_idx, acc_off=0, store=False, value=0):
+    ### Simulates a load, or a store of value, to the byte at acc_off of block acc_tag in set acc_idx.
+    ### Returns (hit, way, writeback, fill, memory_write); way is None when a store misses without allocating
+    way = self.tag_ways[acc_idx].get(acc_tag)
+    hit = way is not None
+    writeback = False
+    if hit:
+      self.policy.touch(acc_idx, way)
+    elif store and self.write_miss == 'no-allocate':
+      self.write_memory(acc_tag, acc_idx, acc_off, value)
+      return hit, None, writeback, False, True
+    else:
+      way, writeback = self.replace_block(acc_tag, acc_idx)
+    if not store:
+      return hit, way, writeback, not hit, False
+
+    block = acc_idx * self.ways + way
+    self.data[block * self.block_size + acc_off] = value
+    if self.write_hit == 'back':
+      self.dirty[block] = 1
+      return hit, way, writeback, not hit, False
+    self.write_memory(acc_tag, acc_idx, acc_off, value)
+    return hit, way, writeback, not hit, True
+
+  def write_memory(self, acc_tag, acc_idx, acc_off, value):
+    ### Writes one byte straight to memory (write-through or write-no-allocate)
+    self.memory.write(self.layout.encode(acc_tag, acc_idx, acc_off), (value,))
+    self.traffic['write_through_bytes'] += 1
+
+  def replace_block(self, acc_tag, acc_idx):
+    ### Loads the block of acc_tag into the victim way of set acc_idx after a miss.
+    ### Returns the replaced way and whether a dirty block had to be written back
+    replaced_way = self.policy.victim(acc_idx)
+    block = acc_idx * self.ways + replaced_way
+    writeback = self.valid[block] == 1 and self.dirty[block] == 1
+    if writeback:
+      block_size = self.block_size
+      addr = (self.tags[block] * self.cache_sets + acc_idx) * block_size
+      self.memory.write(addr, self.data[block * block_size:(block + 1) * block_size])
+      self.traffic['writebacks'] += 1
+      self.traffic['writeback_bytes'] += block_size
+    self.traffic['fills'] += 1
+    self.traffic['fill_bytes'] += self.block_size
+    self.set_block(acc_idx, replaced_way, acc_tag)
+    self.dirty[block] = 0
+    self.load_block(acc_idx, replaced_way)
+    self.policy.insert(acc_idx, replaced_way)
+    return replaced_way, writeback
+
+  def install(self, acc_tag, acc_idx, values, dirty=0):
+    ### Places a block holding values in set acc_idx, using an invalid way before asking the policy for a victim.
+    ### Returns the way and the evicted (tag, bytes, dirty) block, or None when no valid block was evicted
+    block_size = self.block_size
+    base = acc_idx * self.ways
+    way = self.valid[base:base + self.ways].find(0)
+    victim = None
+    if way == -1:
+      way = self.policy.victim(acc_idx)
+      block = base + way
+      victim = (self.tags[block], bytes(self.data[block * block_size:(block + 1) * block_size]), self.dirty[block])
+    block = base + way
+    self.set_block(acc_idx, way, acc_tag)
+    self.data[block * block_size:(block + 1) * block_size] = values
+    self.dirty[block] = dirty
+    self.policy.insert(acc_idx, way)
+    self.traffic['fills'] += 1
+    self.traffic['fill_bytes'] += block_size
+    return way, victim
+
+  def invalidate(self, acc_tag, acc_idx):
+    ### Invalidates the block of acc_tag in set acc_idx.
+    ### Returns its (bytes, dirty), or None if the block was not in the cache
+    way = self.tag_ways[acc_idx].get(acc_tag)
+    if way is None:
+      return None
+    block = acc_idx * self.ways + way
+    copy = (bytes(self.data[block * self.block_size:(block + 1) * self.block_size]), self.dirty[block])
+    self.set_block(acc_idx, way, acc_tag, valid=0)
+    self.dirty[block] = 0
+    return copy
+
+  def stringify_cache(self, base):
+    ### converts the cache to a dictionary of strings to be used by pl-cache-table
+    ways = self.ways
+    block_size = self.block_size
+    tag_format = self.layout.tag_formats[base]
+    str_cache = []
+    for x in range(self.cache_sets):
+      tags = []
+      blocks = []
+      for block in range(x * ways, (x + 1) * ways):
+        if self.tags[block] != -1:
+          tags.append(format(self.tags[block], tag_format))
+          start = block * block_size
+          blocks.append([str(byte) for byte in self.data[start:start + block_size]])
+        else:
+          tags.append('')
+          blocks.append([''] * block_size)
+      lru = self.policy.state(x)
+      valid = [str(bit) for bit in self.valid[x * ways:(x + 1) * ways]]
+      dirty = [str(bit) for bit in self.dirty[x * ways:(x + 1) * ways]]
+
+      str_cache.append({'tags': tags, 'lru': lru, 'blocks': blocks, 'valid': valid, 'dirty':dirty})
+
+    return str_cache
+
+  def sample_miss_tag(self, acc_idx):
+    ### Returns a tag drawn uniformly from the tags that are not valid in set acc_idx
+    resident = self.tag_ways[acc_idx]
+    num_tags = self.max_tag + 1
+    if len(resident) >= num_tags:
+      raise ValueError(
+          f'Every tag is already in set {acc_idx}, so no access to it can miss. Use more addr_bits'
+      )
+    if 2 * len(resident) >= num_tags:
+      # the tag space is small enough to list the candidates (at most 2 * ways tags)
+      return self.rng.choice([tag for tag in range(num_tags) if tag not in resident])
+    # rejection sampling: every draw is accepted with probability > 1/2
+    acc_tag = self.rng.randint(0, self.max_tag)
+    while acc_tag in resident:
+      acc_tag = self.rng.randint(0, self.max_tag)
+    return acc_tag
+
+  def determine_block(self, hit):
+    ### Chooses the set, tag, and way of the next access so that it results in a hit or a miss
+    ways = self.ways
+    valid_blocks = self.valid_blocks
+    invalid_blocks = self.invalid_blocks
+
+    if hit:
+      acc_idx, way = divmod(self.rng.choice(valid_blocks), ways)
+      acc_tag = self.tags[acc_idx * ways + way]
+
+    elif invalid_blocks == []:
+      acc_idx, way = divmod(self.rng.choice(valid_blocks), ways)
+      acc_tag = self.sample_miss_tag(acc_idx)
+    else:
+      access_empty = self.rng.choice([True, False])
+      if valid_blocks == [] or access_empty:
+        acc_idx, way = divmod(self.rng.choice(invalid_blocks), ways)
+        acc_tag = self.tags[acc_idx * ways + way]
+        if acc_tag == -1 or acc_tag in self.tag_ways[acc_idx]:
+          # a blank tag, or a stale tag that is also valid in another way, would not miss
+          acc_tag = self.sample_miss_tag(acc_idx)
+      else:
+        acc_idx, way = divmod(self.rng.choice(valid_blocks), ways)
+        acc_tag = self.sample_miss_tag(acc_idx)
+
+    return acc_idx, acc_tag, way
+
+
+class MissClassifier:
+  '''
+  Classifies the misses of a simulator as compulsory, capacity or conflict misses.
+
+  A miss is compulsory when its block was never in the cache before (neither in the
+  initial contents nor accessed earlier), a capacity miss when it would also miss in a
+  fully-associative LRU cache with as many blocks as the simulated one (the shadow
+  cache), and a conflict miss otherwise. The classifier must see every access, hits
+  included, in order.
+  '''
+
+  MISS_TYPES = ('compulsory', 'capacity', 'conflict')
+
+  def __init__(self, sim):
+    self.capacity = sim.cache_sets * sim.ways
+    self.seen = set()
+    self.shadow = OrderedDict()
+    for block in range(self.capacity):
+      if sim.valid[block] == 1:
+        block_addr = sim.layout.block_address(sim.tags[block], block // sim.ways)
+        self.seen.add(block_addr)
+        self.shadow[block_addr] = None
+
+  def classify(self, block_addr, hit):
+    ### Records an access to block_addr and returns its miss type, or None for a hit
+    if hit:
+      miss_type = None
+    elif block_addr not in self.seen:
+      miss_type = 'compulsory'
+    elif block_addr not in self.shadow:
+      miss_type = 'capacity'
+    else:
+      miss_type = 'conflict'
+    self.seen.add(block_addr)
+    if block_addr in self.shadow:
+      self.shadow.move_to_end(block_addr)
+    else:
+      self.shadow[block_addr] = None
+      if len(self.shadow) > self.capacity:
+        self.shadow.popitem(last=False)
+    return miss_type
+
+  def classify_trace(self, block_addrs, hits):
+    ### Classifies a whole trace given its block addresses and hits
+    return [self.classify(block_addr, hit) for block_addr, hit in zip(block_addrs, hits)]
+
+  def snapshot(self):
+    return set(self.seen), OrderedDict(self.shadow)
+
+  def restore(self, state):
+    self.seen = set(state[0])
+    self.shadow = OrderedDict(state[1])
+
+  def save(self, block_addr):
+    ### Returns what undo needs to revert the next classify of block_addr
+    position = None
+    if block_addr in self.shadow:
+      position = list(self.shadow).index(block_addr)
+    return block_addr, block_addr in self.seen, position, next(iter(self.shadow), None)
+
+  def undo(self, state):
+    ### Reverts the classify of block_addr made after save returned state
+    block_addr, seen, position, oldest = state
+    if not seen:
+      self.seen.discard(block_addr)
+    if position is None:
+      del self.shadow[block_addr]
+      if oldest is not None and oldest not in self.shadow:
+        # the access pushed the oldest block out of the shadow cache
+        self.shadow[oldest] = None
+        self.shadow.move_to_end(oldest, last=False)
+    elif position < len(self.shadow) - 1:
+      blocks = list(self.shadow)
+      blocks.insert(position, blocks.pop())
+      self.shadow = OrderedDict.fromkeys(blocks)
+
+
+class AccessSearch:
+  '''
+  Pruned depth-first search for a sequence of num_addr accesses to sim that satisfies:
+    hits: the exact number of hits (None for any number), and at least min_hits hits
+      and min_miss misses
+    miss_types: the minimum number of misses of each type, e.g. {'conflict': 1}
+      (see MissClassifier)
+    writebacks: the exact number of dirty blocks written back (None for any number)
+    min_sets: the minimum number of different sets accessed
+
+  Every access is simulated on sim and taken back when its branch is a dead end: only the
+  set it used, the traffic counters and the memory it wrote are saved before it (see
+  CacheSimulator.save_set and LazyMemory.journal), and the classifier reverts its own update
+  (MissClassifier.undo). A branch is pruned as soon as the remaining accesses cannot make up
+  for the missing hits, misses, writebacks or sets. The misses counted include those needed to
+  overflow the shadow cache before the first capacity miss, and the writebacks are bounded by
+  the dirty blocks when no access can dirty more. Constraint sets that fail these bounds from
+  the start are rejected before searching.
+
+  Without address_list, the first candidate of every position is the one generate_cache
+  has always drawn: determine_block() for the hit/miss wanted by pattern, followed by a
+  random offset and operation. A sequence that needs no backtracking is thus the same as
+  before. The other candidates are hits on resident blocks, and misses on new tags, invalid
+  blocks and blocks that were in the cache before. Misses are ranked by the miss type and
+  writeback they would cause, so the ones the constraints still need come first: blocks
+  evicted from the cache for conflict and capacity misses, misses that evict the oldest block
+  of the shadow cache to set up a capacity miss, and misses whose victim is dirty (or clean)
+  to reach the number of writebacks.
+
+  With address_list (and ops/values), the search repairs the given accesses instead:
+  every position tries its own address first, then other blocks with the same offset.
+
+  The search gives up with a ValueError after max_nodes simulated accesses, so it always
+  returns in bounded time.
+  '''
+
+  def __init__(self, sim, num_addr, hits=None, min_hits=0, min_miss=0, miss_types=None,
+               writebacks=None, min_sets=0, store_ratio=0, pattern=None, address_list=None,
+               ops=None, values=None, max_nodes=20000):
+    self.sim = sim
+    self.num_addr = num_addr
+    self.hits = hits
+    self.min_hits = min_hits
+    self.min_miss = min_miss
+    self.miss_types = dict(miss_types or {})
+    for miss_type in self.miss_types:
+      if miss_type not in MissClassifier.MISS_TYPES:
+        raise ValueError(
+            f'miss_types keys must be in {", ".join(MissClassifier.MISS_TYPES)}'
+        )
+    self.writebacks = writebacks
+    self.min_sets = min(min_sets, sim.cache_sets)
+    self.store_ratio = store_ratio
+    self.pattern = pattern
+    self.address_list = address_list
+    may_store = store_ratio > 0
+    if address_list is not None:
+      self.stores, self.values = trace_stores(num_addr, ops, values, sim.rng)
+      self.stores = self.stores.tolist()
+      self.values = self.values.tolist()
+      may_store = any(self.stores)
+    # whether an access can make a block dirty (otherwise only the initial dirty blocks are written back)
+    self.can_dirty = may_store and sim.write_hit == 'back'
+    self.max_nodes = max_nodes
+
+  def run(self):
+    ### Returns the list of accesses found, one dictionary per access (see access_record)
+    sim = self.sim
+    self.classifier = MissClassifier(sim)
+    self.nodes = 0
+    self.accesses = []
+    self.num_hits = 0
+    self.num_misses = 0
+    self.num_writebacks = 0
+    self.type_counts = dict.fromkeys(MissClassifier.MISS_TYPES, 0)
+    self.set_counts = {}
+    if not self._feasible(0):
+      raise ValueError(
+          f'No sequence of {self.num_addr} accesses can satisfy the constraints on this cache'
+      )
+    sim.memory.journal = []
+    try:
+      found = self._search(0)
+    finally:
+      sim.memory.journal = None
+    if not found:
+      raise ValueError(
+          f'No sequence of {self.num_addr} accesses satisfies the constraints on this cache'
+      )
+    return self.accesses
+
+  def satisfied(self, hits, miss_types, writebacks, indexes):
+    ### Returns whether a whole simulated trace meets the constraints
+    self.classifier = MissClassifier(self.sim)
+    self.num_hits = sum(hits)
+    self.num_misses = len(hits) - self.num_hits
+    self.num_writebacks = sum(writebacks)
+    self.type_counts = dict.fromkeys(MissClassifier.MISS_TYPES, 0)
+    for miss_type in miss_types:
+      if miss_type is not None:
+        self.type_counts[miss_type] += 1
+    self.set_counts = dict.fromkeys(indexes, 1)
+    return self._feasible(self.num_addr)
+
+  def _feasible(self, depth):
+    ### Returns whether the accesses after depth can still meet every constraint
+    remaining = self.num_addr - depth
+    need_hits = self.min_hits - self.num_hits
+    need_misses = self.min_miss - self.num_misses
+    if self.hits is not None:
+      if self.num_hits > self.hits:
+        return False
+      need_hits = max(need_hits, self.hits - self.num_hits)
+      need_misses = max(need_misses, self.num_addr - self.hits - self.num_misses)
+    need_misses = max(need_misses, self._typed_misses())
+    need_hits = max(need_hits, 0)
+    if need_hits + max(need_misses, 0) > remaining:
+      return False
+    if self.writebacks is not None:
+      need_writebacks = self.writebacks - self.num_writebacks
+      if need_writebacks < 0 or need_writebacks > remaining - need_hits:
+        return False
+      if need_writebacks > 0 and not self.can_dirty:
+        sim = self.sim
+        if need_writebacks > sum(sim.dirty[block] for block in sim.valid_blocks):
+          return False
+    return self.min_sets - len(self.set_counts) <= remaining
+
+  def _typed_misses(self):
+    ### Returns how many more misses miss_types needs at least. The first capacity miss needs a
+    ### block that has left the shadow cache, so the compulsory misses that overflow it come first
+    if not self.miss_types:
+      return 0
+    compulsory, capacity, conflict = (
+      max(0, self.miss_types.get(miss_type, 0) - self.type_counts[miss_type])
+      for miss_type in MissClassifier.MISS_TYPES
+    )
+    classifier = self.classifier
+    extra = 0
+    if capacity > 0:
+      if len(classifier.seen) == len(classifier.shadow):
+        compulsory = max(compulsory, classifier.capacity - len(classifier.shadow) + 1)
+      elif compulsory + conflict == 0 and self._evicted(self._outside_shadow()) == []:
+        # the blocks that left the shadow cache are all still cached: a miss must evict one first
+        extra = 1
+    if conflict > 0 and compulsory + capacity + extra == 0 and self._evicted(classifier.shadow) == []:
+      # a miss has to evict a block of the shadow cache before a conflict miss can use it
+      extra = 1
+    return compulsory + capacity + conflict + extra
+
+  def _outside_shadow(self):
+    ### Returns the block addresses that were in the cache but have left the shadow cache
+    shadow = self.classifier.shadow
+    return [block_addr for block_addr in self.classifier.seen if block_addr not in shadow]
+
+  def _evicted(self, block_addrs):
+    ### Returns the (index, tag) of the blocks of block_addrs that are not in the cache
+    sim = self.sim
+    evicted = []
+    for block_addr in block_addrs:
+      acc_tag, acc_idx = sim.layout.split_block(block_addr)
+      if sim.lookup(acc_tag, acc_idx) is None:
+        evicted.append((acc_idx, acc_tag))
+    return evicted
+
+  def _search(self, depth):
+    if not self._feasible(depth):
+      return False
+    if depth == self.num_addr:
+      return True
+    for candidate in self._candidates(depth):
+      self.nodes += 1
+      if self.nodes > self.max_nodes:
+        raise ValueError(
+            f'No access sequence found within {self.max_nodes} steps; relax the constraints or raise max_nodes'
+        )
+      saved = self._apply(*candidate)
+      if self._search(depth + 1):
+        return True
+      self._undo(saved)
+    return False
+
+  def _apply(self, acc_idx, acc_tag, acc_off, store, value):
+    ### Simulates one access and updates the counters. Returns what _undo needs to take it back
+    sim = self.sim
+    saved = (sim.save_set(acc_idx), self.classifier.save(sim.layout.block_address(acc_tag, acc_idx)))
+    record = access_record(sim, self.classifier, acc_idx, acc_tag, acc_off, store, value)
+    self.accesses.append(record)
+    if record['hit']:
+      self.num_hits += 1
+    else:
+      self.num_misses += 1
+      self.type_counts[record['miss_type']] += 1
+    self.num_writebacks += record['writeback']
+    self.set_counts[acc_idx] = self.set_counts.get(acc_idx, 0) + 1
+    return saved
+
+  def _undo(self, saved):
+    ### Takes back the last access simulated by _apply
+    record = self.accesses.pop()
+    if record['hit']:
+      self.num_hits -= 1
+    else:
+      self.num_misses -= 1
+      self.type_counts[record['miss_type']] -= 1
+    self.num_writebacks -= record['writeback']
+    self.set_counts[record['index']] -= 1
+    if self.set_counts[record['index']] == 0:
+      del self.set_counts[record['index']]
+    self.sim.restore_set(saved[0])
+    self.classifier.undo(saved[1])
+
+  def _candidates(self, depth):
+    ### Yields the (index, tag, offset, store, value) candidates of position depth, best first
+    sim = self.sim
+    if self.address_list is not None:
+      acc_tag, acc_idx, acc_off = sim.layout.decode(int(self.address_list[depth]))
+      operation = (acc_off, self.stores[depth], self.values[depth])
+      yield (acc_idx, acc_tag) + operation
+      for acc_idx, acc_tag in self._alternatives(None):
+        yield (acc_idx, acc_tag) + operation
+      return
+
+    want_hit = self.pattern[depth] if self.pattern is not None else None
+    if want_hit is not None and (not want_hit or sim.valid_blocks != []):
+      try:
+        acc_idx, acc_tag, way = sim.determine_block(want_hit)
+      except ValueError:
+        pass
+      else:
+        yield (acc_idx, acc_tag) + random_operation(sim, self.store_ratio)
+    for acc_idx, acc_tag in self._alternatives(want_hit):
+      yield (acc_idx, acc_tag) + random_operation(sim, self.store_ratio)
+
+  def _alternatives(self, want_hit):
+    ### Returns (index, tag) pairs of hits and misses on the current cache, ordered by want_hit,
+    ### with the misses ranked by what the constraints still need (see _miss_rank)
+    sim = self.sim
+    rng = sim.rng
+    ways = sim.ways
+    classifier = self.classifier
+    need_capacity = self.miss_types.get('capacity', 0) > self.type_counts['capacity']
+
+    hits = []
+    for block in rng.sample(sim.valid_blocks, min(3, len(sim.valid_blocks))):
+      hits.append((block // ways, sim.tags[block]))
+
+    # blocks that were in the cache before: conflict misses while they are in the shadow
+    # cache, capacity misses once they have left it
+    conflicts = self._evicted(classifier.shadow)
+    capacities = self._evicted(self._outside_shadow())
+    misses = rng.sample(conflicts, min(2, len(conflicts))) + rng.sample(capacities, min(2, len(capacities)))
+
+    miss_sets = [rng.randrange(sim.cache_sets) for x in range(2)]
+    uncovered = [acc_idx for acc_idx in range(sim.cache_sets) if acc_idx not in self.set_counts]
+    if uncovered != [] and len(self.set_counts) < self.min_sets:
+      miss_sets.append(rng.choice(uncovered))
+    dirty = [block for block in sim.valid_blocks if sim.dirty[block] == 1]
+    if dirty != []:
+      miss_sets.append(rng.choice(dirty) // ways)
+    if need_capacity and capacities == [] and len(classifier.shadow) == classifier.capacity:
+      # a miss that evicts the oldest block of the shadow cache pushes it out of both caches.
+      # When that block is not the victim of its set, a hit makes another block the oldest
+      oldest_tag, oldest_idx = sim.layout.split_block(next(iter(classifier.shadow)))
+      way = sim.lookup(oldest_tag, oldest_idx)
+      if way is not None and way == sim.policy.predict_victim(oldest_idx):
+        miss_sets.append(oldest_idx)
+      elif way is not None:
+        hits.insert(0, (oldest_idx, oldest_tag))
+    for acc_idx in miss_sets:
+      try:
+        misses.append((acc_idx, sim.sample_miss_tag(acc_idx)))
+      except ValueError:
+        pass
+    if sim.invalid_blocks != []:
+      block = rng.choice(sim.invalid_blocks)
+      acc_idx = block // ways
+      if sim.tags[block] != -1 and sim.lookup(sim.tags[block], acc_idx) is None:
+        misses.append((acc_idx, sim.tags[block]))
+    need_types, need_writebacks = self._pending()
+    misses.sort(key=lambda miss: self._miss_rank(miss, need_types, need_writebacks))
+
+    if want_hit is None:
+      if need_types or need_writebacks:
+        return misses + hits
+      candidates = hits + misses
+      rng.shuffle(candidates)
+      return candidates
+    return hits + misses if want_hit else misses + hits
+
+  def _pending(self):
+    ### Returns the miss types the constraints still need, and the number of writebacks still
+    ### needed (None when writebacks are not constrained)
+    need_types = {
+      miss_type for miss_type, count in self.miss_types.items() if count > self.type_counts[miss_type]
+    }
+    need_writebacks = None if self.writebacks is None else self.writebacks - self.num_writebacks
+    return need_types, need_writebacks
+
+  def _miss_rank(self, miss, need_types, need_writebacks):
+    ### Sort key of a miss (index, tag): (0, 0) when it causes a miss type in need_types and the
+    ### writeback need_writebacks asks for
+    sim = self.sim
+    classifier = self.classifier
+    acc_idx, acc_tag = miss
+    block_addr = sim.layout.block_address(acc_tag, acc_idx)
+    if block_addr in classifier.shadow:
+      miss_type = 'conflict'
+    elif block_addr in classifier.seen:
+      miss_type = 'capacity'
+    else:
+      miss_type = 'compulsory'
+    base = acc_idx * sim.ways
+    victim = sim.policy.predict_victim(acc_idx)
+    if victim is None:
+      # any dirty block of the set may be replaced
+      victims = range(base, base + sim.ways)
+    else:
+      victims = [base + victim]
+    writeback = any(sim.valid[block] == 1 and sim.dirty[block] == 1 for block in victims)
+    if need_writebacks is None:
+      writeback_rank = 0
+    else:
+      writeback_rank = int(writeback != (need_writebacks > 0))
+    type_rank = int(miss_type not in need_types)
+    if type_rank and miss_type == 'compulsory' and 'capacity' in need_types:
+      # compulsory misses fill the shadow cache until it overflows, and then set up a capacity
+      # miss when they evict the oldest block of the shadow cache
+      if len(classifier.shadow) < classifier.capacity:
+        type_rank = 0
+      elif victim is not None and sim.valid[base + victim] == 1:
+        victim_addr = sim.layout.block_address(sim.tags[base + victim], acc_idx)
+        type_rank = int(victim_addr != next(iter(classifier.shadow)))
+    return writeback_rank, type_rank
+
+
+def random_operation(sim, store_ratio=0):
+  ### Draws the offset and operation of a generated access, in the order generate_cache always used.
+  ### Returns (offset, store, value)
+  rng = sim.rng
+  acc_off = rng.randint(0, sim.block_size - 1)
+  store = bool(store_ratio) and rng.random() < store_ratio
+  value = rng.randint(0, 255) if store else 0
+  return acc_off, store, value
+
+
+def access_record(sim, classifier, acc_idx, acc_tag, acc_off, store, value):
+  ### Simulates one access on sim, classifies it, and returns it as a dictionary with its 'tag',
+  ### 'index', 'offset', 'store', 'value', 'hit', 'data' (the byte read by a load that hits),
+  ### 'writeback', 'fill', 'memory_write' and 'miss_type'
+  way = sim.lookup(acc_tag, acc_idx)
+  data = sim.read_byte(acc_idx, way, acc_off) if way is not None and not store else None
+  hit, way, writeback, fill, memory_write = sim.access(acc_tag, acc_idx, acc_off, store, value)
+  return {
+    'tag': acc_tag,
+    'index': acc_idx,
+    'offset': acc_off,
+    'store': store,
+    'value': value,
+    'hit': hit,
+    'data': data,
+    'writeback': writeback,
+    'fill': fill,
+    'memory_write': memory_write,
+    'miss_type': classifier.classify(sim.layout.block_address(acc_tag, acc_idx), hit),
+  }
+
+
+def random_accesses(sim, pattern, store_ratio=0):
+  ### Generates one access per entry of pattern without constraints: determine_block() picks a hit
+  ### (True) or a miss (False), as the first candidate of AccessSearch does. An access that cannot have
+  ### the wanted outcome (a hit in an empty cache, a miss in a set holding every tag) gets the other one
+  classifier = MissClassifier(sim)
+  records = []
+  for want_hit in pattern:
+    try:
+      acc_idx, acc_tag, way = sim.determine_block(want_hit and sim.valid_blocks != [])
+    except ValueError:
+      acc_idx, acc_tag, way = sim.determine_block(True)
+    records.append(access_record(sim, classifier, acc_idx, acc_tag, *random_operation(sim, store_ratio)))
+  return records
+
+
+INCLUSION_POLICIES = ('inclusive', 'exclusive', 'non-inclusive')
+
+
+class CacheHierarchy:
+  '''
+  Chain of CacheSimulator levels (levels[0] is L1) in front of one data memory.
+
+  Each entry of levels is a dictionary with the ways, set_bits and policy of that level.
+  All levels share block_bits and addr_bits, so an address is decoded once into its block
+  address and offset, and the tag and index of every level are cut from the block address.
+  Every level is write-back and write-allocate.
+
+  inclusion selects how the levels share blocks:
+    'inclusive': every block of a level is also in all the levels below it. A block evicted
+      from a level is invalidated in the levels above it (back-invalidation)
+    'exclusive': a block is in at most one level. A hit in a lower level moves the block up to
+      L1, misses fill only L1, and blocks evicted from a level move down into the next one
+    'non-inclusive': a miss fills the block into every level that missed, and evictions
+      do not affect the other levels
+
+  stats counts the hits and misses of every level, and the traffic of every level counts
+  the blocks filled into it and the dirty blocks it wrote back to the level below.
+  Random choices are drawn from rng.
+  '''
+
+  def __init__(self, memory, levels, block_bits=1, addr_bits=5, inclusion='inclusive', rng=random):
+    if inclusion not in INCLUSION_POLICIES:
+      raise ValueError(
+          f'inclusion must be one of {", ".join(INCLUSION_POLICIES)}'
+      )
+    if len(levels) == 0:
+      raise ValueError(
+          'A cache hierarchy needs at least one level'
+      )
+    self.memory = memory
+    self.rng = rng
+    self.block_bits = block_bits
+    self.addr_bits = addr_bits
+    self.block_size = 2**block_bits
+    self.inclusion = inclusion
+    self.levels = []
+    for level in levels:
+      set_bits = level.get('set_bits', 1)
+      if addr_bits - set_bits - block_bits <= 0:
+        raise ValueError(
+            f'Every level needs addr_bits > set_bits + block_bits'
+        )
+      self.levels.append(CacheSimulator(memory, level.get('ways', 2), set_bits, block_bits,
+                                        addr_bits, level.get('policy', 'lru'), rng=rng))
+    self.stats = [{'hits': 0, 'misses': 0} for sim in self.levels]
+    self._fills = [False] * len(self.levels)
+    self._writebacks = [False] * len(self.levels)
+
+  def fill(self, show_valid=False):
+    ### Starts every level with invalid blocks (see CacheSimulator.fill with empty_cache)
+    for sim in self.levels:
+      sim.fill(show_valid, empty_cache=True)
+
+  def reset_stats(self):
+    ### Clears the hit/miss and traffic counters of every level
+    for level, sim in enumerate(self.levels):
+      self.stats[level] = {'hits': 0, 'misses': 0}
+      for key in sim.traffic:
+        sim.traffic[key] = 0
+
+  def decode(self, addr):
+    ### Splits addr into its block address, its offset, and the (tag, index) of every level
+    block_addr = addr >> self.block_bits
+    decoded = [sim.layout.split_block(block_addr) for sim in self.levels]
+    return block_addr, addr & (self.block_size - 1), decoded
+
+  def access(self, addr, store=False, value=0):
+    ### Simulates a load, or a store of value, to addr. See _access for the result
+    block_addr, acc_off, decoded = self.decode(addr)
+    return self._access(block_addr, acc_off, decoded, store, value)
+
+  def _access(self, block_addr, acc_off, decoded, store, value):
+    ### Simulates one access whose address is already decoded.
+    ### Returns (hits, fills, writebacks, source, data): hits holds True/False for every level that was
+    ### looked up and None for the levels below the first hit, fills and writebacks flag the levels that
+    ### filled or wrote back a block, source is the level that supplied the block (len(levels) for
+    ### memory), and data is the byte read by a load
+    levels = self.levels
+    num_levels = len(levels)
+    block_size = self.block_size
+    hits = [None] * num_levels
+    self._fills = [False] * num_levels
+    self._writebacks = [False] * num_levels
+
+    source = num_levels
+    for level in range(num_levels):
+      acc_tag, acc_idx = decoded[level]
+      way = levels[level].tag_ways[acc_idx].get(acc_tag)
+      hits[level] = way is not None
+      if way is not None:
+        self.stats[level]['hits'] += 1
+        source = level
+        break
+      self.stats[level]['misses'] += 1
+
+    if source == 0:
+      levels[0].policy.touch(decoded[0][1], way)
+    else:
+      if source < num_levels:
+        sim = levels[source]
+        acc_tag, acc_idx = decoded[source]
+        if self.inclusion == 'exclusive':
+          values, dirty = sim.invalidate(acc_tag, acc_idx)
+        else:
+          block = acc_idx * sim.ways + way
+          sim.policy.touch(acc_idx, way)
+          values = bytes(sim.data[block * block_size:(block + 1) * block_size])
+          dirty = 0
+      else:
+        values = self.memory.load(block_addr << self.block_bits, block_size)
+        dirty = 0
+      if self.inclusion == 'exclusive':
+        way = self._fill(0, block_addr, values, dirty)
+      else:
+        for level in range(source - 1, -1, -1):
+          way = self._fill(level, block_addr, values, dirty)
+
+    sim = levels[0]
+    position = (decoded[0][1] * sim.ways + way) * block_size + acc_off
+    if store:
+      sim.data[position] = value
+      sim.dirty[decoded[0][1] * sim.ways + way] = 1
+      data = None
+    else:
+      data = sim.data[position]
+    return hits, self._fills, self._writebacks, source, data
+
+  def _fill(self, level, block_addr, values, dirty):
+    ### Installs a block in level and handles the block it evicts. Returns the way of the new block
+    sim = self.levels[level]
+    acc_tag, acc_idx = sim.layout.split_block(block_addr)
+    way, victim = sim.install(acc_tag, acc_idx, values, dirty)
+    self._fills[level] = True
+    if victim is not None:
+      victim_tag, victim_values, victim_dirty = victim
+      self._evict(level, sim.layout.block_address(victim_tag, acc_idx), victim_values, victim_dirty)
+    return way
+
+  def _evict(self, level, block_addr, values, dirty):
+    ### Handles a block evicted from level according to the inclusion policy
+    if self.inclusion == 'inclusive':
+      # walk up from the level above, so that the newest dirty copy is kept
+      for upper in range(level - 1, -1, -1):
+        sim = self.levels[upper]
+        copy = sim.invalidate(*sim.layout.split_block(block_addr))
+        if copy is not None and copy[1] == 1:
+          values, dirty = copy
+    if dirty == 1:
+      sim = self.levels[level]
+      self._writebacks[level] = True
+      sim.traffic['writebacks'] += 1
+      sim.traffic['writeback_bytes'] += self.block_size
+    if self.inclusion == 'exclusive' and level + 1 < len(self.levels):
+      self._fill(level + 1, block_addr, values, dirty)
+    elif dirty == 1:
+      self._write_down(level + 1, block_addr, values)
+
+  def _write_down(self, level, block_addr, values):
+    ### Writes a dirty block into the first level at or below level that holds it, or into memory
+    block_size = self.block_size
+    for sim in self.levels[level:]:
+      acc_tag, acc_idx = sim.layout.split_block(block_addr)
+      way = sim.tag_ways[acc_idx].get(acc_tag)
+      if way is not None:
+        block = acc_idx * sim.ways + way
+        sim.data[block * block_size:(block + 1) * block_size] = values
+        sim.dirty[block] = 1
+        return
+    self.memory.write(block_addr << self.block_bits, values)
+
+  def simulate(self, address_list, ops=None, values=None):
+    '''
+    Simulates a whole trace of addresses on the hierarchy.
+
+    The trace is decoded once with NumPy into block addresses, offsets, and the tag and
+    index of every level. ops and values are handled as in simulate_trace.
+
+    Returns a dictionary of NumPy arrays: 'offset', 'store', 'data' and 'value' with one
+    entry per access as in simulate_trace, 'source' (the level that supplied the block,
+    len(levels) for memory), and 'hit' (1 for a hit, 0 for a miss, -1 when the level was
+    not looked up), 'fill' and 'writeback' with one row per level
+    '''
+    addresses = np.asarray(address_list, dtype=np.uint64).reshape(-1)
+    num_access = len(addresses)
+    num_levels = len(self.levels)
+    stores, store_values = trace_stores(num_access, ops, values, self.rng)
+    offsets = addresses & np.uint64(self.block_size - 1)
+    block_numbers = addresses >> np.uint64(self.block_bits)
+    level_blocks = [sim.layout.split_block_array(block_numbers) for sim in self.levels]
+    level_tags = [tags.tolist() for tags, indexes in level_blocks]
+    level_indexes = [indexes.tolist() for tags, indexes in level_blocks]
+
+    hits = np.full((num_levels, num_access), -1, dtype=np.int8)
+    fills = np.zeros((num_levels, num_access), dtype=bool)
+    writebacks = np.zeros((num_levels, num_access), dtype=bool)
+    sources = np.zeros(num_access, dtype=np.int8)
+    read_values = np.full(num_access, -1, dtype=np.int16)
+
+    store_list = stores.tolist()
+    value_list = store_values.tolist()
+    for pos, (block_addr, acc_off) in enumerate(zip(block_numbers.tolist(), offsets.tolist())):
+      decoded = [(tags[pos], indexes[pos]) for tags, indexes in zip(level_tags, level_indexes)]
+      access_hits, access_fills, access_writebacks, sources[pos], data = self._access(
+          block_addr, acc_off, decoded, store_list[pos], value_list[pos])
+      for level in range(num_levels):
+        if access_hits[level] is not None:
+          hits[level, pos] = access_hits[level]
+      fills[:, pos] = access_fills
+      writebacks[:, pos] = access_writebacks
+      if data is not None:
+        read_values[pos] = data
+
+    return {
+      'offset': offsets,
+      'store': stores,
+      'hit': hits,
+      'fill': fills,
+      'writeback': writebacks,
+      'source': sources,
+      'data': read_values,
+      'value': store_values,
+    }
+
+
+class VariantCache:
+  '''
+  Memoization layer for generated variants, keyed on the seed and the arguments of the generator.
+
+  Entries are stored as JSON strings in an LRU dictionary of at most max_entries variants.
+  When path is given, every entry is also written to path/<key>.json, so variants survive
+  the process and can be shared between workers; entries evicted from memory are read back
+  from disk on the next lookup.
+  '''
+
+  # bump when a change to the generators makes previously stored variants stale
+  VERSION = 3
+
+  def __init__(self, max_entries=256, path=None):
+    self.max_entries = max_entries
+    self.path = path
+    self._entries = OrderedDict()
+    if path is not None:
+      os.makedirs(path, exist_ok=True)
+
+  @classmethod
+  def key(cls, seed, config):
+    ### Returns the hex digest identifying the variant generated from seed and config
+    text = json.dumps([cls.VERSION, seed, config], sort_keys=True, default=_json_default)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+  def get(self, key):
+    ### Returns a fresh copy of the stored variant, or None
+    text = self._entries.get(key)
+    if text is not None:
+      self._entries.move_to_end(key)
+    elif self.path is not None:
+      try:
+        with open(os.path.join(self.path, f'{key}.json'), 'r', encoding='utf-8') as f:
+          text = f.read()
+      except FileNotFoundError:
+        return None
+      self._remember(key, text)
+    else:
+      return None
+    return json.loads(text)
+
+  def put(self, key, result):
+    ### Stores a generated variant
+    text = json.dumps(result, default=_json_default)
+    self._remember(key, text)
+    if self.path is not None:
+      file_name = os.path.join(self.path, f'{key}.json')
+      with open(f'{file_name}.{os.getpid()}.tmp', 'w', encoding='utf-8') as f:
+        f.write(text)
+      os.replace(f'{file_name}.{os.getpid()}.tmp', file_name)
+
+  def _remember(self, key, text):
+    self._entries[key] = text
+    self._entries.move_to_end(key)
+    while len(self._entries) > self.max_entries:
+      self._entries.popitem(last=False)
+
+  def __len__(self):
+    return len(self._entries)
+
+
+def _json_default(value):
+  ### Converts NumPy values (e.g. an address_list given as an array) for json.dumps
+  if hasattr(value, 'tolist'):
+    return value.tolist()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def memoized(data, memo, seed, config, generate):
+  ### Copies the variant of (seed, config) from memo into data, generating and storing it first if needed
+  if seed is None:
+    raise ValueError(
+        'A seed is needed to memoize a variant'
+    )
+  key = memo.key(seed, config)
+  result = memo.get(key)
+  if result is None:
+    result = {'params': {}, 'correct_answers': {}}
+    generate(result, **config, seed=seed)
+    memo.put(key, result)
+  data['params'].update(result['params'])
+  data['correct_answers'].update(result['correct_answers'])
+
+
+def generate_cache(data, answers_name, ways=2, set_bits=1, num_addr=1, block_bits=1,
+                  addr_bits=5, show_valid=False, empty_cache=False, partial_empty=False,
+                  base='hex', min_hits=0, min_miss=0, address_list=[], show_dirty = False,
+                  mem_table='full', policy='lru', ops=None, store_ratio=0,
+                  write_hit='back', write_miss='allocate', hits=None, miss_types=None, writebacks=None,
+                  min_sets=0, repair_addresses=False, rng=random, seed=None, memo=None):
+  '''
+  Utility for generating caches and sequences of access for the pl-cache-table and pl-cache-access-table elements.
   The script exports all parameters that can be passed directly to pl-cache-table and/or pl-cache-access-table
-  data['params']['mem_table'] can be passed to pl-array-input to display a data memory
+  data['params']['mem_table'] can be passed to pl-array-input to display a data memory (see mem_table below)
   data['params'][answers_name] and data['correct_answers'][answers_name] will be read by pl-cache-table automatically if its answers-name parameter matches answers_name
   data['correct_answers'][f'{answers_name}_access'] = access_table will be read by pl-cache-access-table automatically if its answers-name parameter matches answers_name
 
@@ -26,10 +1734,51 @@ def generate_cache(data, answers_name, ways=2, set_bits=1, num_addr=1, block_bit
   show_valid determines whether valid bits are shown in the cache
   empty_cache determines whether the cache starts with all blocks being invalid
   base determines the base used to represent the tag and memory addresses
+  mem_table determines what is exported to data['params']['mem_table']: 'full' exports every byte of the
+    data memory (for pl-array-input), 'touched' exports only the blocks that were loaded into the cache as a
+    list of {'address': start, 'values': [...]} ranges, and None exports nothing. Use 'touched' or None for
+    large addr_bits, since the data memory is otherwise never materialized. The memory is exported as it
+    was before the accesses, so it does not include the bytes written by stores
+  policy selects the replacement policy ('lru', 'fifo', 'plru', 'random' or 'lfu'). Pass
+    data['params']['replacement_policy'] to the replacement-policy attribute of pl-cache-table
+  ops gives the operation ('R' for a load, 'W' for a store) of every address in address_list, and
+    store_ratio the probability that each randomly generated access is a store. Every store lists the
+    byte it writes in 'value'
+  write_hit ('back' or 'through') and write_miss ('allocate' or 'no-allocate') set the write policies.
+    Every access in the access table reports its fill, writeback, and write-through bytes, and the
+    totals are stored in data['params']['traffic']
+  min_hits and min_miss set the minimum number of hits and misses, hits the exact number of hits,
+    miss_types the minimum number of misses of each type (e.g. {'conflict': 1, 'capacity': 1}),
+    writebacks the exact number of writebacks, and min_sets the minimum number of different sets accessed.
+    The accesses are found by AccessSearch, so the constraints always hold or a ValueError is raised.
+    Without any constraint, the accesses are drawn directly by random_accesses.
+    With address_list, the given addresses are simulated as written and the constraints are not
+    checked, unless repair_addresses is True: the addresses are then kept when they meet the
+    constraints, and otherwise as few of them as possible are replaced. Every access reports its
+    miss type ('compulsory', 'capacity', 'conflict', or None for a hit, see MissClassifier)
 
-  Default values are chosen so that the cache and data memory are fairly small so that they can be easily seen on the screen. 
+  Default values are chosen so that the cache and data memory are fairly small so that they can be easily seen on the screen.
   We do not recommend increasing the default values by much more than 1
+
+  data['params']['tio_records'] holds the address, tag, index and offset of every access as numbers.
+  The explanations of how every address splits into its tag, index and offset are only formatted when
+  the answer panel is rendered: call render_tio_sequence from the render function of server.py
+  (see format_tio_sequence to build them in Python)
+
+  All simulator state lives in a CacheSimulator created by this call, so repeated calls
+  in the same process do not affect each other.
+
+  Every random choice is drawn from rng (the random module by default, which follows
+  PrairieLearn's variant seed). Passing seed uses random.Random(seed) instead, so the same
+  seed and arguments always generate the same variant. memo is an optional VariantCache:
+  with a seed, a variant that was generated before is copied from it instead of being simulated again.
   '''
+  config = {key: value for key, value in locals().items() if key not in ('data', 'rng', 'seed', 'memo')}
+  if memo is not None:
+    memoized(data, memo, seed, config, generate_cache)
+    return
+  if seed is not None:
+    rng = random.Random(seed)
 
   # params for pl-cache-table attributes
   data['params']['answers_name'] = answers_name
@@ -41,6 +1790,7 @@ def generate_cache(data, answers_name, ways=2, set_bits=1, num_addr=1, block_bit
   data['params']['show_dirty'] = show_dirty
   data['params']['empty_cache'] = empty_cache
   data['params']['display_base'] = base.lower()
+  data['params']['replacement_policy'] = policy
 
   #CACHE parameters
   mem_size = 2**addr_bits
@@ -53,9 +1803,6 @@ def generate_cache(data, answers_name, ways=2, set_bits=1, num_addr=1, block_bit
 
 
   tag_bits = addr_bits - set_bits - block_bits
-  tag_hex_size = math.ceil(tag_bits / 4)
-
-  max_tag = 2**tag_bits - 1
 
   # make sure that cache configuration is possible
   if tag_bits <= 0:
@@ -77,362 +1824,486 @@ def generate_cache(data, answers_name, ways=2, set_bits=1, num_addr=1, block_bit
     )
     return
 
+  if mem_table not in ('full', 'touched', None):
+    raise ValueError(
+        f'mem_table must be "full", "touched" or None'
+    )
+    return
+
 ###########################
-### CREATE MEMORY TABLE ###
+### CREATE DATA MEMORY ###
 ###########################
 
-  create_mem_table(data, mem_size)
+  memory = LazyMemory(addr_bits, rng=rng)
 
 ###################################
 ### Generate initial CACHE data ###
 ###################################
 
-  way_list = list(range(ways))
-  cache_block = {}
-
-  for x in range(cache_sets):
-    # generate 1 tag per way
-    tags = []
-    valid = []
-    dirty = []
-    blocks = [[0 for j in range(block_size)] for i in range(ways)]
+  sim = CacheSimulator(memory, ways, set_bits, block_bits, addr_bits, policy, write_hit, write_miss, rng)
+  sim.fill(show_valid, empty_cache, partial_empty)
+  initial_memory = memory.snapshot()
 
-    for way in range(ways):
-      if empty_cache and show_valid:
-        valid.append(0)
-        dirty.append(0)
-        tags.append(random.randint(0, max_tag))
-        for offset in range(block_size):
-          blocks[way][offset] = str(random.randint(0,255))
-      elif empty_cache:
-        valid.append(0)
-        dirty.append(0)
-        tags.append('')
-        for offset in range(block_size):
-          blocks[way][offset] = ''  
-      elif partial_empty and show_valid:
-        temp = random.randint(0,1)
-        valid.append(temp)
-        if temp == 0:
-          dirty.append(0)
-        else:
-          tempd = random.randint(0,3)
-          if tempd == 0:
-            dirty.append(0)
-          else:
-            dirty.append(1)
-        tags.append(random.randint(0, max_tag))
-        if temp == 0:
-          for offset in range(block_size):
-            blocks[way][offset] = str(random.randint(0,255))
-        else:
-          if way > 0:
-            while tags[way] in tags[:way]:
-              tags[way] = random.randint(0, max_tag)
-          addr = (tags[way] * cache_sets + x) * block_size
-          for offset in range(block_size):
-            blocks[way][offset] = str(DATA_MEM[addr + offset])
-      else:
-        valid.append(1)
-        dirty.append(random.randint(0,1))
-        tags.append(random.randint(0, max_tag))
-        if way > 0:
-          while tags[way] in tags[:way]:
-            tags[way] = random.randint(0, max_tag)
-        addr = (tags[way] * cache_sets + x) * block_size
-        for offset in range(block_size):
-          blocks[way][offset] = str(DATA_MEM[addr + offset])
-
-    # generate LRU FSM
-    lru_list = random.sample(way_list,len(way_list))
-    cache_block = {'tags': tags, 'lru': lru_list, 'blocks': blocks, 'valid': valid, 'dirty': dirty}
-    VALID.append(valid)
-    CACHE.append(cache_block)
-  
   ### Initial state of the cache. Will be used by pl-cache-table
-  data['params'][answers_name] = stringify_cache(tag_bits, tag_hex_size, base)
+  data['params'][answers_name] = sim.stringify_cache(base)
 
 ###########################################
 ### Create addresses and simulate cache ###
 ###########################################
   if min_miss + min_hits > num_addr and address_list == []:
     raise ValueError("The min_miss + min_hits cannot exceed num_addr")
+  if hits is not None and not 0 <= hits <= num_addr and address_list == []:
+    raise ValueError("hits must be between 0 and num_addr")
+
+  constraints = {
+    'hits': hits,
+    'min_hits': min_hits,
+    'min_miss': min_miss,
+    'miss_types': miss_types,
+    'writebacks': writebacks,
+    'min_sets': min_sets,
+  }
 
   if address_list != []:
-    access_cache(data, answers_name, address_list, block_bits, set_bits, ways, addr_bits, base)
+    access_cache(data, answers_name, sim, address_list, base, ops, constraints if repair_addresses else None)
 
     ### Final state of the cache. Will be used by pl-cache-table
-    data['correct_answers'][answers_name] = stringify_cache(tag_bits, tag_hex_size, base)
+    data['correct_answers'][answers_name] = sim.stringify_cache(base)
+    data['params']['traffic'] = dict(sim.traffic)
+    create_mem_table(data, memory, mem_table, initial_memory)
 
     return
 
-  hit_miss_list = make_hit_list(num_addr, min_hits, min_miss, empty_cache)
-  
-  feedback_table = []
-  access_table = []
-  for x in range(num_addr):
-    # Generate random address and update cache
-    acc_idx, acc_tag, way = determine_block(cache_sets, ways, max_tag, hit_miss_list[x])
+  if hits is None:
+    hit_miss_list = make_hit_list(num_addr, min_hits, min_miss, empty_cache, rng)
+  else:
+    hit_miss_list = make_hit_list(num_addr, hits, max(num_addr - hits - int(empty_cache), 0), empty_cache, rng)
 
-    acc_off = random.randint(0, block_size-1)
+  if constrained(constraints):
+    search = AccessSearch(sim, num_addr, store_ratio=store_ratio, pattern=hit_miss_list, **constraints)
+    records = search.run()
+  else:
+    records = random_accesses(sim, hit_miss_list, store_ratio)
 
-    addr = (acc_tag * cache_sets + acc_idx) * block_size + acc_off
+  layout = sim.layout
+  tio_records = []
+  access_table = []
+  for x, record in enumerate(records):
+    acc_idx = record['index']
+    acc_tag = record['tag']
+    acc_off = record['offset']
 
-    if base == 'hex':
-      str_address = f'{addr:#0{math.ceil(addr_bits / 4) + 2}x}'
-      if cache_sets > 1:
-        feedback = {
-          'access': x,
-          'tag': f'<code>{str_address}</code> / {block_size} / {cache_sets} = {hex(acc_tag)}',
-          'index': f'<code>{str_address}</code> / {block_size} % {cache_sets} = {hex(acc_idx)}',
-          'offset': f'<code>{str_address}</code> % {block_size} = {hex(acc_off)}',
-        }
-      else:
-        feedback = {
-          'access': x,
-          'tag': f'<code>{str_address}</code> / {block_size} = {hex(acc_tag)}',
-          'offset': f'<code>{str_address}</code> % {block_size} = {hex(acc_off)}',
-        }
-    else:
-      str_address = f'{addr:0{addr_bits}b}'
-      str_address = ' '.join(str_address[::-1][i:i+4] for i in range(0, len(str_address), 4))[::-1]
-      str_address = '0b' + str_address
-      if cache_sets > 1:
-        feedback = {
-          'access': x,
-          'tag': f'Tag = {acc_tag:0{tag_bits}b}',
-          'index': f'Index = {acc_idx:0{set_bits}b}',
-          'offset': f'Offset = {acc_off:0{block_bits}b}',
-        }
-      else:
-        feedback = {
-          'access': x,
-          'tag': f'Tag = {acc_tag:0{tag_bits}b}',
-          'offset': f'Offset = {acc_off:0{block_bits}b}',
-        }
+    addr = layout.encode(acc_tag, acc_idx, acc_off)
+    tio_records.append([addr, acc_tag, acc_idx, acc_off])
 
-    writeback = update_cache(acc_tag, acc_idx, addr)
     access = {
-      'address': str_address,
-      'hit': hit_miss_list[x],
-      'data': None,
-      'writeback': writeback,
+      'address': layout.format_address(addr, base),
+      'hit': record['hit'],
+      'data': record['data'],
+      'writeback': record['writeback'],
+      'store': record['store'],
+      'value': str(record['value']) if record['store'] else None,
+      'fill_bytes': block_size if record['fill'] else 0,
+      'writeback_bytes': block_size if record['writeback'] else 0,
+      'write_through_bytes': 1 if record['memory_write'] else 0,
+      'miss_type': record['miss_type'],
     }
-    if hit_miss_list[x]:
-      access['data'] = CACHE[acc_idx]['blocks'][way][acc_off]
     access_table.append(access)
-    feedback_table.append(feedback)
 
   ### List of memory accesses and their hits/misses in cache. Will be used by pl-cache-access-table
   data['correct_answers'][f'{answers_name}_access'] = access_table
-  data['params']['tio_sequence'] = feedback_table
+  data['params']['tio_records'] = export_tio_records(layout, base, tio_records)
   ### Final state of the cache. Will be used by pl-cache-table
-  data['correct_answers'][answers_name] = stringify_cache(tag_bits, tag_hex_size, base)
+  data['correct_answers'][answers_name] = sim.stringify_cache(base)
+  data['params']['traffic'] = dict(sim.traffic)
+  create_mem_table(data, memory, mem_table, initial_memory)
 
   return
 
-def update_cache(acc_tag, acc_idx, addr):
-  ### Updates the contents of the cache given an address, tag, and index
-  lru_list = CACHE[acc_idx]['lru']
-  ways = len(lru_list)
-
-  block_size = len(CACHE[acc_idx]['blocks'][lru_list[0]])
-  addr = addr // block_size * block_size # strip offset
-
-  writeback = False
-  for way in range(ways):
-    if (CACHE[acc_idx]['tags'][way] == acc_tag) and (CACHE[acc_idx]['valid'][way] == 1):
-      CACHE[acc_idx]['lru'] = update_lru(way, lru_list)
-      return writeback
-  replaced_way = lru_list[0]
-  if CACHE[acc_idx]['valid'][replaced_way] == 1 and CACHE[acc_idx]['dirty'][replaced_way] == 1:
-    writeback = True
-  CACHE[acc_idx]['tags'][replaced_way] = acc_tag
-  CACHE[acc_idx]['valid'][replaced_way] = 1
-  CACHE[acc_idx]['dirty'][replaced_way] = 0
-  for off in range(block_size):
-    CACHE[acc_idx]['blocks'][replaced_way][off] = str(DATA_MEM[addr+off])
-  CACHE[acc_idx]['lru'] = update_lru(lru_list[0], lru_list)
-
-  return writeback
-def update_lru(way, lru_list):
-  ### Updates lru fsm for one set given the way that was accessed
-  ways = len(lru_list)
-
-  for x in range(ways-1):
-    if way == lru_list[x]:
-      for y in range(x,len(lru_list)-1):
-        lru_list[y] = lru_list[y+1]
-      lru_list[len(lru_list)-1] = way
-      return lru_list
-  return lru_list
-
-def stringify_cache(tag_bits, tag_hex_size, base):
-  ### converts CACHE to a dictionary of strings to be used by pl-cache-table
-  str_cache = []
-  for x in range(len(CACHE)):
-    tags = []
-    lru = []
-    blocks = []
-    valid = []
-    dirty = []
-    for y in range(len(CACHE[x]['tags'])):
-      if CACHE[x]['tags'][y] != '':
-        if base == 'hex':
-          tags.append(f'{CACHE[x]["tags"][y]:#0{tag_hex_size + 2}x}')
-        else:
-          tags.append(f'{CACHE[x]["tags"][y]:0{tag_bits}b}')
-      else:
-        tags.append('')
-      lru.append(str(CACHE[x]['lru'][y]))
-      valid.append(str(CACHE[x]['valid'][y]))
-      dirty.append(str(CACHE[x]['dirty'][y]))
-      block = []
-      for z in range(len(CACHE[x]['blocks'][y])):
-        block.append(CACHE[x]['blocks'][y][z])
-      blocks.append(block)
-
-    str_cache.append({'tags': tags, 'lru': lru, 'blocks': blocks, 'valid': valid, 'dirty':dirty})
-  
-  return str_cache
-
-def create_mem_table(data, mem_size):
-  mem_table = []
-
-  for x in range(mem_size):
-    value = random.randint(0,255)
-    DATA_MEM.append(value)
-    mem_table.append(value)
-
-  ### Parameters to be provided to pl-array-input element
-  ### to represent data memory as an array
-  data['params']['mem_table'] = mem_table
-  
-def make_hit_list(num_addr, min_hits, min_miss, empty_cache):
+def create_mem_table(data, memory, mem_table='full', initial=None):
+  ### Exports the data memory to data['params']['mem_table']. initial is a snapshot of memory taken
+  ### before the accesses were simulated (see LazyMemory.snapshot): the memory is then exported as
+  ### it was before the stores wrote to it, with the ranges touched by the whole simulation
+  if initial is not None:
+    final = memory.snapshot()
+    memory.restore((initial[0], final[1]))
+  if mem_table == 'full':
+    ### Parameters to be provided to pl-array-input element
+    ### to represent data memory as an array
+    data['params']['mem_table'] = list(memory.read(0, len(memory)))
+  elif mem_table == 'touched':
+    data['params']['mem_table'] = [
+      {'address': start, 'values': list(memory.read(start, end - start))}
+      for start, end in memory.touched_ranges()
+    ]
+  if initial is not None:
+    memory.restore(final)
+
+def constrained(constraints):
+  ### Returns whether the constraints of generate_cache (see AccessSearch) restrict the accesses at all
+  return (constraints['hits'] is not None or constraints['writebacks'] is not None
+          or constraints['min_hits'] > 0 or constraints['min_miss'] > 0
+          or constraints['min_sets'] > 0 or bool(constraints['miss_types']))
+
+def make_hit_list(num_addr, min_hits, min_miss, empty_cache, rng=random):
   hit_miss_list = [False] * min_miss + [True] * min_hits
   if not empty_cache:
-    hit_miss_list += [random.choice([False, True]) for _ in range(num_addr - min_hits - min_miss)]
-    random.shuffle(hit_miss_list)
+    hit_miss_list += [rng.choice([False, True]) for _ in range(num_addr - min_hits - min_miss)]
+    rng.shuffle(hit_miss_list)
   else:
-    hit_miss_list += [random.choice([False, True]) for _ in range(num_addr - min_hits - min_miss - 1)]
-    random.shuffle(hit_miss_list)
+    hit_miss_list += [rng.choice([False, True]) for _ in range(num_addr - min_hits - min_miss - 1)]
+    rng.shuffle(hit_miss_list)
     hit_miss_list.insert(0, False)
   return hit_miss_list
 
-def determine_block(cache_sets, ways, max_tag, hit):
-  valid_list = []
-  invalid_list = []
-  for index in range(cache_sets):
-    for way in range(ways):
-      if VALID[index][way] == 1:
-        valid_list.append([index,way])
-      else:
-        invalid_list.append([index,way])
+def trace_stores(num_access, ops=None, values=None, rng=random):
+  ### Returns which accesses of a trace are stores and the byte written by each of them (-1 for loads).
+  ### Without values, the stored bytes are drawn from rng in trace order
+  if ops is None:
+    stores = np.zeros(num_access, dtype=bool)
+  else:
+    stores = np.char.upper(np.asarray(ops, dtype=str).reshape(-1)) == 'W'
+  store_values = np.full(num_access, -1, dtype=np.int16)
+  if values is None:
+    store_values[stores] = [rng.randint(0, 255) for x in range(int(stores.sum()))]
+  else:
+    store_values[stores] = np.asarray(values).reshape(-1)[stores]
+  return stores, store_values
 
-  if hit:
-    chosen_block = random.choice(valid_list)
+def simulate_trace(sim, address_list, ops=None, values=None):
+  '''
+  Simulates a whole trace of addresses on sim in one call.
 
-    acc_idx = chosen_block[0]
-    way = chosen_block[1]
-    acc_tag = CACHE[acc_idx]["tags"][way]
+  The trace is decoded into tag, index and offset arrays by sim.layout (see AddressLayout).
+  Since sets never interact, the accesses are then grouped by set index (keeping their
+  order within each set) and every per-set sub-stream is simulated in a tight loop.
 
-  elif invalid_list == []:
-    chosen_block = random.choice(valid_list)
-    acc_idx = chosen_block[0]
-    way = chosen_block[1]
-    tags = list(range(0,max_tag+1))
-    for way in range(ways):
-      tags.remove(CACHE[acc_idx]["tags"][way])
-    acc_tag = random.choice(tags)
-  else:
-    access_empty = random.choice([True, False])
-    if valid_list == [] or access_empty:
-      chosen_block = random.choice(invalid_list)
-      acc_idx = chosen_block[0]
-      way = chosen_block[1]
-      acc_tag = CACHE[acc_idx]["tags"][way]
-    else:
-      chosen_block = random.choice(valid_list)
-      acc_idx = chosen_block[0]
-      way = chosen_block[1]
-      tags = list(range(0,max_tag+1))
-      for way in range(ways):
-        if CACHE[acc_idx]["valid"][way] == 1:
-          tags.remove(CACHE[acc_idx]["tags"][way])
-      acc_tag = random.choice(tags)
+  ops optionally gives the operation of every access ('R' for a load, 'W' for a store)
+  and values the byte written by every store (random bytes when not given).
 
-  return acc_idx, acc_tag, way
+  Returns a dictionary of NumPy arrays with one entry per access: 'tag', 'index',
+  'offset', 'store', 'hit', 'writeback', 'fill', 'data' (the byte read by a load that
+  hits, -1 otherwise), 'value' (the byte written by a store, -1 for loads), and the
+  memory traffic of the access in 'fill_bytes', 'writeback_bytes' and 'write_through_bytes'
+  '''
+  addresses = np.asarray(address_list, dtype=np.uint64).reshape(-1)
+  num_access = len(addresses)
+  stores, store_values = trace_stores(num_access, ops, values, sim.rng)
+  tags, indexes, offsets = sim.layout.decode_array(addresses)
 
-def access_cache(data, answers_name, address_list, block_bits, set_bits, ways, addr_bits, base):
-  
-  access_table = []
-  feedback_table = []
-  index = []
-  tag = []
-  block_size = 2**block_bits
-  cache_sets = 2**set_bits
-  tag_bits = addr_bits - block_bits - set_bits
-  for x in range(len(address_list)):
-    # Generate random address and update cache
-    addr = address_list[x]
-    acc_off = addr % block_size
-    acc_idx = addr // block_size % cache_sets
-    acc_tag = addr // block_size // cache_sets
+  hits = np.zeros(num_access, dtype=bool)
+  writebacks = np.zeros(num_access, dtype=bool)
+  fills = np.zeros(num_access, dtype=bool)
+  memory_writes = np.zeros(num_access, dtype=bool)
+  read_values = np.full(num_access, -1, dtype=np.int16)
 
-    if base == 'hex':
-      str_address = f'{addr:#0{math.ceil(addr_bits / 4) + 2}x}'
-      if cache_sets > 1:
-        feedback = {
-          'access': x,
-          'tag': f'<code>{str_address}</code> / {block_size} / {cache_sets} = {hex(acc_tag)}',
-          'index': f'<code>{str_address}</code> / {block_size} % {cache_sets} = {hex(acc_idx)}',
-          'offset': f'<code>{str_address}</code> % {block_size} = {hex(acc_off)}',
-        }
-      else:
-        feedback = {
-          'access': x,
-          'tag': f'<code>{str_address}</code> / {block_size} = {hex(acc_tag)}',
-          'offset': f'<code>{str_address}</code> % {block_size} = {hex(acc_off)}',
-        }
-    else:
-      str_address = f'{addr:0{addr_bits}b}'
-      str_address = ' '.join(str_address[::-1][i:i+4] for i in range(0, len(str_address), 4))[::-1]
-      str_address = '0b' + str_address
-      if cache_sets > 1:
-        feedback = {
-          'access': x,
-          'tag': f'Tag = {acc_tag:0{tag_bits}b}',
-          'index': f'Index = {acc_idx:0{set_bits}b}',
-          'offset': f'Offset = {acc_off:0{block_bits}b}',
-        }
+  # positions of the accesses grouped by set, and where each set's sub-stream starts
+  order = np.argsort(indexes, kind='stable')
+  sorted_indexes = indexes[order]
+  bounds = [0] + (np.flatnonzero(sorted_indexes[1:] != sorted_indexes[:-1]) + 1).tolist() + [num_access]
+  if num_access == 0:
+    bounds = [0]
+
+  order = order.tolist()
+  sorted_indexes = sorted_indexes.tolist()
+  tag_list = tags.tolist()
+  offset_list = offsets.tolist()
+  store_list = stores.tolist()
+  value_list = store_values.tolist()
+  block_size = sim.block_size
+  ways = sim.ways
+  cache_data = sim.data
+  touch = sim.policy.touch
+  replace_block = sim.replace_block
+  access = sim.access
+  for start, end in zip(bounds[:-1], bounds[1:]):
+    acc_idx = sorted_indexes[start]
+    tag_ways = sim.tag_ways[acc_idx]
+    base = acc_idx * ways
+    for pos in order[start:end]:
+      acc_tag = tag_list[pos]
+      if store_list[pos]:
+        hits[pos], way, writebacks[pos], fills[pos], memory_writes[pos] = access(
+            acc_tag, acc_idx, offset_list[pos], True, value_list[pos])
+        continue
+      way = tag_ways.get(acc_tag)
+      if way is not None:
+        hits[pos] = True
+        read_values[pos] = cache_data[(base + way) * block_size + offset_list[pos]]
+        touch(acc_idx, way)
       else:
-        feedback = {
-          'access': x,
-          'tag': f'Tag = {acc_tag:0{tag_bits}b}',
-          'offset': f'Offset = {acc_off:0{block_bits}b}',
-        }
-
-    hit = False
-    block_data = None
-    for way in range(ways):
-      if CACHE[acc_idx]["valid"][way] == 1 and CACHE[acc_idx]["tags"][way] == acc_tag:
-        hit = True
-        block_data = CACHE[acc_idx]["blocks"][way][acc_off]
+        writebacks[pos] = replace_block(acc_tag, acc_idx)[1]
+        fills[pos] = True
 
-    writeback = update_cache(acc_tag, acc_idx, addr)
+  return {
+    'tag': tags,
+    'index': indexes,
+    'offset': offsets,
+    'store': stores,
+    'hit': hits,
+    'writeback': writebacks,
+    'fill': fills,
+    'data': read_values,
+    'value': store_values,
+    'fill_bytes': fills * block_size,
+    'writeback_bytes': writebacks * block_size,
+    'write_through_bytes': memory_writes.astype(np.int64),
+  }
+
+def access_cache(data, answers_name, sim, address_list, base, ops=None, constraints=None):
+  ### Simulates a user-supplied list of addresses (and optionally their 'R'/'W' ops) on sim.
+  ### If the trace misses the constraints (see AccessSearch), the addresses are repaired by AccessSearch
+
+  access_table = []
+  layout = sim.layout
+  repair = constraints is not None and constrained(constraints)
+  if repair:
+    state = sim.snapshot()
+  classifier = MissClassifier(sim)
+  trace = simulate_trace(sim, address_list, ops)
+  block_addrs = layout.block_address_array(trace['tag'], trace['index']).tolist()
+  miss_types = classifier.classify_trace(block_addrs, trace['hit'].tolist())
+  if repair:
+    search = AccessSearch(sim, len(address_list), address_list=address_list, ops=ops,
+                          values=trace['value'], **constraints)
+    if not search.satisfied(trace['hit'].tolist(), miss_types, trace['writeback'].tolist(), trace['index'].tolist()):
+      sim.restore(state)
+      accesses = search.run()
+      address_list = [layout.encode(access['tag'], access['index'], access['offset']) for access in accesses]
+      sim.restore(state)
+      classifier = MissClassifier(sim)
+      trace = simulate_trace(sim, address_list, ops, trace['value'])
+      block_addrs = layout.block_address_array(trace['tag'], trace['index']).tolist()
+      miss_types = classifier.classify_trace(block_addrs, trace['hit'].tolist())
+  hits = trace['hit'].tolist()
+  writebacks = trace['writeback'].tolist()
+  values = trace['data'].tolist()
+  store_values = trace['value'].tolist()
+  stores = trace['store'].tolist()
+  fill_bytes = trace['fill_bytes'].tolist()
+  writeback_bytes = trace['writeback_bytes'].tolist()
+  write_through_bytes = trace['write_through_bytes'].tolist()
+  tio_records = [
+    [int(addr), acc_tag, acc_idx, acc_off]
+    for addr, acc_tag, acc_idx, acc_off in zip(
+      address_list, trace['tag'].tolist(), trace['index'].tolist(), trace['offset'].tolist())
+  ]
+  for x, (addr, acc_tag, acc_idx, acc_off) in enumerate(tio_records):
     access = {
-      'address': str_address,
-      'hit': hit,
-      'data': block_data,
-      'writeback': writeback,
+      'address': layout.format_address(addr, base),
+      'hit': hits[x],
+      'data': str(values[x]) if hits[x] and not stores[x] else None,
+      'writeback': writebacks[x],
+      'store': stores[x],
+      'value': str(store_values[x]) if stores[x] else None,
+      'fill_bytes': fill_bytes[x],
+      'writeback_bytes': writeback_bytes[x],
+      'write_through_bytes': write_through_bytes[x],
+      'miss_type': miss_types[x],
     }
     access_table.append(access)
-    feedback_table.append(feedback)
 
-    index.append(acc_idx)
-    tag.append(acc_tag)
   ### List of memory accesses and their hits/misses in cache. Will be used by pl-cache-access-table
   data['correct_answers'][f'{answers_name}_access'] = access_table
-  data['params']['tio_sequence'] = feedback_table
+  data['params']['tio_records'] = export_tio_records(layout, base, tio_records)
 
-  return
\ No newline at end of file
+  return
+
+def export_tio_records(layout, base, records):
+  ### Compact form of the tag / index / offset explanations, stored in data['params']['tio_records'].
+  ### records holds one [address, tag, index, offset] list per access; see format_tio_sequence
+  return {
+    'layout': [layout.addr_bits, layout.set_bits, layout.block_bits],
+    'base': base,
+    'records': records,
+  }
+
+def format_tio_sequence(tio_records):
+  ### Builds the tag / index / offset explanation of every access from data['params']['tio_records'].
+  ### Every entry has the number of the access ('access') and the 'tag', 'index' (only with more than
+  ### one set) and 'offset' texts
+  layout = address_layout(*tio_records['layout'])
+  base = tio_records['base']
+  return [
+    {'access': x, **layout.feedback(layout.format_address(addr, base), acc_tag, acc_idx, acc_off, base)}
+    for x, (addr, acc_tag, acc_idx, acc_off) in enumerate(tio_records['records'])
+  ]
+
+TIO_SEQUENCE_PATTERN = re.compile(r'<tbody class="tio-sequence" data-columns="([a-z ]*)">\s*</tbody>')
+
+def render_tio_sequence(data, html):
+  '''
+  Fills in the tag / index / offset explanations of the accesses when a question is rendered.
+
+  Call it from the render(data, html) function of the question's server.py. Every
+    <tbody class="tio-sequence" data-columns="tag index offset"></tbody>
+  of html receives one row per access, with the number of the access followed by the listed
+  columns. The explanations are only formatted when html contains such a table (usually in
+  pl-answer-panel), from the compact data['params']['tio_records'] stored by generate_cache.
+  Variants generated before tio_records existed hold the formatted data['params']['tio_sequence'],
+  which is used as it is.
+  '''
+  if 'tio-sequence' not in html:
+    return html
+  if 'tio_records' in data['params']:
+    sequence = format_tio_sequence(data['params']['tio_records'])
+  elif 'tio_sequence' in data['params']:
+    sequence = data['params']['tio_sequence']
+  else:
+    return html
+
+  def rows(match):
+    columns = match.group(1).split()
+    return '<tbody class="tio-sequence">' + ''.join(
+      '<tr><td>' + '</td><td>'.join([str(feedback['access'])] + [feedback.get(key, '') for key in columns]) + '</td></tr>'
+      for feedback in sequence
+    ) + '</tbody>'
+
+  return TIO_SEQUENCE_PATTERN.sub(rows, html)
+
+def format_address(addr, addr_bits, base):
+  ### Formats a memory address as it is shown in the access tables (see AddressLayout.format_address)
+  return address_layout(addr_bits, 0, 0).format_address(addr, base)
+
+def generate_hierarchy(data, answers_name, levels, block_bits=1, addr_bits=6, inclusion='inclusive',
+                       num_addr=1, address_list=[], ops=None, store_ratio=0, warmup=0, reuse=0.5,
+                       show_valid=False, show_dirty=False, base='hex', mem_table='full',
+                       rng=random, seed=None, memo=None):
+  '''
+  Utility for generating multi-level caches (see CacheHierarchy) and sequences of accesses to them.
+
+  levels is a list of dictionaries with the ways, set_bits and policy of every level, starting with L1.
+  Level n (starting at 1) is exported under the name f'{answers_name}_l{n}': its initial state in
+  data['params'] and its final state in data['correct_answers'], in the format read by pl-cache-table,
+  so one pl-cache-table can be rendered per level. data['params']['levels'] lists the name and the
+  pl-cache-table attributes of every level.
+
+  inclusion is 'inclusive', 'exclusive' or 'non-inclusive' (see CacheHierarchy)
+  address_list and ops give the accesses. Otherwise num_addr random accesses are generated, where each
+    access reuses an earlier block with probability reuse, and store_ratio is the probability of a store
+  warmup random loads are simulated before the initial state is exported, so the levels start with
+    contents consistent with the inclusion policy (every level starts empty when warmup is 0)
+  show_valid, show_dirty, base, mem_table, rng, seed and memo are the same as for generate_cache
+
+  data['correct_answers'][f'{answers_name}_access'] can be read by pl-cache-access-table (hit is the
+  L1 result). Every access also lists the level that supplied the block ('L1', 'L2', ..., or
+  'Memory') and the hit, fill_bytes and writeback_bytes of every level in 'levels' (hit is None
+  for the levels that were not looked up). data['params']['traffic'] holds the totals of every level.
+  '''
+  config = {key: value for key, value in locals().items() if key not in ('data', 'rng', 'seed', 'memo')}
+  if memo is not None:
+    memoized(data, memo, seed, config, generate_hierarchy)
+    return
+  if seed is not None:
+    rng = random.Random(seed)
+
+  base = base.lower()
+  if base != 'hex' and base != 'bin':
+    raise ValueError(
+        f'base must be "hex" or "bin"'
+    )
+  if mem_table not in ('full', 'touched', None):
+    raise ValueError(
+        f'mem_table must be "full", "touched" or None'
+    )
+  mem_size = 2**addr_bits
+  block_size = 2**block_bits
+  for level in levels:
+    if level.get('ways', 2) * 2**level.get('set_bits', 1) * block_size > mem_size:
+      raise ValueError(
+          f'Total cache size cannot be larger than the data memory'
+      )
+
+  memory = LazyMemory(addr_bits, rng=rng)
+  hierarchy = CacheHierarchy(memory, levels, block_bits, addr_bits, inclusion, rng)
+  hierarchy.fill(show_valid)
+  names = [f'{answers_name}_l{n + 1}' for n in range(len(levels))]
+
+  num_blocks = 2**(addr_bits - block_bits)
+  used_blocks = []
+  def random_address():
+    if used_blocks != [] and rng.random() < reuse:
+      block_addr = rng.choice(used_blocks)
+    else:
+      block_addr = rng.randint(0, num_blocks - 1)
+      used_blocks.append(block_addr)
+    return (block_addr << block_bits) | rng.randint(0, block_size - 1)
+
+  if warmup > 0:
+    hierarchy.simulate([random_address() for x in range(warmup)])
+    hierarchy.reset_stats()
+  initial_memory = memory.snapshot()
+
+  data['params']['answers_name'] = answers_name
+  data['params']['block_bits'] = block_bits
+  data['params']['addr_bits'] = addr_bits
+  data['params']['show_valid'] = show_valid
+  data['params']['show_dirty'] = show_dirty
+  data['params']['display_base'] = base
+  data['params']['inclusion'] = inclusion
+  data['params']['memory_size'] = mem_size
+  data['params']['block_size'] = block_size
+  data['params']['levels'] = []
+  for n, sim in enumerate(hierarchy.levels):
+    data['params']['levels'].append({
+      'name': names[n],
+      'level': n + 1,
+      'num_ways': sim.ways,
+      'set_bits': sim.set_bits,
+      'replacement_policy': sim.policy.name,
+      'cache_sets': sim.cache_sets,
+      'cache_size': sim.ways * sim.cache_sets * block_size,
+    })
+    ### Initial state of the level. Will be used by pl-cache-table
+    data['params'][names[n]] = sim.stringify_cache(base)
+
+  if address_list == []:
+    address_list = [random_address() for x in range(num_addr)]
+    if store_ratio:
+      ops = ['W' if rng.random() < store_ratio else 'R' for x in range(num_addr)]
+
+  trace = hierarchy.simulate(address_list, ops)
+  hits = trace['hit'].T.tolist()
+  fills = trace['fill'].T.tolist()
+  writebacks = trace['writeback'].T.tolist()
+  stores = trace['store'].tolist()
+  sources = trace['source'].tolist()
+  values = trace['data'].tolist()
+  store_values = trace['value'].tolist()
+  source_names = [f'L{n + 1}' for n in range(len(levels))] + ['Memory']
+  layout = hierarchy.levels[0].layout
+
+  access_table = []
+  for x, addr in enumerate(address_list):
+    access_levels = [
+      {
+        'hit': None if hit == -1 else hit == 1,
+        'fill_bytes': block_size if fill else 0,
+        'writeback_bytes': block_size if writeback else 0,
+      }
+      for hit, fill, writeback in zip(hits[x], fills[x], writebacks[x])
+    ]
+    access_table.append({
+      'address': layout.format_address(int(addr), base),
+      'hit': hits[x][0] == 1,
+      'data': str(values[x]) if values[x] != -1 else None,
+      'writeback': any(writebacks[x]),
+      'store': stores[x],
+      'value': str(store_values[x]) if stores[x] else None,
+      'source': source_names[sources[x]],
+      'fill_bytes': sum(level['fill_bytes'] for level in access_levels),
+      'writeback_bytes': sum(level['writeback_bytes'] for level in access_levels),
+      'levels': access_levels,
+    })
+
+  ### List of memory accesses and their results in every level. Will be used by pl-cache-access-table
+  data['correct_answers'][f'{answers_name}_access'] = access_table
+  for n, sim in enumerate(hierarchy.levels):
+    ### Final state of the level. Will be used by pl-cache-table
+    data['correct_answers'][names[n]] = sim.stringify_cache(base)
+  data['params']['traffic'] = [
+    dict(hierarchy.stats[n], **sim.traffic) for n, sim in enumerate(hierarchy.levels)
+  ]
+  create_mem_table(data, memory, mem_table, initial_memory)
+
+  return
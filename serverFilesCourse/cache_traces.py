@@ -0,0 +1,307 @@
+'''
+Streaming readers for memory traces of real programs, to feed the cache simulator.
+
+Supported formats (TRACE_FORMATS):
+  'din': Dinero III/IV traces, one "label address [size]" per line with a hexadecimal address.
+    Label 0 is a load, 1 a store and 2 an instruction fetch. Other labels are skipped
+  'lackey': the output of valgrind --tool=lackey --trace-mem=yes. 'L' is a load, 'S' a store,
+    'M' (modify) a load followed by a store to the same address, and 'I' an instruction fetch.
+    Lines starting with '==' are skipped
+  'hex': one hexadecimal address per line (with or without 0x), optionally with an 'R' or 'W'
+    before or after it. Blank lines and lines starting with '#' are skipped
+  'bin': the binary packed format written by convert_trace (see BinaryTrace)
+
+Traces are read through a memory-mapped file, line by line, so only the accesses being
+simulated are held in memory, whatever the size of the trace. Every access is an
+(address, op, size) record where op is 'R' (loads and instruction fetches) or 'W' (stores).
+Instruction fetches are only kept with instructions=True.
+
+Text traces have to be parsed up to the window that is read. A trace that is sampled for many
+variants can be converted once with convert_trace into the binary format, where every access
+is a fixed-width record, so any window is read with one seek through numpy.memmap.
+'''
+
+import mmap
+import os
+import struct
+from array import array
+
+import numpy as np
+
+from cache_tables import simulate_trace
+
+TRACE_FORMATS = ('din', 'lackey', 'hex', 'bin')
+
+DIN_OPS = {0: 'R', 1: 'W', 2: 'I'}
+LACKEY_OPS = {b'L': ('R',), b'S': ('W',), b'M': ('R', 'W'), b'I': ('I',)}
+HEX_OPS = {b'R': 'R', b'r': 'R', b'W': 'W', b'w': 'W'}
+
+
+def _parse_din(line):
+  parts = line.split()
+  if parts == []:
+    return ()
+  op = DIN_OPS.get(int(parts[0]))
+  if op is None:
+    return ()
+  size = int(parts[2]) if len(parts) > 2 else 1
+  return ((int(parts[1], 16), op, size),)
+
+def _parse_lackey(line):
+  if line.startswith(b'==') or line.strip() == b'':
+    return ()
+  kind, access = line.split()
+  addr, size = access.split(b',')
+  addr = int(addr, 16)
+  size = int(size)
+  return tuple((addr, op, size) for op in LACKEY_OPS[kind])
+
+def _parse_hex(line):
+  parts = line.split()
+  if parts == [] or parts[0].startswith(b'#'):
+    return ()
+  op = 'R'
+  if len(parts) == 2:
+    if parts[0] in HEX_OPS:
+      op, parts = HEX_OPS[parts[0]], parts[1:]
+    else:
+      op, parts = HEX_OPS[parts[1]], parts[:1]
+  return ((int(parts[0], 16), op, 1),)
+
+PARSERS = {'din': _parse_din, 'lackey': _parse_lackey, 'hex': _parse_hex}
+
+# Binary traces: a header, num_records fixed-width records and, when chunk_records is not 0,
+# one index entry for every chunk of chunk_records records
+BINARY_MAGIC = b'CTRACE01'
+BINARY_HEADER = struct.Struct('<8sHHIQQ')  # magic, version, record size, chunk_records, num_records, index offset
+BINARY_VERSION = 1
+RECORD_DTYPE = np.dtype([('address', '<u8'), ('op', 'u1'), ('size', 'u1')])
+INDEX_DTYPE = np.dtype([('stores', '<u4'), ('min_address', '<u8'), ('max_address', '<u8')])
+OP_CODES = {'R': 0, 'W': 1}
+
+
+class BinaryTrace:
+  '''
+  Trace in the binary packed format, mapped into memory with numpy.memmap.
+
+  records is a read-only structured array with the 'address', 'op' (0 for a load, 1 for a
+  store) and 'size' of every access, backed by the file, so slicing it copies nothing.
+  When the trace was converted with an index, index has one entry per chunk of
+  chunk_records accesses with its number of 'stores' and its 'min_address' and
+  'max_address', so windows can be chosen without reading the records (see find_chunks).
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as f:
+      header = f.read(BINARY_HEADER.size)
+    if len(header) < BINARY_HEADER.size:
+      raise ValueError(
+          f'{path} is not a binary trace'
+      )
+    magic, version, record_size, self.chunk_records, num_records, index_offset = BINARY_HEADER.unpack(header)
+    if magic != BINARY_MAGIC or record_size != RECORD_DTYPE.itemsize:
+      raise ValueError(
+          f'{path} is not a binary trace'
+      )
+    if version != BINARY_VERSION:
+      raise ValueError(
+          f'{path} has version {version} of the binary trace format, not {BINARY_VERSION}'
+      )
+    if num_records == 0:
+      self.records = np.zeros(0, dtype=RECORD_DTYPE)
+    else:
+      self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=BINARY_HEADER.size,
+                               shape=(num_records,))
+    self.index = None
+    if self.chunk_records != 0 and num_records != 0:
+      num_chunks = -(-num_records // self.chunk_records)
+      self.index = np.memmap(path, dtype=INDEX_DTYPE, mode='r', offset=index_offset, shape=(num_chunks,))
+
+  def __len__(self):
+    return len(self.records)
+
+  def window(self, skip=0, take=None, addr_bits=None):
+    ### Returns take accesses (all the remaining ones when take is None) after the first skip ones
+    ### as a uint64 address array and an array of 'R'/'W' ops. Without addr_bits, the addresses
+    ### are a view of the file
+    end = len(self.records) if take is None else min(skip + take, len(self.records))
+    records = self.records[skip:end]
+    addresses = records['address']
+    if addr_bits is not None:
+      addresses = addresses & np.uint64(2**addr_bits - 1)
+    return addresses, np.where(records['op'] == OP_CODES['W'], 'W', 'R')
+
+  def record_chunks(self, chunk_size=65536, skip=0, take=None):
+    ### Yields the records of the window of skip and take in slices of at most chunk_size records
+    end = len(self.records) if take is None else min(skip + take, len(self.records))
+    for start in range(skip, end, chunk_size):
+      yield self.records[start:min(start + chunk_size, end)]
+
+  def chunks(self, chunk_size=65536, skip=0, take=None, addr_bits=None):
+    ### Yields the window of skip and take as (addresses, ops) chunks of at most chunk_size accesses
+    for records in self.record_chunks(chunk_size, skip, take):
+      addresses = records['address']
+      if addr_bits is not None:
+        addresses = addresses & np.uint64(2**addr_bits - 1)
+      yield addresses, np.where(records['op'] == OP_CODES['W'], 'W', 'R')
+
+  def find_chunks(self, min_stores=0, min_address=None, max_address=None):
+    ### Numbers of the index chunks with at least min_stores stores whose addresses all lie within
+    ### [min_address, max_address]. Chunk c holds the records from c * chunk_records on
+    if self.index is None:
+      raise ValueError(
+          f'{self.path} was converted without an index'
+      )
+    keep = self.index['stores'] >= min_stores
+    if min_address is not None:
+      keep &= self.index['min_address'] >= min_address
+    if max_address is not None:
+      keep &= self.index['max_address'] <= max_address
+    return np.flatnonzero(keep).tolist()
+
+
+def convert_trace(path, fmt, output, chunk_records=65536, index=True, instructions=False):
+  '''
+  Converts the text trace at path (in one of the text TRACE_FORMATS) into a binary trace at output.
+
+  The trace is streamed, chunk_records accesses at a time, so it is never held in memory.
+  With index, an index entry is written for every chunk of chunk_records accesses (see
+  BinaryTrace). instructions is the same as for trace_records. Returns the number of accesses.
+  '''
+  if fmt == 'bin':
+    raise ValueError(
+        f'{path} is already a binary trace'
+    )
+  if chunk_records <= 0:
+    raise ValueError(
+        f'chunk_records must be positive'
+    )
+  num_records = 0
+  entries = []
+  chunk = np.zeros(chunk_records, dtype=RECORD_DTYPE)
+  with open(f'{output}.tmp', 'wb') as f:
+    f.write(bytes(BINARY_HEADER.size))
+
+    def flush(count):
+      records = chunk[:count]
+      f.write(records.tobytes())
+      addresses = records['address']
+      entries.append((int(np.count_nonzero(records['op'] == OP_CODES['W'])), addresses.min(), addresses.max()))
+
+    position = 0
+    for addr, op, size in trace_records(path, fmt, instructions=instructions):
+      chunk[position] = (addr, OP_CODES[op], min(size, 255))
+      position += 1
+      if position == chunk_records:
+        flush(position)
+        num_records += position
+        position = 0
+    if position > 0:
+      flush(position)
+      num_records += position
+
+    index_offset = BINARY_HEADER.size + num_records * RECORD_DTYPE.itemsize
+    if index:
+      f.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+    f.seek(0)
+    f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, RECORD_DTYPE.itemsize,
+                               chunk_records if index else 0, num_records, index_offset if index else 0))
+  os.replace(f'{output}.tmp', output)
+  return num_records
+
+
+def trace_records(path, fmt, skip=0, take=None, instructions=False):
+  '''
+  Yields the (address, op, size) records of the trace at path, in order.
+
+  fmt is one of TRACE_FORMATS. skip and take select a window of the trace: the first skip
+  accesses are dropped and at most take accesses are read (all of the remaining ones when
+  take is None), so a window is read without parsing the rest of the file. Instruction
+  fetches are dropped unless instructions is True, and then count as loads ('R').
+  Raises a ValueError naming the line that cannot be parsed.
+  '''
+  if fmt not in TRACE_FORMATS:
+    raise ValueError(
+        f'fmt must be one of {", ".join(TRACE_FORMATS)}'
+    )
+  if take is not None and take <= 0:
+    return
+  if fmt == 'bin':
+    for records in BinaryTrace(path).record_chunks(skip=skip, take=take):
+      for addr, op, size in zip(records['address'].tolist(), records['op'].tolist(), records['size'].tolist()):
+        yield addr, 'W' if op == OP_CODES['W'] else 'R', size
+    return
+  parse = PARSERS[fmt]
+  position = 0
+  end = None if take is None else skip + take
+  with open(path, 'rb') as f:
+    if f.seek(0, 2) == 0:
+      return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as trace:
+      for number, line in enumerate(iter(trace.readline, b''), start=1):
+        try:
+          records = parse(line)
+        except (ValueError, KeyError, IndexError):
+          raise ValueError(
+              f'{path}:{number}: cannot read {line.strip()!r} as a {fmt} access'
+          ) from None
+        for addr, op, size in records:
+          if op == 'I':
+            if not instructions:
+              continue
+            op = 'R'
+          if position >= skip:
+            yield addr, op, size
+          position += 1
+          if position == end:
+            return
+
+
+def trace_chunks(path, fmt, chunk_size=65536, skip=0, take=None, addr_bits=None, instructions=False):
+  '''
+  Yields the trace at path as (addresses, ops) chunks of at most chunk_size accesses.
+
+  addresses is a NumPy uint64 array and ops holds the 'R'/'W' of every access, as taken by
+  simulate_trace and generate_cache. The chunks of a 'bin' trace are views of the file. With addr_bits, only the low addr_bits bits of every address are kept,
+  so a 64-bit program trace fits the data memory of a question. skip, take and instructions
+  are the same as for trace_records.
+  '''
+  if fmt == 'bin':
+    yield from BinaryTrace(path).chunks(chunk_size, skip, take, addr_bits)
+    return
+  mask = None if addr_bits is None else 2**addr_bits - 1
+  addresses = array('Q')
+  ops = []
+  for addr, op, size in trace_records(path, fmt, skip, take, instructions):
+    addresses.append(addr if mask is None else addr & mask)
+    ops.append(op)
+    if len(ops) == chunk_size:
+      yield np.frombuffer(addresses, dtype=np.uint64), ops
+      addresses = array('Q')
+      ops = []
+  if ops != []:
+    yield np.frombuffer(addresses, dtype=np.uint64), ops
+
+
+def trace_window(path, fmt, skip=0, take=16, addr_bits=None, instructions=False):
+  ### Reads take accesses of the trace after the first skip ones (all the remaining ones when take
+  ### is None), as the address_list and ops of generate_cache. See trace_chunks for addr_bits and instructions
+  address_list = []
+  ops = []
+  for addresses, chunk_ops in trace_chunks(path, fmt, take or 65536, skip, take, addr_bits, instructions):
+    address_list.extend(addresses.tolist())
+    ops.extend(chunk_ops.tolist() if isinstance(chunk_ops, np.ndarray) else chunk_ops)
+  return address_list, ops
+
+
+def simulate_trace_file(sim, path, fmt, chunk_size=65536, skip=0, take=None, instructions=False):
+  '''
+  Streams the trace at path through sim, one chunk of at most chunk_size accesses at a time.
+
+  Yields the result of simulate_trace for every chunk. The state of sim carries over from
+  one chunk to the next, so the chunks together simulate the whole window of the trace.
+  Addresses are cut to sim.addr_bits bits (see trace_chunks).
+  '''
+  for addresses, ops in trace_chunks(path, fmt, chunk_size, skip, take, sim.addr_bits, instructions):
+    yield simulate_trace(sim, addresses, ops)
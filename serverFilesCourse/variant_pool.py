@@ -0,0 +1,240 @@
+'''
+Pre-generated variant pools for the cache questions.
+
+Generating a variant simulates the whole cache, which adds up when hundreds of students open
+the same question at once. This script generates the variants of a question ahead of time,
+in parallel, and writes them to one indexed pool file per question:
+
+  python serverFilesCourse/variant_pool.py get_data writeback lru3_data_4 load_blocks_6 --count 1000
+
+A question's server.py then reads its variant from the pool with load_variant, and falls back
+to generating it when there is no usable pool:
+
+  def generate(data):
+    if load_variant(data, 'get_data', __file__):
+      return data
+    ...
+
+A pool file starts with a header: MAGIC, the VariantCache.VERSION of the generators that wrote
+it, the number of variants kept, the SHA-256 of the question's server.py, and the range of
+seeds that was generated. A pool is stale, and ignored, when the version or the hash of
+server.py no longer match. The header is followed by a seed table with the entry of every
+generated seed (-1 for the rejected ones), the (seed, offset, size) entry of every kept
+variant, and the variants themselves as zlib-compressed JSON.
+
+A seed of the generated range that was kept gets exactly the variant PrairieLearn would generate
+for it. Every other seed gets the kept variant number seed % count. Either way a lookup reads one
+seed table entry, one variant entry and one variant, whatever the size of the pool.
+
+When a question's server.py defines keep_variant(data), the variants it rejects are left out
+of the pool, so the pool can be filtered for quality offline.
+'''
+
+import argparse
+import functools
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import zlib
+
+from cache_tables import VariantCache
+
+MAGIC = b'CVPOOL02'
+HEADER = struct.Struct('<8sII32sqI')  # magic, version, count, server.py hash, first seed, number of seeds
+SEED_SLOT = struct.Struct('<i')
+ENTRY = struct.Struct('<qQI')  # seed, offset, size
+
+SERVER_FILES_DIR = os.path.dirname(os.path.abspath(__file__))
+POOL_DIR = os.path.join(SERVER_FILES_DIR, 'variant_pools')
+QUESTIONS_DIR = os.path.join(os.path.dirname(SERVER_FILES_DIR), 'questions')
+
+
+class VariantPool:
+  '''
+  Read-only view of a pool file written by write_pool.
+
+  The header is checked when the pool is opened: a pool written by generators of another
+  VariantCache.VERSION, or from a server.py whose SHA-256 is not server_hash, is stale and
+  raises a ValueError. get reads a single variant.
+  '''
+
+  def __init__(self, path, server_hash=None):
+    self.path = path
+    with open(path, 'rb') as f:
+      header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+      raise ValueError(
+          f'{path} is not a variant pool'
+      )
+    magic, version, self.count, self.server_hash, self.first_seed, self.num_seeds = HEADER.unpack(header)
+    if version != VariantCache.VERSION:
+      raise ValueError(
+          f'{path} was generated for version {version} of the generators, not {VariantCache.VERSION}'
+      )
+    if server_hash is not None and self.server_hash != server_hash:
+      raise ValueError(
+          f'{path} was generated from another version of the question\'s server.py'
+      )
+    if self.count == 0:
+      raise ValueError(
+          f'{path} holds no variants'
+      )
+    self._entries_offset = HEADER.size + self.num_seeds * SEED_SLOT.size
+
+  def get(self, seed):
+    ### Returns the variant for seed as a dictionary with 'seed' (the seed it was generated from),
+    ### 'params' and 'correct_answers'
+    with open(self.path, 'rb') as f:
+      slot = -1
+      if 0 <= seed - self.first_seed < self.num_seeds:
+        f.seek(HEADER.size + (seed - self.first_seed) * SEED_SLOT.size)
+        slot, = SEED_SLOT.unpack(f.read(SEED_SLOT.size))
+      if slot < 0:
+        slot = seed % self.count
+      f.seek(self._entries_offset + slot * ENTRY.size)
+      _, offset, size = ENTRY.unpack(f.read(ENTRY.size))
+      f.seek(offset)
+      return json.loads(zlib.decompress(f.read(size)))
+
+  def __len__(self):
+    return self.count
+
+
+def pool_path(question):
+  ### Path of the pool file of question
+  return os.path.join(POOL_DIR, f'{question}.pool')
+
+
+@functools.lru_cache(maxsize=64)
+def server_hash(server_path, mtime=None):
+  ### SHA-256 of a question's server.py (mtime only keys the cache, so an edited file is hashed again)
+  with open(server_path, 'rb') as f:
+    return hashlib.sha256(f.read()).digest()
+
+
+@functools.lru_cache(maxsize=64)
+def _open_pool(path, mtime, expected_hash):
+  ### Opens a pool once per version of the file (mtime changes when the pool is rebuilt)
+  try:
+    return VariantPool(path, expected_hash)
+  except ValueError:
+    return None
+
+
+def load_variant(data, question, server_path=None, path=None):
+  ### Copies the variant for data['variant_seed'] from the pool of question into data.
+  ### server_path is the question's server.py (its __file__), whose hash must match the pool's.
+  ### Returns False, leaving data unchanged, when there is no usable pool or no variant seed
+  if os.environ.get('VARIANT_POOL') == 'off' or 'variant_seed' not in data:
+    return False
+  path = path or pool_path(question)
+  server_path = server_path or os.path.join(QUESTIONS_DIR, question, 'server.py')
+  try:
+    mtime = os.stat(path).st_mtime_ns
+    expected_hash = server_hash(server_path, os.stat(server_path).st_mtime_ns)
+  except FileNotFoundError:
+    return False
+  pool = _open_pool(path, mtime, expected_hash)
+  if pool is None:
+    return False
+  variant = pool.get(int(data['variant_seed']))
+  data['params'].update(variant['params'])
+  data['correct_answers'].update(variant['correct_answers'])
+  return True
+
+
+def write_pool(path, first_seed, variants, server_digest):
+  ### Writes a pool file at path. variants holds the encoded variant (zlib-compressed JSON) of every
+  ### seed from first_seed on, or None for the seeds that were rejected. server_digest is the
+  ### server_hash of the question's server.py
+  slots = []
+  kept = []
+  for n, variant in enumerate(variants):
+    if variant is None:
+      slots.append(SEED_SLOT.pack(-1))
+    else:
+      slots.append(SEED_SLOT.pack(len(kept)))
+      kept.append((first_seed + n, variant))
+  offset = HEADER.size + len(variants) * SEED_SLOT.size + len(kept) * ENTRY.size
+  entries = []
+  for seed, variant in kept:
+    entries.append(ENTRY.pack(seed, offset, len(variant)))
+    offset += len(variant)
+  os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+  with open(f'{path}.{os.getpid()}.tmp', 'wb') as f:
+    f.write(HEADER.pack(MAGIC, VariantCache.VERSION, len(kept), server_digest, first_seed, len(variants)))
+    f.write(b''.join(slots))
+    f.write(b''.join(entries))
+    for seed, variant in kept:
+      f.write(variant)
+  os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+
+@functools.lru_cache(maxsize=None)
+def _question_module(server_path):
+  ### Imports a question's server.py once per worker process
+  spec = importlib.util.spec_from_file_location(f'server_{abs(hash(server_path))}', server_path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def generate_variant(server_path, seed):
+  ### Generates the variant of seed as PrairieLearn does (random seeded with the variant seed).
+  ### Returns it encoded for write_pool, or None when the question's keep_variant rejects it
+  module = _question_module(server_path)
+  random.seed(seed)
+  data = {'params': {}, 'correct_answers': {}, 'variant_seed': seed, 'options': {}}
+  module.generate(data)
+  keep_variant = getattr(module, 'keep_variant', None)
+  if keep_variant is not None and not keep_variant(data):
+    return None
+  variant = {'seed': seed, 'params': data['params'], 'correct_answers': data['correct_answers']}
+  text = json.dumps(variant, separators=(',', ':'))
+  return zlib.compress(text.encode('utf-8'), 9)
+
+
+def build_pool(question, count, first_seed=0, processes=None, questions_dir=QUESTIONS_DIR, path=None):
+  ### Generates the variants of seeds first_seed .. first_seed + count - 1 of question in a process
+  ### pool and writes the ones that were kept to its pool file. Returns the number of variants kept
+  server_path = os.path.join(questions_dir, question, 'server.py')
+  if not os.path.exists(server_path):
+    raise ValueError(
+        f'{question} has no server.py in {questions_dir}'
+    )
+  seeds = range(first_seed, first_seed + count)
+  with multiprocessing.Pool(processes) as workers:
+    encoded = workers.map(functools.partial(generate_variant, server_path), seeds,
+                          chunksize=max(1, count // (4 * (processes or os.cpu_count() or 1))))
+  kept = len(encoded) - encoded.count(None)
+  if kept == 0:
+    raise ValueError(
+        f'keep_variant of {question} rejected every variant'
+    )
+  write_pool(path or pool_path(question), first_seed, encoded, server_hash(server_path))
+  return kept
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Pre-generates the variants of cache questions into pool files.')
+  parser.add_argument('questions', nargs='+', help='question directories to pre-generate')
+  parser.add_argument('--count', type=int, default=1000, help='number of seeds to generate per question')
+  parser.add_argument('--first-seed', type=int, default=0, help='first variant seed')
+  parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+  parser.add_argument('--questions-dir', default=QUESTIONS_DIR, help='folder holding the questions')
+  args = parser.parse_args()
+
+  # the questions must generate their variants, not read them from an older pool
+  os.environ['VARIANT_POOL'] = 'off'
+  for question in args.questions:
+    kept = build_pool(question, args.count, args.first_seed, args.processes, args.questions_dir)
+    print(f'{question}: {kept} of {args.count} variants written to {pool_path(question)}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+  main()